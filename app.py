@@ -1,19 +1,35 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Request, Response, render_template, request, jsonify
 import os
-from etisalat_invoice import process_single_invoice
+import io
+from etisalat_invoice import extract_invoice_data, store_invoice
 import time
 from datetime import datetime
 from werkzeug.utils import secure_filename
-import logging
-import traceback
-from logging.handlers import RotatingFileHandler
 import shutil
-from etisalat_invoice import  get_mysql_connection, get_mongodb_client
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from etisalat_invoice import  get_mysql_connection, release_connection, get_pool_stats, get_extraction_stats
 from dotenv import load_dotenv
 from uuid import uuid4
 import hashlib
+from extraction_cache import ExtractionCache, save_stream_with_hash, sha256_file
+from job_queue import JobQueue
+from invoice_streaming import process_invoice_streaming, should_stream
+from mongo_outbox import OUTBOX_ENABLED, replication_status, start_relay
+from invoice_verification import verify_invoices, verify_with_retry
+from usage_rollups import ROLLUPS_ENABLED, TTLCache, TOP_NUMBER_ORDER, spend_by_category, top_numbers
+import metrics
+from structured_logging import log_context, setup_logging
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Werkzeug spools uploads over 500KB to a temp file; keep them in memory instead
+        if app.config['IN_MEMORY_UPLOADS']:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = os.getenv('SECRET_KEY') 
 
 # Configuration
@@ -23,20 +39,42 @@ ALLOWED_EXTENSIONS = {'pdf'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB per file
+app.config['MAX_FILE_SIZE'] = app.config['MAX_CONTENT_LENGTH']
+app.config['BATCH_MAX_CONTENT_LENGTH'] = int(os.getenv('BATCH_MAX_MB', '200')) * 1024 * 1024
+app.config['BATCH_WORKERS'] = int(os.getenv('BATCH_WORKERS', '4'))
+# store_invoice only reports success after an acknowledged MySQL commit and
+# journaled MongoDB write, so re-reading both stores is opt-in
+app.config['VERIFY_WRITES'] = os.getenv('VERIFY_WRITES', 'false').lower() == 'true'
+app.config['EXTRACTION_CACHE_DIR'] = os.getenv('EXTRACTION_CACHE_DIR', os.path.join(UPLOAD_FOLDER, 'cache'))
+app.config['EXTRACTION_CACHE_MAX_BYTES'] = int(os.getenv('EXTRACTION_CACHE_MAX_MB', '256')) * 1024 * 1024
+app.config['ASYNC_PROCESSING'] = os.getenv('ASYNC_PROCESSING', 'false').lower() == 'true'
+app.config['JOB_QUEUE_DB'] = os.getenv('JOB_QUEUE_DB', os.path.join(UPLOAD_FOLDER, 'jobs.sqlite3'))
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', '2'))
+app.config['JOB_WORKER_MODE'] = os.getenv('JOB_WORKER_MODE', 'thread')
+# A job whose worker died this many times (e.g. killed by the OOM killer) is failed, not retried
+app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Parse uploads straight from memory and write each PDF to disk once, in the
+# background, instead of temp file -> re-read -> move
+app.config['IN_MEMORY_UPLOADS'] = os.getenv('IN_MEMORY_UPLOADS', 'false').lower() == 'true'
+app.config['PERSIST_WORKERS'] = int(os.getenv('PERSIST_WORKERS', '2'))
+app.config['ANALYTICS_CACHE_SECONDS'] = float(os.getenv('ANALYTICS_CACHE_SECONDS', '60'))
 
-# Configure error logging
-handler = RotatingFileHandler('processing_errors.log', maxBytes=100000, backupCount=3)
-handler.setFormatter(logging.Formatter(
-    '%(asctime)s [%(levelname)s] %(message)s - [%(filename)s:%(lineno)d]'
-))
-app.logger.addHandler(handler)
-logging.getLogger().setLevel(logging.ERROR)
+# JSON error log (LOG_FILE, default processing_errors.log), written off the request path
+setup_logging()
 
 # Ensure folders exist
 for folder in [UPLOAD_FOLDER, PROCESSED_FOLDER]:
     if not os.path.exists(folder):
         os.makedirs(folder)
 
+extraction_cache = ExtractionCache(
+    app.config['EXTRACTION_CACHE_DIR'],
+    app.config['EXTRACTION_CACHE_MAX_BYTES']
+)
+analytics_cache = TTLCache(app.config['ANALYTICS_CACHE_SECONDS'])
+persist_executor = ThreadPoolExecutor(max_workers=app.config['PERSIST_WORKERS'],
+                                      thread_name_prefix='persist')
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -56,6 +94,42 @@ def move_to_processed(filepath):
 def index():
     return render_template('index.html')
 
+def unique_upload_name(original_filename):
+    """Stored name for an upload, unique so nothing is overwritten"""
+    unique_suffix = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')  # e.g., 20250415153045678900
+    return f"{original_filename}_{unique_suffix}_{uuid4().hex[:8]}"
+
+def save_upload(file):
+    """Save an uploaded PDF under a unique temp name. Returns (filename, filepath, content_hash)."""
+    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
+    os.makedirs(temp_dir, exist_ok=True)
+
+    original_filename = secure_filename(file.filename)
+    filename_with_uid = unique_upload_name(original_filename)
+    filepath = os.path.join(temp_dir, filename_with_uid)
+
+    content_hash = save_stream_with_hash(file.stream, filepath)
+    app.logger.info(f"File uploaded successfully: {original_filename} (Saved as: {filename_with_uid})")
+    return original_filename, filepath, content_hash
+
+def read_upload(file):
+    """Read an uploaded PDF into memory. Returns (filename, data, content_hash)."""
+    data = file.stream.getvalue() if hasattr(file.stream, 'getvalue') else file.stream.read()
+    return secure_filename(file.filename), data, hashlib.sha256(data).hexdigest()
+
+def persist_upload(folder, stored_name, data):
+    """Write an in-memory upload to folder in the background (the only disk write)"""
+    def write():
+        try:
+            os.makedirs(folder, exist_ok=True)
+            dest_path = os.path.join(folder, stored_name)
+            with open(f"{dest_path}.part", 'wb') as out:
+                out.write(data)
+            os.replace(f"{dest_path}.part", dest_path)
+        except Exception as e:
+            app.logger.error(f"File persist error: {str(e)} | File: {stored_name}")
+    return persist_executor.submit(write)
+
 @app.route('/upload', methods=['POST'])
 def upload_invoice():
     """Handle file upload"""
@@ -73,27 +147,13 @@ def upload_invoice():
             app.logger.error(f"Invalid file type attempt: {file.filename}")
             return jsonify({'success': False}), 400
 
-        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        '''      
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(temp_dir, filename)
-        '''
-
-        original_filename = secure_filename(file.filename)
-        # Create unique filename to avoid overwriting
-        unique_suffix = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')  # e.g., 20250415153045678900
-        filename_with_uid = f"{original_filename}_{unique_suffix}"
-        filepath = os.path.join(temp_dir, filename_with_uid)
-        
-        file.save(filepath)
-        app.logger.info(f"File uploaded successfully: {original_filename} (Saved as: {filename_with_uid})")
+        original_filename, filepath, content_hash = save_upload(file)
         
         return jsonify({
             'success': True,
             'filename': original_filename,  # used for DB and UI
-            'filepath': filepath            # used internally for processing
+            'filepath': filepath,           # used internally for processing
+            'content_hash': content_hash    # extraction cache key
         })
 
     except Exception as e:
@@ -110,44 +170,309 @@ def process_single():
     if not filename or not filepath:
         app.logger.error("Process request missing filename/filepath")
         return jsonify({'success': False}), 400
-    
-    try:
+
+    if data.get('async', app.config['ASYNC_PROCESSING']):
         if not os.path.exists(filepath):
             app.logger.error(f"File not found: {filename} | Path: {filepath}")
             return jsonify({'success': False}), 404
+        job_id = job_queue.enqueue({
+            'filename': filename,
+            'filepath': filepath,
+            'content_hash': data.get('content_hash')
+        })
+        return jsonify({'success': True, 'job_id': job_id, 'status_url': f"/jobs/{job_id}"}), 202
+
+    body, status = handle_invoice(filename, filepath, data.get('content_hash'))
+    return jsonify(body), status
+
+@app.route('/process_upload', methods=['POST'])
+def process_upload():
+    """Upload and process one PDF in a single request, parsed from memory"""
+    file = request.files.get('file')
+    if not file or not file.filename or not allowed_file(file.filename):
+        app.logger.error(f"Invalid file type attempt: {file.filename if file else 'none'}")
+        return jsonify({'success': False}), 400
+
+    filename, data, content_hash = read_upload(file)
+    body, status = handle_invoice_in_memory(filename, data, content_hash)
+    return jsonify(body), status
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    """
+    Accept many PDFs in one multipart request ('files' fields), process them
+    concurrently and stream one JSON line per file as each finishes, followed
+    by a summary line.
+    """
+    request.max_content_length = app.config['BATCH_MAX_CONTENT_LENGTH']
+    files = request.files.getlist('files')
+    if not files:
+        app.logger.error("Batch request with no files")
+        return jsonify({'success': False}), 400
+
+    accepted = []
+    rejected = []
+    for index, file in enumerate(files):
+        if not file.filename or not allowed_file(file.filename):
+            app.logger.error(f"Invalid file type attempt: {file.filename}")
+            rejected.append({'index': index, 'filename': file.filename, 'success': False,
+                             'stage': 'upload', 'error': 'Invalid file'})
+            continue
+        try:
+            if app.config['IN_MEMORY_UPLOADS']:
+                filename, source, content_hash = read_upload(file)
+                size = len(source)
+            else:
+                filename, source, content_hash = save_upload(file)
+                size = os.path.getsize(source)
+        except Exception as e:
+            app.logger.error(f"Upload error: {str(e)} | File: {file.filename}")
+            rejected.append({'index': index, 'filename': file.filename, 'success': False,
+                             'stage': 'upload', 'error': 'Upload failed'})
+            continue
+        if size > app.config['MAX_FILE_SIZE']:
+            if not app.config['IN_MEMORY_UPLOADS']:
+                os.remove(source)
+            rejected.append({'index': index, 'filename': filename, 'success': False,
+                             'stage': 'upload', 'error': 'File too large'})
+            continue
+        accepted.append((index, filename, source, content_hash))
+
+    def generate():
+        processed = 0
+        failed = len(rejected)
+        for line in rejected:
+            yield json.dumps(line) + "\n"
+
+        verify = app.config['VERIFY_WRITES']
+        group_size = max(app.config['BATCH_WORKERS'], 1)
+        finished = []
+
+        def flush():
+            # One verification query per store for the whole group
+            written = [(index, filename, body) for index, filename, body, status in finished
+                       if status == 200 and not body.get('already_processed')]
+            results = {}
+            if verify and written:
+                with metrics.timed("verification"):
+                    results = verify_with_retry([filename for _, filename, _ in written],
+                                                check_mongodb=not OUTBOX_ENABLED)
+            for index, filename, body, status in finished:
+                if filename in results and not results[filename]['verified']:
+                    app.logger.warning(f"Delayed verification for: {filename}")
+                    body, status = {'success': False}, 202
+                yield index, filename, body, status
+            finished.clear()
+
+        handler = handle_invoice_in_memory if app.config['IN_MEMORY_UPLOADS'] else handle_invoice
+        executor = ThreadPoolExecutor(max_workers=app.config['BATCH_WORKERS'])
+        try:
+            futures = {
+                executor.submit(handler, filename, source, content_hash, False): (index, filename)
+                for index, filename, source, content_hash in accepted
+            }
+            remaining = len(futures)
+            for future in as_completed(futures):
+                index, filename = futures[future]
+                remaining -= 1
+                try:
+                    body, status = future.result()
+                except Exception as e:
+                    app.logger.error(f"Batch processing error: {str(e)} | File: {filename}")
+                    body, status = {'success': False}, 500
+                finished.append((index, filename, body, status))
+                if verify and len(finished) < group_size and remaining:
+                    continue
+
+                for index, filename, body, status in flush():
+                    if body.get('success'):
+                        processed += 1
+                    else:
+                        failed += 1
+                    yield json.dumps(dict(body, index=index, filename=filename,
+                                          stage='processing', http_status=status)) + "\n"
+        finally:
+            # Client went away or we finished: drop anything not yet started
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        yield json.dumps({'done': True, 'total': len(files),
+                          'processed': processed, 'failed': failed}) + "\n"
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Report queued/running/done/failed for a background processing job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': job})
+
+def run_invoice_job(payload):
+    """Job queue handler: process one uploaded invoice outside the request"""
+    body, status = handle_invoice(payload['filename'], payload['filepath'], payload.get('content_hash'))
+    return dict(body, http_status=status)
+
+# Workers start in start_background_services, i.e. inside the gunicorn worker process
+job_queue = JobQueue(
+    app.config['JOB_QUEUE_DB'],
+    run_invoice_job,
+    workers=app.config['JOB_WORKERS'],
+    mode=app.config['JOB_WORKER_MODE'],
+    max_attempts=app.config['JOB_MAX_ATTEMPTS']
+)
+
+def start_background_services():
+    """
+    Per-process background threads. Under gunicorn with preload_app the master
+    must not start threads before forking, so gunicorn.conf.py calls this from
+    post_fork instead of it running at import.
+    """
+    # Run jobs left queued (or orphaned) by an earlier run without waiting for a new upload
+    try:
+        job_queue.start()
+    except Exception as e:
+        app.logger.error(f"Job queue workers not started: {str(e)}")
+    if OUTBOX_ENABLED:
+        # Pick up rows left pending by an earlier run
+        try:
+            start_relay()
+        except Exception as e:
+            app.logger.error(f"Outbox relay not started: {str(e)}")
+
+if os.getenv('APP_PRELOAD', 'false').lower() != 'true':
+    start_background_services()
+
+def handle_invoice(filename, filepath, content_hash=None, verify=None):
+    """
+    Process an uploaded invoice and, if verify (default VERIFY_WRITES), check
+    it landed in both databases. Returns (response body, HTTP status).
+    """
+    with log_context(file=filename, hash=content_hash):
+        return _handle_invoice(filename, filepath, content_hash, verify)
+
+def _handle_invoice(filename, filepath, content_hash, verify):
+    try:
+        if not os.path.exists(filepath):
+            app.logger.error(f"File not found: {filename} | Path: {filepath}")
+            return {'success': False}, 404
         
         start_time = time.time()
+        content_hash = content_hash or sha256_file(filepath)
+        cached = extraction_cache.get(content_hash)
+        if cached and cached.get('processed'):
+            os.remove(filepath)
+            app.logger.info(f"Already processed, skipping: {filename} ({content_hash})")
+            return {'success': True, 'already_processed': True}, 200
+
         try:
-            success = process_single_invoice(filepath, start_time)
+            success = process_with_cache(filepath, filename, content_hash, cached, start_time)
         except Exception as e:
-            app.logger.error(f"Processing failed: {str(e)} | Trace: {traceback.format_exc()}")
-            return jsonify({'success': False}), 500
+            app.logger.error(f"Processing failed: {str(e)}", exc_info=True)
+            return {'success': False}, 500
         
         if success:
-            verified = False
-            for _ in range(3):
-                mysql_ok = verify_mysql_entry(filename)
-                mongo_ok = verify_mongodb_entry(filename)
-                
-                if mysql_ok and mongo_ok:
-                    verified = True
-                    move_to_processed(filepath)
-                    app.logger.info(f"Successfully processed: {filename}")
-                    break
-                time.sleep(0.5)
-
-            if verified:
-                return jsonify({'success': True})
-            
-            app.logger.warning(f"Delayed verification for: {filename}")
-            return jsonify({'success': False}), 202
+            extraction_cache.mark_processed(content_hash)
+            if not verify_stored(filename, verify):
+                return {'success': False}, 202
 
-        app.logger.error(f"Processing failed for: {filename}")
-        return jsonify({'success': False}), 500
+            move_to_processed(filepath)
+            app.logger.info(f"Successfully processed: {filename}",
+                            extra={"duration": round(time.time() - start_time, 3)})
+            return {'success': True}, 200
+
+        app.logger.error(f"Processing failed for: {filename}",
+                         extra={"duration": round(time.time() - start_time, 3)})
+        return {'success': False}, 500
         
     except Exception as e:
         app.logger.error(f"Processing error: {str(e)} | File: {filename}")
-        return jsonify({'success': False}), 500
+        return {'success': False}, 500
+
+def handle_invoice_in_memory(filename, data, content_hash=None, verify=None):
+    """
+    handle_invoice for an upload held in memory: parse the bytes directly, then
+    write them once, in the background, to the processed folder (or to the
+    temp folder if processing failed, as a disk upload would have been left).
+    """
+    with log_context(file=filename, hash=content_hash):
+        return _handle_invoice_in_memory(filename, data, content_hash, verify)
+
+def _handle_invoice_in_memory(filename, data, content_hash, verify):
+    stored_name = unique_upload_name(filename)
+    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
+    try:
+        start_time = time.time()
+        content_hash = content_hash or hashlib.sha256(data).hexdigest()
+        cached = extraction_cache.get(content_hash)
+        if cached and cached.get('processed'):
+            app.logger.info(f"Already processed, skipping: {filename} ({content_hash})")
+            return {'success': True, 'already_processed': True}, 200
+
+        try:
+            success = process_with_cache(io.BytesIO(data), filename, content_hash, cached, start_time)
+        except Exception as e:
+            app.logger.error(f"Processing failed: {str(e)}", exc_info=True)
+            persist_upload(temp_dir, stored_name, data)
+            return {'success': False}, 500
+
+        if success:
+            extraction_cache.mark_processed(content_hash)
+            if not verify_stored(filename, verify):
+                persist_upload(temp_dir, stored_name, data)
+                return {'success': False}, 202
+
+            persist_upload(app.config['PROCESSED_FOLDER'], stored_name, data)
+            app.logger.info(f"Successfully processed: {filename}",
+                            extra={"duration": round(time.time() - start_time, 3)})
+            return {'success': True}, 200
+
+        app.logger.error(f"Processing failed for: {filename}",
+                         extra={"duration": round(time.time() - start_time, 3)})
+        persist_upload(temp_dir, stored_name, data)
+        return {'success': False}, 500
+
+    except Exception as e:
+        app.logger.error(f"Processing error: {str(e)} | File: {filename}")
+        return {'success': False}, 500
+
+def verify_stored(filename, verify=None):
+    """If verify (default VERIFY_WRITES), check the invoice landed in both databases"""
+    if verify is None:
+        verify = app.config['VERIFY_WRITES']
+    if not verify:
+        return True
+    with metrics.timed("verification"):
+        # With the outbox the MongoDB copy follows asynchronously
+        result = verify_with_retry([filename], check_mongodb=not OUTBOX_ENABLED)[filename]
+    if not result['verified']:
+        app.logger.warning(f"Delayed verification for: {filename}")
+    return result['verified']
+
+def process_with_cache(source, filename, content_hash, cached, start_time):
+    """
+    Parse the PDF (or reuse a cached parse of identical bytes) and write it to
+    both databases. source is a path or an in-memory buffer. Returns True only
+    if both writes succeed.
+    """
+    with log_context(file=filename, hash=content_hash), \
+            metrics.profile_if_slow(filename), metrics.timed("invoice_total"):
+        if cached:
+            extracted_data = cached['data']
+            app.logger.info(f"Reusing cached extraction for {filename} ({content_hash})")
+        elif should_stream(source):
+            return process_invoice_streaming(source, start_time, pdf_name=filename)
+        else:
+            extracted_data = extract_invoice_data(source, pdf_name=filename)
+            if not extracted_data:
+                app.logger.error(f"Data extraction failed for {filename}")
+                return False
+            extraction_cache.put(content_hash, extracted_data)
+
+        # Record the uploaded name, not the uniquified temp file name
+        extracted_data['metadata']['pdf_name'] = filename
+        extracted_data['metadata']['content_hash'] = content_hash
+        return store_invoice(extracted_data, time.time() - start_time)
 
 @app.route('/log_error', methods=['POST'])
 def log_client_error():
@@ -165,48 +490,6 @@ def log_client_error():
         app.logger.error(f"Error logging failed: {str(e)}")
         return jsonify({'success': False}), 500
 
-def verify_mysql_entry(filename):
-    """Check MySQL database entry"""
-    conn = None
-    try:
-        conn = get_mysql_connection()
-        # Use buffered cursor to prevent unread results
-        cursor = conn.cursor(buffered=True)
-        cursor.execute("SELECT id FROM invoices WHERE pdf_name = %s", (filename,))
-        
-        # Explicitly consume all results
-        result = cursor.fetchone() is not None
-        while cursor.fetchone() is not None:  # Clear any remaining results
-            pass
-            
-        if not result:
-            app.logger.warning(f"MySQL verification failed for: {filename}")
-        return result
-    except Exception as e:
-        app.logger.error(f"MySQL verification error: {str(e)} | File: {filename}")
-        return False
-    finally:
-        if conn and conn.is_connected():
-            cursor.close()
-            conn.close()
-
-def verify_mongodb_entry(filename):
-    """Check MongoDB database entry"""
-    try:
-        client = get_mongodb_client()
-        db = client["invoices_db"]
-        collection = db["etisalat_invoices"]
-        result = collection.find_one({"_id": filename})
-        if not result:
-            app.logger.warning(f"MongoDB verification failed for: {filename}")
-        return result is not None
-    except Exception as e:
-        app.logger.error(f"MongoDB verification error: {str(e)} | File: {filename}")
-        return False
-    finally:
-        if 'client' in locals() and client:
-            client.close()
-
 @app.route('/cancel_batch', methods=['POST'])
 def cancel_batch():
     try:
@@ -250,6 +533,7 @@ def verify_processing():
     data = request.get_json()
     filename = data.get('filename')
     strict_check = data.get('strict_check', False)
+    conn = None
     
     try:
         conn = get_mysql_connection()
@@ -294,9 +578,137 @@ def verify_processing():
             'error': 'Database verification failed'
         }), 500
     finally:
-        if conn and conn.is_connected():
+        release_connection(conn)
+
+@app.route('/verify_batch', methods=['POST'])
+def verify_batch():
+    """
+    Check many filenames at once: one MySQL and one MongoDB query per batch.
+    Body: {"filenames": [...], "strict_check": bool}
+    """
+    data = request.get_json() or {}
+    filenames = data.get('filenames') or []
+    if not isinstance(filenames, list):
+        return jsonify({'success': False, 'error': 'filenames must be a list'}), 400
+
+    with metrics.timed("verification"):
+        results = verify_invoices(filenames, strict=data.get('strict_check', False),
+                                  check_mongodb=not OUTBOX_ENABLED)
+    return jsonify({
+        'success': True,
+        'results': results,
+        'verified': sum(1 for result in results.values() if result['verified'])
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage timings and pipeline counters in Prometheus text format"""
+    extraction = get_extraction_stats()
+    pools = get_pool_stats()
+    extra = [
+        "# HELP invoice_pages_total PDF pages read or skipped by the early-terminating reader.",
+        "# TYPE invoice_pages_total counter",
+        f'invoice_pages_total{{state="read"}} {extraction["pages_read"]}',
+        f'invoice_pages_total{{state="skipped"}} {extraction["pages_skipped"]}',
+        "# HELP db_pool_in_use Connections currently checked out of the process pools.",
+        "# TYPE db_pool_in_use gauge",
+        f'db_pool_in_use{{store="mysql"}} {pools["mysql"]["in_use"]}',
+        f'db_pool_in_use{{store="mongodb"}} {pools["mongodb"]["in_use"]}',
+        "# HELP invoice_jobs Background jobs by status.",
+        "# TYPE invoice_jobs gauge",
+    ]
+    try:
+        extra += [f'invoice_jobs{{status="{status}"}} {count}' for status, count in job_queue.counts().items()]
+    except Exception as e:
+        app.logger.error(f"Job queue metrics unavailable: {str(e)}")
+    if OUTBOX_ENABLED:
+        try:
+            outbox = replication_status()
+            extra += [
+                "# HELP mongo_outbox_pending Outbox rows not yet replicated to MongoDB.",
+                "# TYPE mongo_outbox_pending gauge",
+                f"mongo_outbox_pending {outbox['pending']}",
+                "# HELP mongo_outbox_parked Outbox rows parked after OUTBOX_MAX_ATTEMPTS failures.",
+                "# TYPE mongo_outbox_parked gauge",
+                f"mongo_outbox_parked {outbox['parked']}",
+                "# HELP mongo_outbox_lag_seconds Age of the oldest unreplicated outbox row.",
+                "# TYPE mongo_outbox_lag_seconds gauge",
+                f"mongo_outbox_lag_seconds {outbox['lag_seconds']:.6f}",
+            ]
+        except Exception as e:
+            app.logger.error(f"Outbox metrics unavailable: {str(e)}")
+    return Response(metrics.render_prometheus(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/outbox_status', methods=['GET'])
+def outbox_status():
+    """MongoDB replication backlog when the transactional outbox is enabled"""
+    if not OUTBOX_ENABLED:
+        return jsonify({'success': True, 'enabled': False})
+    try:
+        return jsonify({'success': True, 'enabled': True, 'data': replication_status()})
+    except Exception as e:
+        app.logger.error(f"Outbox status failed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def parse_month(value):
+    """'YYYY-MM' query parameter -> first day of that month (None if absent)"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m').date()
+
+def rollup_query(query, *args, **kwargs):
+    """Run a usage_rollups read, served from the TTL cache when fresh"""
+    def compute():
+        conn = get_mysql_connection()
+        try:
+            cursor = conn.cursor()
+            rows = query(cursor, *args, **kwargs)
             cursor.close()
-            conn.close()
+            return rows
+        finally:
+            release_connection(conn)
+    key = (query.__name__,) + args + tuple(sorted(kwargs.items()))
+    return analytics_cache.get_or_compute(key, compute)
+
+@app.route('/analytics/spend', methods=['GET'])
+def analytics_spend():
+    """Calls, seconds and spend per account, month and category (?account=&from=YYYY-MM&to=YYYY-MM)"""
+    try:
+        start_month = parse_month(request.args.get('from'))
+        end_month = parse_month(request.args.get('to'))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'from/to must be YYYY-MM'}), 400
+    try:
+        rows, cached = rollup_query(spend_by_category, request.args.get('account'), start_month, end_month)
+    except Exception as e:
+        app.logger.error(f"Spend analytics failed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'rollups_enabled': ROLLUPS_ENABLED, 'cached': cached, 'rows': rows})
+
+@app.route('/analytics/top_numbers', methods=['GET'])
+def analytics_top_numbers():
+    """Most called numbers (?account=&from=&to=&limit=10&order_by=calls|seconds|amount)"""
+    try:
+        start_month = parse_month(request.args.get('from'))
+        end_month = parse_month(request.args.get('to'))
+        limit = min(max(int(request.args.get('limit', 10)), 1), 1000)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'from/to must be YYYY-MM and limit a number'}), 400
+    order_by = request.args.get('order_by', 'calls')
+    if order_by not in TOP_NUMBER_ORDER:
+        return jsonify({'success': False, 'error': f"order_by must be one of {', '.join(TOP_NUMBER_ORDER)}"}), 400
+    try:
+        rows, cached = rollup_query(top_numbers, request.args.get('account'), start_month, end_month,
+                                    limit=limit, order_by=order_by)
+    except Exception as e:
+        app.logger.error(f"Top numbers analytics failed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'rollups_enabled': ROLLUPS_ENABLED, 'cached': cached, 'rows': rows})
+
+@app.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    """Connection pool usage for this worker process"""
+    return jsonify({'success': True, 'data': get_pool_stats()})
 
 @app.route('/log_error', methods=['POST'])
 def log_error():
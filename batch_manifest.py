@@ -0,0 +1,111 @@
+# batch_manifest.py
+"""
+Checkpoint manifest for process_invoices batch runs.
+
+Every file outcome is appended to a JSON-lines file as it happens, so a run
+that dies halfway loses nothing already done; loading replays the lines and
+the last entry for a file wins. A rerun skips files recorded as done whose
+content hash still matches.
+
+The invoice watcher and batch runs on the same folder share the manifest.
+Appends and compaction hold an exclusive flock on a sidecar PATH.lock file
+(the manifest itself is replaced when compacted), and compaction re-reads
+the file under that lock so lines appended by the other process are kept.
+"""
+import os
+import json
+import fcntl
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+from extraction_cache import sha256_file
+
+DONE = "done"
+FAILED = "failed"
+DEAD_LETTER = "dead_letter"
+
+class BatchManifest:
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        with self._file_lock():
+            if resume and os.path.exists(path):
+                self._load()
+            self._compact()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive across processes sharing this manifest"""
+        with open(f"{self.path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as manifest:
+            for line in manifest:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves at most one partial line
+                    continue
+                self.files[entry["name"]] = entry
+
+    def _compact(self):
+        """Rewrite the manifest with one line per file; call with _file_lock held"""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest:
+            for entry in self.files.values():
+                manifest.write(json.dumps(entry) + "\n")
+        os.replace(temp_path, self.path)
+
+    def content_hash(self, name: str, path: str) -> str:
+        """Hash of the file, reused from the manifest when size and mtime are unchanged"""
+        stat = os.stat(path)
+        entry = self.files.get(name)
+        if entry and entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime:
+            return entry["content_hash"]
+        return sha256_file(path)
+
+    def is_done(self, name: str, content_hash: str) -> bool:
+        entry = self.files.get(name)
+        return bool(entry) and entry["status"] == DONE and entry["content_hash"] == content_hash
+
+    def failures(self, name: str, content_hash: str) -> int:
+        """Failed runs recorded for this exact content"""
+        entry = self.files.get(name)
+        if not entry or entry["content_hash"] != content_hash:
+            return 0
+        return entry.get("failures", 0)
+
+    def record(self, name: str, path: Optional[str], content_hash: str, status: str,
+               error: str = None, attempts: int = 1) -> Dict:
+        failures = self.failures(name, content_hash) + (1 if status != DONE else 0)
+        entry = {
+            "name": name,
+            "status": status,
+            "content_hash": content_hash,
+            "failures": failures if status != DONE else 0,
+            "attempts": attempts,
+            "error": error,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+        with self._lock, self._file_lock():
+            self.files[name] = entry
+            with open(self.path, "a", encoding="utf-8") as manifest:
+                manifest.write(json.dumps(entry) + "\n")
+        return entry
+
+    def counts(self) -> Dict[str, int]:
+        counts = {DONE: 0, FAILED: 0, DEAD_LETTER: 0}
+        for entry in self.files.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
@@ -0,0 +1,50 @@
+# bench_parsers.py
+"""
+Compares the compiled invoice scanner with the reference regex parsers on
+synthetic invoice text of increasing call-table size.
+
+    python benchmarks/bench_parsers.py --calls 1000,10000,50000
+"""
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from etisalat_invoice import extract_core_fields, extract_call_tables  # noqa: E402
+from reference_parsers import reference_extract_core_fields, reference_extract_call_tables  # noqa: E402
+from synthetic_invoice import invoice_text  # noqa: E402
+
+def _best_of(func, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def scanner(text: str):
+    return extract_core_fields(text), extract_call_tables(text)
+
+def reference(text: str):
+    return reference_extract_core_fields(text), reference_extract_call_tables(text)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", default="1000,10000,50000", help="comma separated call-record counts")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    print(f"{'Calls':>8}{'Reference s':>14}{'Scanner s':>12}{'Speedup':>10}")
+    for call_count in (int(c) for c in args.calls.split(",") if c.strip()):
+        text = invoice_text(call_count, trailing_pages=2)
+        if scanner(text) != reference(text):
+            sys.exit(f"Scanner output differs from the reference for {call_count} calls")
+        old = _best_of(reference, text, args.repeat)
+        new = _best_of(scanner, text, args.repeat)
+        print(f"{call_count:>8}{old:>14.4f}{new:>12.4f}{old / new:>9.2f}x")
+
+if __name__ == "__main__":
+    main()
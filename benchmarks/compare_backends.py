@@ -0,0 +1,140 @@
+# compare_backends.py
+"""
+Layout-equivalence check and throughput comparison for the PDF backends.
+
+Runs every invoice in a folder (or a set of generated synthetic invoices)
+through extract_invoice_data with each backend, checks that the header
+fields and call tables match the pdfplumber reference exactly, and reports
+pages/s per backend. Exits non-zero if any backend disagrees, so it can gate
+a PDF_BACKEND change.
+
+    python benchmarks/compare_backends.py invoices/
+    python benchmarks/compare_backends.py --synthetic 100,2000,10000 --output backends.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from etisalat_invoice import extract_invoice_data  # noqa: E402
+from pdf_backends import BACKENDS  # noqa: E402
+from synthetic_invoice import write_invoice_pdf  # noqa: E402
+
+REFERENCE_BACKEND = "pdfplumber"
+
+def first_difference(expected, actual, path: str = ""):
+    """Path of the first value that differs between two parse results, or None"""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in list(expected) + [k for k in actual if k not in expected]:
+            if key not in expected or key not in actual:
+                return f"{path}.{key}"
+            found = first_difference(expected[key], actual[key], f"{path}.{key}")
+            if found:
+                return found
+        return None
+    if isinstance(expected, list) and isinstance(actual, list):
+        for index, (left, right) in enumerate(zip(expected, actual)):
+            found = first_difference(left, right, f"{path}[{index}]")
+            if found:
+                return found
+        if len(expected) != len(actual):
+            return f"{path} (length {len(expected)} != {len(actual)})"
+        return None
+    return None if expected == actual else path or "."
+
+def _parse(pdf_path: str, backend: str):
+    start = time.perf_counter()
+    invoice = extract_invoice_data(pdf_path, backend)
+    elapsed = time.perf_counter() - start
+    if invoice is None:
+        return None, elapsed, 0
+    result = {"invoice_data": invoice["invoice_data"], "usage_data": invoice["usage_data"]}
+    return result, elapsed, invoice["metadata"]["pages_read"]
+
+def compare_backends(pdf_paths: list, backends: list) -> dict:
+    """Per-backend totals plus the files where a backend disagrees with the reference"""
+    report = {name: {"seconds": 0.0, "pages": 0, "files": 0, "mismatches": []} for name in backends}
+    for pdf_path in pdf_paths:
+        reference, elapsed, pages = _parse(pdf_path, REFERENCE_BACKEND)
+        if REFERENCE_BACKEND in report:
+            totals = report[REFERENCE_BACKEND]
+            totals["seconds"] += elapsed
+            totals["pages"] += pages
+            totals["files"] += 1
+
+        for name in backends:
+            if name == REFERENCE_BACKEND:
+                continue
+            try:
+                result, elapsed, pages = _parse(pdf_path, name)
+            except Exception as e:
+                report[name]["mismatches"].append({"file": os.path.basename(pdf_path), "error": str(e)})
+                continue
+            totals = report[name]
+            totals["seconds"] += elapsed
+            totals["pages"] += pages
+            totals["files"] += 1
+            if result is None or reference is None:
+                difference = None if result is reference else "parse failed"
+            else:
+                difference = first_difference(reference, result)
+            if difference:
+                totals["mismatches"].append({"file": os.path.basename(pdf_path), "field": difference})
+
+    for totals in report.values():
+        seconds = totals["seconds"]
+        totals["pages_per_s"] = round(totals["pages"] / seconds, 2) if seconds else None
+        totals["seconds"] = round(seconds, 4)
+    return report
+
+def _synthetic_corpus(call_counts: str, workdir: str) -> list:
+    paths = []
+    for call_count in (int(c) for c in call_counts.split(",") if c.strip()):
+        path = os.path.join(workdir, f"synthetic_{call_count}.pdf")
+        write_invoice_pdf(path, call_count=call_count, trailing_pages=2, seed=call_count)
+        paths.append(path)
+    return paths
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare PDF backends against pdfplumber")
+    parser.add_argument("folder", nargs="?", help="folder of invoice PDFs to compare")
+    parser.add_argument("--synthetic", default=None,
+                        help="comma-separated call counts of synthetic invoices to generate instead")
+    parser.add_argument("--backends", default=",".join(sorted(BACKENDS)),
+                        help="comma-separated backends to run (default: all)")
+    parser.add_argument("--output", default=None, help="write the report as JSON")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.synthetic:
+            pdf_paths = _synthetic_corpus(args.synthetic, workdir)
+        elif args.folder:
+            pdf_paths = sorted(os.path.join(args.folder, f) for f in os.listdir(args.folder)
+                               if f.lower().endswith(".pdf"))
+        else:
+            sys.exit("Pass a folder of PDFs or --synthetic")
+        report = compare_backends(pdf_paths, backends)
+
+    print(f"{'backend':<12} {'files':>6} {'pages':>7} {'seconds':>9} {'pages/s':>9}  mismatches")
+    for name, totals in report.items():
+        print(f"{name:<12} {totals['files']:>6} {totals['pages']:>7} {totals['seconds']:>9.3f} "
+              f"{totals['pages_per_s'] or 0:>9.1f}  {len(totals['mismatches'])}")
+        for mismatch in totals["mismatches"][:10]:
+            print(f"    {mismatch['file']}: {mismatch.get('field') or mismatch.get('error')}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    if any(totals["mismatches"] for totals in report.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+# load_test.py
+"""
+Load test for the upload -> process -> verify HTTP flow.
+
+Virtual users replay the requests the browser sends, each working through a
+share of the uploads:
+
+- single (default): POST /upload, /process_single and /verify_processing
+  for each PDF, the per-file sequence of the original frontend
+- batch: POST /process_batch with --batch-size PDFs (reading the NDJSON
+  stream to the end), then /verify_batch, as static/js/app.js does now
+
+Without --url the app is served in this process by werkzeug's threaded
+server, wired to the MySQL/MongoDB stand-ins, optionally with
+--db-latency-ms added to every statement and write. --serve starts only that
+server, so the load can be generated from another process. Every upload is
+a distinct synthetic invoice with its own account number, so neither the
+extraction cache nor the idempotent-write checks short-circuit the work.
+
+For each concurrency level the report gives p50/p95/p99 latency, requests/s
+and error rate per endpoint, plus uploads/s overall:
+
+    python benchmarks/load_test.py --concurrency 1,4,8,16 --uploads 200 --mix 100:6,2000:3,10000:1
+    python benchmarks/load_test.py --serve --port 8000 --db-latency-ms 2
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --flow batch --output load.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import queue
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from synthetic_invoice import write_invoice_pdf  # noqa: E402
+from standins import FakeCollection, FakeCursor, FakeDatabase, FakeMongoClient, FakeMySQLConnection  # noqa: E402
+
+DEFAULT_MIX = "100:6,2000:3,10000:1"
+FLOWS = ("single", "batch")
+
+# --- stand-in databases -------------------------------------------------------
+
+class _StandinCursor(FakeCursor):
+    def execute(self, query, params=None):
+        with self.connection.lock:
+            super().execute(query, params)
+        if self.connection.latency:
+            time.sleep(self.connection.latency)
+
+    def executemany(self, query, seq_params):
+        # One round trip, as the driver batches the rows
+        with self.connection.lock:
+            for params in seq_params:
+                super().execute(query, params)
+        if self.connection.latency:
+            time.sleep(self.connection.latency)
+
+class StandinConnection(FakeMySQLConnection):
+    """One connection shared by every request: statements are serialised, then delayed"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def cursor(self, buffered=False, dictionary=False):
+        return _StandinCursor(self, dictionary=dictionary)
+
+class _StandinCollection(FakeCollection):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    def _delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def update_one(self, filter, update, upsert=False):
+        self._delay()
+        return super().update_one(filter, update, upsert)
+
+    def bulk_write(self, requests, ordered=True):
+        self._delay()
+        return super().bulk_write(requests, ordered)
+
+    def find(self, filter=None, projection=None):
+        self._delay()
+        return super().find(filter, projection)
+
+class _StandinDatabase(FakeDatabase):
+    def __init__(self, latency: float):
+        super().__init__()
+        self.latency = latency
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = _StandinCollection(self.latency)
+        return self.collections[name]
+
+class StandinMongoClient(FakeMongoClient):
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = _StandinDatabase(self.latency)
+        return self.databases[name]
+
+def wire_standins(app_module, db_latency: float = 0.0, patch=setattr) -> Tuple[StandinConnection, StandinMongoClient]:
+    """
+    Point every module that talks to MySQL/MongoDB at shared stand-ins.
+    patch is setattr, or monkeypatch.setattr in tests so it is undone.
+    """
+    import etisalat_invoice
+    import invoice_streaming
+    import invoice_verification
+    import mongo_outbox
+
+    mysql = StandinConnection(db_latency)
+    mongo = StandinMongoClient(db_latency)
+    for module in (etisalat_invoice, invoice_streaming, invoice_verification, mongo_outbox, app_module):
+        patch(module, "get_mysql_connection", lambda: mysql)
+        patch(module, "release_connection", lambda conn: None)
+    for module in (etisalat_invoice, invoice_streaming, invoice_verification, mongo_outbox):
+        patch(module, "get_mongodb_client", lambda: mongo)
+    return mysql, mongo
+
+def start_standin_server(app_module, host: str = "127.0.0.1", port: int = 0):
+    """Serve the app from a background thread; returns (server, base URL)"""
+    from werkzeug.serving import make_server
+    server = make_server(host, port, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+# --- uploads and HTTP ---------------------------------------------------------
+
+def parse_mix(mix: str) -> Dict[int, float]:
+    """'100:6,2000:3' -> {call count: weight}"""
+    weights = {}
+    for part in mix.split(","):
+        if part.strip():
+            calls, _, weight = part.partition(":")
+            weights[int(calls)] = float(weight or 1)
+    return weights
+
+def make_uploads(count: int, mix: Dict[int, float], seed: int = 0, label: str = "load") -> List[Tuple[str, bytes]]:
+    """count distinct synthetic invoices as (filename, PDF bytes), sizes drawn from mix"""
+    rng = random.Random(seed)
+    sizes = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    uploads = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for index, calls in enumerate(sizes):
+            path = os.path.join(workdir, "invoice.pdf")
+            serial = seed * 100000 + index
+            write_invoice_pdf(path, call_count=calls, trailing_pages=1, seed=serial,
+                              account_number=f"{900 + serial // 10 ** 7 % 100:03d}-{serial % 10 ** 7:07d}")
+            with open(path, "rb") as f:
+                uploads.append((f"{label}_{seed}_{index}_{calls}.pdf", f.read()))
+    return uploads
+
+def _multipart(field: str, files: List[Tuple[str, bytes]]) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'.encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+class LoadStats:
+    """Per-endpoint latencies and errors, shared by the virtual users"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + (0 if ok else 1)
+
+    def summary(self, wall_seconds: float) -> Dict:
+        report = {}
+        for endpoint, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            report[endpoint] = {
+                "requests": len(ordered),
+                "errors": self.errors[endpoint],
+                "error_rate": round(self.errors[endpoint] / len(ordered), 4),
+                "requests_per_s": round(len(ordered) / wall_seconds, 2) if wall_seconds else None,
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+            }
+        return report
+
+class Client:
+    def __init__(self, base_url: str, stats: LoadStats, timeout: float = 300):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.timeout = timeout
+
+    def post(self, endpoint: str, body: bytes, content_type: str):
+        """POST and record the latency; returns the response body, or None on an error status"""
+        request = urllib.request.Request(self.base_url + endpoint, data=body, method="POST",
+                                         headers={"Content-Type": content_type})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except OSError:
+            status, payload = None, None
+        ok = status is not None and 200 <= status < 300
+        self.stats.record(endpoint, time.perf_counter() - start, ok)
+        return payload if ok else None
+
+    def post_json(self, endpoint: str, data: Dict):
+        payload = self.post(endpoint, json.dumps(data).encode(), "application/json")
+        return json.loads(payload) if payload else None
+
+def run_single(client: Client, uploads: List[Tuple[str, bytes]]) -> int:
+    """/upload -> /process_single -> /verify_processing for each PDF; returns how many verified"""
+    verified = 0
+    for name, data in uploads:
+        body, content_type = _multipart("file", [(name, data)])
+        payload = client.post("/upload", body, content_type)
+        uploaded = json.loads(payload) if payload else None
+        if not uploaded or not uploaded.get("success"):
+            continue
+        processed = client.post_json("/process_single", {
+            "filename": uploaded["filename"],
+            "filepath": uploaded["filepath"],
+            "content_hash": uploaded.get("content_hash"),
+        })
+        if not processed or not processed.get("success"):
+            continue
+        result = client.post_json("/verify_processing", {"filename": uploaded["filename"], "strict_check": True})
+        if result and result.get("exists_in_db"):
+            verified += 1
+    return verified
+
+def run_batch(client: Client, uploads: List[Tuple[str, bytes]]) -> int:
+    """/process_batch for the group, then /verify_batch for what succeeded"""
+    body, content_type = _multipart("files", uploads)
+    payload = client.post("/process_batch", body, content_type)
+    if not payload:
+        return 0
+    lines = [json.loads(line) for line in payload.decode().splitlines() if line.strip()]
+    succeeded = [line["filename"] for line in lines if line.get("success") and "filename" in line]
+    if not succeeded:
+        return 0
+    result = client.post_json("/verify_batch", {"filenames": succeeded, "strict_check": True})
+    return result["verified"] if result else 0
+
+def run_level(base_url: str, uploads: List[Tuple[str, bytes]], concurrency: int,
+              flow: str = "single", batch_size: int = 10, timeout: float = 300) -> Dict:
+    """Push all uploads through the flow with concurrency virtual users"""
+    if flow not in FLOWS:
+        raise ValueError(f"Unknown flow '{flow}' (choose from {', '.join(FLOWS)})")
+    group = 1 if flow == "single" else max(batch_size, 1)
+    work = queue.SimpleQueue()
+    for start in range(0, len(uploads), group):
+        work.put(uploads[start:start + group])
+    stats = LoadStats()
+    client = Client(base_url, stats, timeout)
+    run = run_single if flow == "single" else run_batch
+
+    def virtual_user():
+        verified = 0
+        while True:
+            try:
+                items = work.get_nowait()
+            except queue.Empty:
+                return verified
+            verified += run(client, items)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        verified = sum(executor.map(lambda _: virtual_user(), range(concurrency)))
+    wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "flow": flow,
+        "uploads": len(uploads),
+        "verified": verified,
+        "seconds": round(wall, 3),
+        "uploads_per_s": round(len(uploads) / wall, 2) if wall else None,
+        "endpoints": stats.summary(wall),
+    }
+
+def print_level(result: Dict):
+    print(f"\nconcurrency {result['concurrency']}: {result['uploads']} uploads in {result['seconds']}s "
+          f"({result['uploads_per_s']}/s), {result['verified']} verified", file=sys.stderr)
+    print(f"{'Endpoint':<20}{'Reqs':>6}{'Err%':>7}{'Req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}",
+          file=sys.stderr)
+    for endpoint, s in result["endpoints"].items():
+        print(f"{endpoint:<20}{s['requests']:>6}{s['error_rate'] * 100:>6.1f}%{s['requests_per_s']:>8}"
+              f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}", file=sys.stderr)
+
+def _load_app(workdir: str, db_latency: float):
+    # app creates its upload folders and log file in the working directory on import
+    os.chdir(workdir)
+    import app as app_module
+    wire_standins(app_module, db_latency)
+    return app_module
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="app to load (default: serve it here with the stand-ins)")
+    parser.add_argument("--serve", action="store_true", help="only serve the app with the stand-ins")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="port for the stand-in server (default: any free)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0,
+                        help="added to each stand-in MySQL statement and MongoDB call")
+    parser.add_argument("--flow", choices=FLOWS, default="single")
+    parser.add_argument("--batch-size", type=int, default=10, help="PDFs per /process_batch request")
+    parser.add_argument("--concurrency", default="1,4,8", help="comma separated virtual user counts")
+    parser.add_argument("--uploads", type=int, default=100, help="PDFs per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"call-record counts and weights of the PDF mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--timeout", type=float, default=300, help="per request, seconds")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    base_url = args.url
+    if base_url is None:
+        app_module = _load_app(workdir, args.db_latency_ms / 1000)
+        if args.serve:
+            from werkzeug.serving import make_server
+            server = make_server(args.host, args.port or 8000, app_module.app, threaded=True)
+            print(f"Serving on http://{args.host}:{server.server_port} (working directory {workdir})",
+                  file=sys.stderr)
+            server.serve_forever()
+            return
+        server, base_url = start_standin_server(app_module, args.host, args.port)
+
+    mix = parse_mix(args.mix)
+    report = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "target": args.url or "in-process stand-ins",
+        "db_latency_ms": args.db_latency_ms if args.url is None else None,
+        "mix": mix,
+        "levels": [],
+    }
+    # Random per run, so account numbers do not repeat between runs against a real database
+    base_seed = random.randrange(9000)
+    for level, concurrency in enumerate(int(c) for c in args.concurrency.split(",") if c.strip()):
+        print(f"Generating {args.uploads} invoices for concurrency {concurrency} ...", file=sys.stderr)
+        # Fresh invoices per level so earlier levels do not warm the caches
+        uploads = make_uploads(args.uploads, mix, seed=base_seed + level)
+        result = run_level(base_url, uploads, concurrency, args.flow, args.batch_size, args.timeout)
+        print_level(result)
+        report["levels"].append(result)
+
+    if args.url is None:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
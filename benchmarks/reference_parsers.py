@@ -0,0 +1,106 @@
+# reference_parsers.py
+"""
+The regex parsers extract_core_fields and extract_call_tables used before the
+compiled scanner, kept verbatim. The golden tests check the scanner against
+them and bench_parsers.py measures the speedup.
+"""
+import re
+from typing import Dict
+
+def reference_extract_core_fields(text: str) -> Dict:
+    data = {}
+    
+    # Account Number
+    account_match = re.search(r"Account Number[:\s-]*(\d{3}\s?-\s?\d{7})", text)
+    if account_match:
+        data["account_number"] = account_match.group(1).replace(" ", "").replace("-", "")
+
+    # Bill Period
+    bill_match = re.search(
+        r"Bill period[\s:-]*(\d{1,2} [A-Za-z]{3} \d{4}.*?\d{1,2} [A-Za-z]{3} \d{4})",
+        text, re.DOTALL
+    )
+    if bill_match:
+        data["bill_period"] = " ".join(bill_match.group(1).split())
+
+    # Current Charges
+    charges_match = re.search(
+        r"Current month charges \(including VAT\)\D*(\d{1,3}(?:,\d{3})*\.\d+)",
+        text
+    )
+    data["current_charges"] = float(charges_match.group(1).replace(",", "")) if charges_match else None
+
+    # Total Due
+    total_due_match = re.search(
+        r"Total Amount Due\D*(\d{1,3}(?:,\d{3})*\.\s*\d+)",
+        text, re.DOTALL
+    )
+    if total_due_match:
+        total_due_str = total_due_match.group(1).replace("\n", "").replace(" ", "").replace(",", "")
+        data["total_due"] = float(total_due_str)
+
+    return data
+
+def reference_extract_call_tables(text: str) -> Dict:
+    """Extracts the three call type tables from the invoice text"""
+    # Find the National Calls And Usages section
+    national_calls_section = re.search(
+        r"National Calls And Usages.*?(?=C O N V E N I E N T W A Y S T O P A Y)",
+        text,
+        re.DOTALL
+    )
+
+    if not national_calls_section:
+        return None
+
+    section_text = national_calls_section.group(0)
+
+    # Initialize the three tables we want to extract
+    tables = {
+        "Calls to Mobile": {"summary": None, "records": []},
+        "Calls to Special Number": {"summary": None, "records": []},
+        "Calls To Telephone": {"summary": None, "records": []}
+    }
+
+    # Extract the summary lines for each call type
+    summary_pattern = r"(?i)(Calls to (?:Mobile|Special Number|Telephone))\s+([\d:]+)\s+([\d.]+)"
+    summaries = re.findall(summary_pattern, section_text)
+
+    for category, duration, amount in summaries:
+        if category in tables:
+            tables[category]["summary"] = {
+                "total_duration": duration,
+                "total_amount": float(amount)
+            }
+
+    # Extract all call records
+    record_pattern = r"(\d{1,2} [A-Za-z]{3} \d{4})\s+(\d{2}:\d{2}:\d{2})\s+[ÌÍ]?(\d+)[ÌÍ]?\s+(\d{2}:\d{2}:\d{2})\s+([\d.]+)"
+    records = re.findall(record_pattern, section_text)
+
+    # Define a list of UAE mobile prefixes
+    mobile_prefixes = ["050", "052", "054", "055", "056", "058"]
+
+    # Categorize each record
+    for record in records:
+        date, time, to_number, duration, amount = record
+        amount_float = float(amount)
+
+        # Check for mobile prefix
+        is_mobile = any(to_number.startswith(prefix) for prefix in mobile_prefixes)
+
+        if amount_float > 0:
+            category = "Calls to Special Number"
+        elif is_mobile:
+            category = "Calls to Mobile"
+        else:
+            category = "Calls To Telephone"
+
+        tables[category]["records"].append({
+            "date": date,
+            "time": time,
+            "to_number": to_number,
+            "duration": duration,
+            "amount": amount_float
+        })
+
+    return tables
@@ -0,0 +1,165 @@
+# run_benchmarks.py
+"""
+Throughput and memory benchmarks for the invoice pipeline.
+
+Generates synthetic Etisalat invoices of several sizes, then times
+extraction (PDF -> text), parsing (text -> fields and call tables),
+save_to_mysql and save_to_mongodb against in-memory stand-ins, and writes a
+JSON report. Pass --compare with an earlier report to flag regressions.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import etisalat_invoice  # noqa: E402
+from synthetic_invoice import write_invoice_pdf, invoice_text  # noqa: E402
+from standins import FakeMySQLConnection, FakeMongoClient  # noqa: E402
+
+DEFAULT_CALL_COUNTS = "100,2000,10000"
+
+def _measure(func, repeat: int):
+    """Run func repeat times; return (timings, peak traced memory of one extra run)"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return timings, peak
+
+def _result(timings, peak, units: int, unit: str):
+    median = statistics.median(timings)
+    return {
+        "median_s": round(median, 6),
+        "min_s": round(min(timings), 6),
+        "throughput": round(units / median, 2) if median else None,
+        "unit": unit,
+        "peak_mem_kb": round(peak / 1024, 1),
+    }
+
+def bench_scenario(call_count: int, trailing_pages: int, repeat: int, workdir: str):
+    pdf_path = os.path.join(workdir, f"synthetic_{call_count}.pdf")
+    page_count = write_invoice_pdf(pdf_path, call_count=call_count, trailing_pages=trailing_pages)
+    text = invoice_text(call_count, trailing_pages)
+    results = {"pages": page_count, "calls": call_count}
+
+    timings, peak = _measure(lambda: etisalat_invoice.extract_invoice_data(pdf_path), repeat)
+    results["extraction"] = _result(timings, peak, page_count, "pages/s")
+
+    def parse():
+        etisalat_invoice.extract_core_fields(text)
+        etisalat_invoice.extract_call_tables(text)
+    timings, peak = _measure(parse, repeat)
+    results["parsing"] = _result(timings, peak, call_count, "calls/s")
+
+    invoice = etisalat_invoice.extract_invoice_data(pdf_path)
+    if invoice is None:
+        raise RuntimeError(f"Synthetic invoice {pdf_path} did not parse")
+
+    def mysql_write():
+        conn = FakeMySQLConnection()
+        etisalat_invoice.save_to_mysql(invoice, 0.0, cursor=conn.cursor())
+    timings, peak = _measure(mysql_write, repeat)
+    results["save_to_mysql"] = _result(timings, peak, call_count, "rows/s")
+
+    def mongo_write():
+        etisalat_invoice.save_to_mongodb(invoice, client=FakeMongoClient())
+    timings, peak = _measure(mongo_write, repeat)
+    results["save_to_mongodb"] = _result(timings, peak, call_count, "calls/s")
+
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(BENCH_DIR),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(call_counts, trailing_pages: int, repeat: int) -> dict:
+    report = {
+        "generated_at": datetime.utcnow().isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for call_count in call_counts:
+            name = f"calls_{call_count}"
+            print(f"Benchmarking {name} ...", file=sys.stderr)
+            report["scenarios"][name] = bench_scenario(call_count, trailing_pages, repeat, workdir)
+    return report
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Return (scenario, stage, old, new, ratio) for stages slower than threshold"""
+    regressions = []
+    print(f"{'Scenario':<14}{'Stage':<17}{'Old s':>10}{'New s':>10}{'Change':>9}")
+    for scenario, stages in current["scenarios"].items():
+        old_stages = baseline.get("scenarios", {}).get(scenario)
+        if not old_stages:
+            continue
+        for stage, result in stages.items():
+            if not isinstance(result, dict) or stage not in old_stages:
+                continue
+            old, new = old_stages[stage]["median_s"], result["median_s"]
+            ratio = new / old if old else float("inf")
+            flag = "  REGRESSION" if ratio > 1 + threshold else ""
+            print(f"{scenario:<14}{stage:<17}{old:>10.4f}{new:>10.4f}{(ratio - 1) * 100:>+8.1f}%{flag}")
+            if flag:
+                regressions.append((scenario, stage, old, new, ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", default=DEFAULT_CALL_COUNTS,
+                        help=f"comma separated call-record counts (default: {DEFAULT_CALL_COUNTS})")
+    parser.add_argument("--trailing-pages", type=int, default=2,
+                        help="pages after the usage section end marker")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown ratio counted as a regression (default: 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    call_counts = [int(c) for c in args.calls.split(",") if c.strip()]
+    report = run(call_counts, args.trailing_pages, args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
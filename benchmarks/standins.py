@@ -0,0 +1,276 @@
+# standins.py
+"""
+In-process stand-ins for the MySQL and MongoDB clients used by
+etisalat_invoice. They accept the same calls the pipeline makes and keep the
+data in memory, so benchmarks measure our side of the writes (row building,
+statement formatting, BSON encoding) without a live server.
+"""
+import itertools
+import threading
+import bson
+
+class FakeCursor:
+    def __init__(self, connection, dictionary=False):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.lastrowid = None
+        self.rowcount = -1
+        self._results = []
+
+    def execute(self, query, params=None):
+        self.connection.statements += 1
+        statement = " ".join(query.split()).upper()
+        if statement.startswith("INSERT INTO INVOICES"):
+            self.lastrowid = next(self.connection.ids)
+            self.connection.invoices[self.lastrowid] = tuple(params)
+            self._results = []
+        elif statement.startswith("INSERT INTO USAGE_DETAILS"):
+            # Multi-row insert: seven values per row
+            params = list(params)
+            rows = [tuple(params[i:i + 7]) for i in range(0, len(params), 7)]
+            self.connection.usage_rows.extend(rows)
+            self._results = []
+        elif statement.startswith(("INSERT INTO USAGE_ROLLUPS", "INSERT INTO USAGE_NUMBER_ROLLUPS")):
+            params = list(params)
+            table = self.connection.rollups if statement.split()[2] == "USAGE_ROLLUPS" \
+                else self.connection.number_rollups
+            table.extend(tuple(params[i:i + 7]) for i in range(0, len(params), 7))
+            self._results = []
+        elif statement.startswith(("DELETE FROM USAGE_ROLLUPS", "DELETE FROM USAGE_NUMBER_ROLLUPS")):
+            attr = "rollups" if statement.split()[2] == "USAGE_ROLLUPS" else "number_rollups"
+            setattr(self.connection, attr, [row for row in getattr(self.connection, attr) if row[0] != params[0]])
+            self._results = []
+        elif statement.startswith("SELECT GET_LOCK("):
+            acquired = params[0] not in self.connection.named_locks
+            self.connection.named_locks.add(params[0])
+            self._results = [(1 if acquired else 0,)]
+        elif statement.startswith("SELECT RELEASE_LOCK("):
+            self.connection.named_locks.discard(params[0])
+            self._results = [(1,)]
+        elif statement.startswith("INSERT INTO MONGO_OUTBOX"):
+            self.lastrowid = next(self.connection.ids)
+            self.connection.outbox[self.lastrowid] = {
+                "pdf_name": params[0], "payload": params[1], "replicated": False, "attempts": 0
+            }
+            self._results = []
+        elif statement.startswith("SELECT ID, PDF_NAME, PAYLOAD FROM MONGO_OUTBOX"):
+            max_attempts, limit = params
+            pending = [
+                (i, row["pdf_name"], row["payload"]) for i, row in self.connection.outbox.items()
+                if not row["replicated"] and row["attempts"] < max_attempts
+            ]
+            self._results = pending[:limit]
+        elif statement.startswith("UPDATE MONGO_OUTBOX SET REPLICATED_AT"):
+            for outbox_id in params:
+                self.connection.outbox[outbox_id]["replicated"] = True
+            self._results = []
+        elif statement.startswith("SELECT ID, PDF_NAME FROM MONGO_OUTBOX"):
+            # Parked rows, optionally for one file
+            max_attempts, names = params[0], params[1:]
+            self._results = [
+                (i, row["pdf_name"]) for i, row in self.connection.outbox.items()
+                if not row["replicated"] and row["attempts"] >= max_attempts
+                and (not names or row["pdf_name"] in names)
+            ]
+        elif statement.startswith("SELECT PDF_NAME, MAX(ID) FROM MONGO_OUTBOX"):
+            newest = {}
+            for i, row in self.connection.outbox.items():
+                if row["pdf_name"] in params:
+                    newest[row["pdf_name"]] = max(i, newest.get(row["pdf_name"], i))
+            self._results = list(newest.items())
+        elif statement.startswith("UPDATE MONGO_OUTBOX SET ATTEMPTS = 0"):
+            for outbox_id in params:
+                self.connection.outbox[outbox_id]["attempts"] = 0
+            self._results = []
+        elif statement.startswith("UPDATE MONGO_OUTBOX SET ATTEMPTS"):
+            error, outbox_id = params
+            self.connection.outbox[outbox_id]["attempts"] += 1
+            self.connection.outbox[outbox_id]["last_error"] = error
+            self._results = []
+        elif statement.startswith("SELECT ATTEMPTS FROM MONGO_OUTBOX"):
+            self._results = [(self.connection.outbox[params[0]]["attempts"],)]
+        elif statement.startswith("SELECT ID, PDF_NAME FROM INVOICES WHERE ACCOUNT_NUMBER"):
+            account_number, bill_period = params
+            matches = [
+                (invoice_id, row[4]) for invoice_id, row in self.connection.invoices.items()
+                if row[0] == account_number and row[1] == bill_period
+            ]
+            self._results = matches[-1:]
+        elif statement.startswith("UPDATE INVOICES SET PROCESSING_TIME_SECONDS"):
+            proc_time, invoice_id = params
+            self.connection.invoices[invoice_id] = self.connection.invoices[invoice_id][:6] + (proc_time,)
+            self._results = []
+        elif statement.startswith("UPDATE INVOICES SET"):
+            current_charges, total_due, pdf_name, processed_at, proc_time, invoice_id = params
+            row = self.connection.invoices[invoice_id]
+            self.connection.invoices[invoice_id] = (
+                row[0], row[1], current_charges, total_due, pdf_name, processed_at, proc_time
+            )
+            self._results = []
+        elif statement.startswith("DELETE FROM USAGE_DETAILS WHERE INVOICE_ID"):
+            self.connection.usage_rows = [row for row in self.connection.usage_rows if row[0] != params[0]]
+            self._results = []
+        elif statement.startswith("SELECT DISTINCT PDF_NAME FROM INVOICES"):
+            names = set(params or ())
+            self._results = sorted({(row[4],) for row in self.connection.invoices.values() if row[4] in names})
+        elif statement.startswith("SELECT DISTINCT I.PDF_NAME FROM INVOICES I"):
+            # Strict verification: only invoices with usage rows
+            names = set(params or ())
+            with_usage = {row[0] for row in self.connection.usage_rows}
+            self._results = sorted({
+                (row[4],) for invoice_id, row in self.connection.invoices.items()
+                if row[4] in names and invoice_id in with_usage
+            })
+        elif statement.startswith("SELECT ID, PROCESSED_AT, ACCOUNT_NUMBER FROM INVOICES WHERE PDF_NAME"):
+            # /verify_processing: the latest row for the file
+            matches = [
+                (invoice_id, row[5], row[0]) for invoice_id, row in self.connection.invoices.items()
+                if row[4] == params[0]
+            ][-1:]
+            if self.dictionary:
+                matches = [dict(zip(("id", "processed_at", "account_number"), match)) for match in matches]
+            self._results = matches
+        elif statement.startswith("SELECT 1 FROM USAGE_DETAILS WHERE INVOICE_ID"):
+            found = any(row[0] == params[0] for row in self.connection.usage_rows)
+            self._results = [(1,)] if found else []
+        elif statement.startswith("SELECT") and "FROM INVOICES" in statement:
+            names = set(params or ())
+            self._results = [
+                (invoice_id,) + row for invoice_id, row in self.connection.invoices.items()
+                if row[4] in names
+            ]
+        else:
+            self._results = []
+
+    def executemany(self, query, seq_params):
+        for params in seq_params:
+            self.execute(query, params)
+
+    def fetchone(self):
+        return self._results.pop(0) if self._results else None
+
+    def fetchall(self):
+        results, self._results = self._results, []
+        return results
+
+    def close(self):
+        pass
+
+class FakeMySQLConnection:
+    """Mimics the pooled mysql.connector connection the pipeline borrows"""
+
+    def __init__(self):
+        self.ids = itertools.count(1)
+        self.invoices = {}
+        self.usage_rows = []
+        self.outbox = {}
+        self.named_locks = set()
+        self.rollups = []
+        self.number_rollups = []
+        self.statements = 0
+        self.commits = 0
+
+    def cursor(self, buffered=False, dictionary=False):
+        return FakeCursor(self, dictionary=dictionary)
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+class _UpdateResult:
+    acknowledged = True
+
+    def __init__(self, upserted_id=None):
+        self.upserted_id = upserted_id
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = {}
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+
+    def update_one(self, filter, update, upsert=False):
+        document = update.get("$set", {})
+        # Encode like the driver would, which is most of the client-side cost
+        encoded = bson.encode(document)
+        with self._lock:
+            self.bytes_written += len(encoded)
+            self.documents[filter["_id"]] = document
+        return _UpdateResult(filter["_id"])
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            if not hasattr(request, "_doc"):
+                # DeleteOne
+                with self._lock:
+                    self.documents.pop(request._filter["_id"], None)
+                continue
+            # pymongo's ReplaceOne/UpdateOne keep their arguments in these attributes
+            document = request._doc
+            if "$set" in document:
+                document = document["$set"]
+            encoded = bson.encode(document)
+            with self._lock:
+                self.bytes_written += len(encoded)
+                self.documents[request._filter["_id"]] = dict(document, _id=request._filter["_id"])
+        return _UpdateResult()
+
+    def delete_one(self, filter):
+        with self._lock:
+            self.documents.pop(filter["_id"], None)
+
+    def delete_many(self, filter):
+        def matches(document):
+            for key, expected in filter.items():
+                if isinstance(expected, dict) and "$ne" in expected:
+                    if document.get(key) == expected["$ne"]:
+                        return False
+                elif isinstance(expected, dict) and "$in" in expected:
+                    if document.get(key) not in expected["$in"]:
+                        return False
+                elif document.get(key) != expected:
+                    return False
+            return True
+        with self._lock:
+            for key in [k for k, d in self.documents.items() if matches(d)]:
+                del self.documents[key]
+
+    def find_one(self, filter):
+        return self.documents.get(filter.get("_id"))
+
+    def find(self, filter=None, projection=None):
+        ids = (filter or {}).get("_id", {}).get("$in")
+        if ids is None:
+            return list(self.documents.values())
+        return [self.documents[i] for i in ids if i in self.documents]
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def with_options(self, **kwargs):
+        return self
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+class FakeMongoClient:
+    def __init__(self):
+        self.databases = {}
+
+    def __getitem__(self, name):
+        return self.databases.setdefault(name, FakeDatabase())
+
+    def close(self):
+        pass
@@ -0,0 +1,154 @@
+# synthetic_invoice.py
+"""
+Synthetic Etisalat-layout invoices for benchmarks and tests.
+
+The text follows the patterns extract_core_fields and extract_call_tables
+look for: the header fields on the first page, a "National Calls And
+Usages" section with the three summary rows and itemised call records, the
+"C O N V E N I E N T W A Y S T O P A Y" end marker, and optional trailing
+pages after it. PDFs are written directly with the standard Helvetica font
+so no PDF library is needed.
+"""
+import random
+from datetime import date, timedelta
+from typing import Dict, List
+
+LINES_PER_PAGE = 60
+MOBILE_PREFIXES = ["050", "052", "054", "055", "056", "058"]
+LANDLINE_PREFIXES = ["02", "03", "04", "06", "07", "09"]
+SPECIAL_PREFIXES = ["600", "800", "900"]
+
+def _hms(seconds: int) -> str:
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def _money(amount: float) -> str:
+    return f"{amount:,.2f}"
+
+def generate_call_records(call_count: int, seed: int = 0,
+                          period_start: date = date(2025, 1, 1)) -> List[Dict]:
+    """Random call records: roughly half mobile, a third landline, the rest special numbers"""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(call_count):
+        kind = rng.random()
+        if kind < 0.5:
+            number = rng.choice(MOBILE_PREFIXES) + f"{rng.randrange(10 ** 7):07d}"
+            amount = 0.0
+        elif kind < 0.85:
+            number = rng.choice(LANDLINE_PREFIXES) + f"{rng.randrange(10 ** 7):07d}"
+            amount = 0.0
+        else:
+            number = rng.choice(SPECIAL_PREFIXES) + f"{rng.randrange(10 ** 6):06d}"
+            amount = round(rng.uniform(0.5, 25), 2)
+        call_day = period_start + timedelta(days=rng.randrange(28))
+        records.append({
+            "date": call_day.strftime("%d %b %Y"),
+            "time": _hms(rng.randrange(86400)),
+            "to_number": number,
+            "duration": _hms(rng.randrange(1, 3600)),
+            "amount": amount
+        })
+    return records
+
+def _category(record: Dict) -> str:
+    if record["amount"] > 0:
+        return "Calls to Special Number"
+    if record["to_number"][:3] in MOBILE_PREFIXES:
+        return "Calls to Mobile"
+    return "Calls To Telephone"
+
+def invoice_pages(call_count: int = 200, trailing_pages: int = 1, seed: int = 0,
+                  account_number: str = "123-4567890") -> List[List[str]]:
+    """Lines of text for each page of a synthetic invoice"""
+    records = generate_call_records(call_count, seed)
+
+    totals = {}
+    for record in records:
+        seconds, amount = totals.get(_category(record), (0, 0.0))
+        h, m, s = (int(part) for part in record["duration"].split(":"))
+        totals[_category(record)] = (seconds + h * 3600 + m * 60 + s, amount + record["amount"])
+    current_charges = round(sum(amount for _, amount in totals.values()) + 150, 2)
+
+    header = [
+        "Etisalat by e& - Tax Invoice",
+        f"Account Number: {account_number}",
+        "Bill period: 01 Jan 2025 - 31 Jan 2025",
+        f"Current month charges (including VAT) AED {_money(current_charges)}",
+        "Previous balance AED 0.00",
+        f"Total Amount Due AED {_money(current_charges)}",
+        "Summary of charges",
+        "Monthly plan charges AED 150.00",
+    ]
+
+    usage = ["National Calls And Usages", "Type Duration Amount"]
+    for category in ("Calls to Mobile", "Calls to Special Number", "Calls To Telephone"):
+        seconds, amount = totals.get(category, (0, 0.0))
+        usage.append(f"{category} {_hms(seconds)} {amount:.2f}")
+    usage.append("Date Time Number Duration Amount")
+    for record in records:
+        usage.append(
+            f"{record['date']} {record['time']} {record['to_number']} "
+            f"{record['duration']} {record['amount']:.2f}"
+        )
+    usage.append("C O N V E N I E N T W A Y S T O P A Y")
+    usage.append("Pay online, through the app or at any Etisalat store.")
+
+    pages = [header]
+    for start in range(0, len(usage), LINES_PER_PAGE):
+        pages.append(usage[start:start + LINES_PER_PAGE])
+    for i in range(trailing_pages):
+        pages.append([f"Terms and conditions page {i + 1}"] +
+                     ["Lorem ipsum dolor sit amet, consectetur adipiscing elit."] * 40)
+    return pages
+
+def invoice_text(call_count: int = 200, trailing_pages: int = 1, seed: int = 0, **kwargs) -> str:
+    """The invoice as extract_invoice_data would join it: pages separated by newlines"""
+    pages = invoice_pages(call_count, trailing_pages, seed, **kwargs)
+    return "\n".join("\n".join(lines) for lines in pages)
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_invoice_pdf(path: str, call_count: int = 200, trailing_pages: int = 1,
+                      seed: int = 0, **kwargs) -> int:
+    """Write a synthetic invoice PDF and return its page count"""
+    pages = invoice_pages(call_count, trailing_pages, seed, **kwargs)
+
+    objects = []  # object bodies, numbered from 1
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(None)  # page tree, filled in once the kids are known
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    kids = []
+    for lines in pages:
+        content = ["BT", "/F1 9 Tf", "12 TL", "40 800 Td"]
+        for line in lines:
+            content.append(f"({_pdf_escape(line)}) Tj T*")
+        content.append("ET")
+        stream = "\n".join(content).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return len(pages)
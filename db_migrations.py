@@ -0,0 +1,353 @@
+# db_migrations.py
+"""
+Versioned schema for the etisalat_e_invoices MySQL database.
+
+    python db_migrations.py migrate            # apply pending migrations
+    python db_migrations.py status             # applied / pending versions
+    python db_migrations.py check              # report missing indexes (exit 1 if any)
+    python db_migrations.py dedupe             # keep only the newest invoice per account and period
+    python db_migrations.py partition --from 2024-01 --months 24
+
+Migrations are applied in version order and recorded in schema_migrations.
+Tables are created with IF NOT EXISTS and indexes only when missing, so the
+runner can be pointed at a database that was set up by hand.
+
+Migration 4 makes (account_number, bill_period) unique and refuses to run
+while an account has several invoices rows for one period (left by earlier
+re-uploads); run dedupe first to delete all but the newest of each.
+"""
+import sys
+import logging
+import argparse
+from datetime import date
+from typing import Dict, List, Tuple
+
+from etisalat_invoice import get_mysql_connection, release_connection, get_mongodb_client, remove_mongo_invoice, MYSQL_CONFIG
+from mongo_outbox import OUTBOX_DDL
+from usage_rollups import (
+    ROLLUPS_DDL, NUMBER_ROLLUPS_DDL, BACKFILL_ROLLUPS_SQL, BACKFILL_NUMBER_ROLLUPS_SQL,
+)
+
+SCHEMA_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+
+INVOICES_DDL = """
+    CREATE TABLE IF NOT EXISTS invoices (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        account_number VARCHAR(32) NOT NULL,
+        bill_period VARCHAR(64) NOT NULL,
+        current_charges DECIMAL(12, 2) NULL,
+        total_due DECIMAL(12, 2) NOT NULL,
+        pdf_name VARCHAR(255) NOT NULL,
+        processed_at DATETIME NOT NULL,
+        processing_time_seconds DOUBLE NULL
+    )
+    """
+
+# The primary key includes date so the table can later be partitioned by month
+# (MySQL requires the partitioning column in every unique key)
+USAGE_DETAILS_DDL = """
+    CREATE TABLE IF NOT EXISTS usage_details (
+        id BIGINT AUTO_INCREMENT,
+        invoice_id INT NOT NULL,
+        category VARCHAR(64) NOT NULL,
+        date DATE NOT NULL,
+        time TIME NOT NULL,
+        to_number VARCHAR(32) NOT NULL,
+        duration VARCHAR(16) NOT NULL,
+        amount DECIMAL(12, 2) NOT NULL,
+        PRIMARY KEY (id, date)
+    )
+    """
+
+# table -> [(index name, columns)] that the application's queries rely on.
+# InnoDB secondary indexes carry the primary key, so (pdf_name, processed_at,
+# account_number) fully covers the verification lookups.
+EXPECTED_INDEXES: Dict[str, List[Tuple[str, Tuple[str, ...]]]] = {
+    "invoices": [
+        ("idx_invoices_pdf_name", ("pdf_name", "processed_at", "account_number")),
+        ("uq_invoices_account_period", ("account_number", "bill_period")),
+    ],
+    "usage_details": [
+        ("idx_usage_invoice", ("invoice_id",)),
+    ],
+    "mongo_outbox": [
+        ("idx_outbox_pending", ("replicated_at", "id")),
+    ],
+    "usage_rollups": [
+        ("idx_rollups_account_month", ("account_number", "month")),
+    ],
+    "usage_number_rollups": [
+        ("idx_number_rollups_account_month", ("account_number", "month")),
+        ("idx_number_rollups_month", ("month",)),
+    ],
+}
+
+# Indexes that must also enforce uniqueness (the natural key of an invoice)
+UNIQUE_INDEXES = {"uq_invoices_account_period"}
+
+# (table, index name) -> columns of indexes an applied migration created and a
+# later one drops; no longer expected
+RETIRED_INDEXES: Dict[Tuple[str, str], Tuple[str, ...]] = {
+    ("invoices", "idx_invoices_account_period"): ("account_number", "bill_period"),
+}
+
+# (version, description, statements); an ("index", table, name) entry is
+# created only if no existing index already starts with those columns, and a
+# ("drop_index", table, name) entry is dropped only if it exists.
+# Applied migrations are never edited; later changes get a new version.
+MIGRATIONS = [
+    (1, "invoices and usage_details tables", [INVOICES_DDL, USAGE_DETAILS_DDL]),
+    (2, "lookup indexes for invoices and usage_details", [
+        ("index", "invoices", "idx_invoices_pdf_name"),
+        ("index", "invoices", "idx_invoices_account_period"),
+        ("index", "usage_details", "idx_usage_invoice"),
+    ]),
+    (3, "mongo_outbox table", [OUTBOX_DDL]),
+    (4, "one invoices row per account and bill period", [
+        ("index", "invoices", "uq_invoices_account_period"),
+    ]),
+    (5, "usage rollup tables, backfilled from usage_details", [
+        ROLLUPS_DDL, NUMBER_ROLLUPS_DDL, BACKFILL_ROLLUPS_SQL, BACKFILL_NUMBER_ROLLUPS_SQL,
+    ]),
+    (6, "drop idx_invoices_account_period, served by the unique key", [
+        ("drop_index", "invoices", "idx_invoices_account_period"),
+    ]),
+]
+
+def _index_columns(table: str, name: str) -> Tuple[str, ...]:
+    if (table, name) in RETIRED_INDEXES:
+        return RETIRED_INDEXES[(table, name)]
+    return dict(EXPECTED_INDEXES[table])[name]
+
+def existing_indexes(cursor, schema: str) -> Dict[str, List[Tuple[Tuple[str, ...], bool]]]:
+    """table -> (columns, unique) for every index in the schema"""
+    cursor.execute(
+        "SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX",
+        (schema,)
+    )
+    indexes = {}
+    for table, index, non_unique, column in cursor.fetchall():
+        entry = indexes.setdefault(table, {}).setdefault(index, ([], not non_unique))
+        entry[0].append(column)
+    return {
+        table: [(tuple(columns), unique) for columns, unique in by_name.values()]
+        for table, by_name in indexes.items()
+    }
+
+def _served_by(name: str, columns: Tuple[str, ...], indexes) -> bool:
+    if name in UNIQUE_INDEXES:
+        # A unique index only enforces the key if it has exactly these columns
+        return any(unique and index == columns for index, unique in indexes)
+    return any(index[:len(columns)] == columns for index, _ in indexes)
+
+def missing_indexes(existing: Dict[str, List[Tuple[Tuple[str, ...], bool]]]) -> List[Tuple[str, str, Tuple[str, ...]]]:
+    """
+    Expected indexes not served by an existing one. An index counts if its
+    leading columns match, so a wider index covers a narrower requirement;
+    UNIQUE_INDEXES need a unique index on exactly their columns.
+    Tables that do not exist are skipped.
+    """
+    missing = []
+    for table, expected in EXPECTED_INDEXES.items():
+        if table not in existing:
+            continue
+        for name, columns in expected:
+            if not _served_by(name, columns, existing[table]):
+                missing.append((table, name, columns))
+    return missing
+
+def _index_exists(cursor, schema: str, table: str, name: str) -> bool:
+    cursor.execute(
+        "SELECT 1 FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND INDEX_NAME = %s LIMIT 1",
+        (schema, table, name)
+    )
+    return bool(cursor.fetchall())
+
+def _require_no_duplicates(cursor, table: str, columns: Tuple[str, ...]):
+    key = ", ".join(columns)
+    cursor.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM {table} GROUP BY {key} HAVING COUNT(*) > 1) AS duplicates"
+    )
+    count = cursor.fetchone()[0]
+    if count:
+        raise RuntimeError(
+            f"{count} duplicate ({key}) groups in {table}; "
+            f"run `python db_migrations.py dedupe` to remove the older copies before migrating"
+        )
+
+def duplicate_invoices(cursor) -> List[Tuple[int, str, str]]:
+    """(id, pdf_name, newest pdf_name) of invoices rows superseded by a newer one for the same period"""
+    cursor.execute(
+        "SELECT i.id, i.pdf_name, latest.pdf_name FROM invoices i "
+        "JOIN (SELECT account_number, bill_period, MAX(id) AS id FROM invoices "
+        "GROUP BY account_number, bill_period HAVING COUNT(*) > 1) newest "
+        "ON newest.account_number = i.account_number AND newest.bill_period = i.bill_period "
+        "JOIN invoices latest ON latest.id = newest.id "
+        "WHERE i.id < newest.id ORDER BY i.id"
+    )
+    return cursor.fetchall()
+
+def dedupe_invoices(batch_size: int = 500) -> List[str]:
+    """
+    Delete every invoices row that a newer row for the same account and bill
+    period supersedes, with its usage_details, and the MongoDB documents
+    stored under names that are no longer current. Returns the removed names.
+    """
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        duplicates = duplicate_invoices(cursor)
+        for start in range(0, len(duplicates), batch_size):
+            ids = [row[0] for row in duplicates[start:start + batch_size]]
+            placeholders = ", ".join(["%s"] * len(ids))
+            cursor.execute(f"DELETE FROM usage_details WHERE invoice_id IN ({placeholders})", ids)
+            cursor.execute(f"DELETE FROM invoices WHERE id IN ({placeholders})", ids)
+            conn.commit()
+        cursor.close()
+    finally:
+        release_connection(conn)
+
+    # A re-upload under the same name already overwrote its MongoDB document
+    stale = sorted({name for _, name, newest in duplicates if name != newest})
+    if stale:
+        client = get_mongodb_client()
+        for name in stale:
+            remove_mongo_invoice(client, name)
+    return [name for _, name, _ in duplicates]
+
+def applied_versions(cursor) -> List[int]:
+    cursor.execute(SCHEMA_TABLE_DDL)
+    cursor.execute("SELECT version FROM schema_migrations ORDER BY version")
+    return [row[0] for row in cursor.fetchall()]
+
+def migrate() -> List[int]:
+    """Apply pending migrations; returns the versions applied"""
+    conn = get_mysql_connection()
+    applied = []
+    try:
+        cursor = conn.cursor()
+        done = set(applied_versions(cursor))
+        for version, description, statements in MIGRATIONS:
+            if version in done:
+                continue
+            for statement in statements:
+                if isinstance(statement, tuple) and statement[0] == "drop_index":
+                    _, table, name = statement
+                    if not _index_exists(cursor, MYSQL_CONFIG["database"], table, name):
+                        continue
+                    statement = f"DROP INDEX {name} ON {table}"
+                elif isinstance(statement, tuple):
+                    _, table, name = statement
+                    columns = _index_columns(table, name)
+                    current = existing_indexes(cursor, MYSQL_CONFIG["database"]).get(table, [])
+                    if _served_by(name, columns, current):
+                        continue
+                    if name in UNIQUE_INDEXES:
+                        _require_no_duplicates(cursor, table, columns)
+                    kind = "UNIQUE INDEX" if name in UNIQUE_INDEXES else "INDEX"
+                    statement = f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"
+                cursor.execute(statement)
+            # DDL commits implicitly in MySQL; record the version once it has run
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                (version, description)
+            )
+            conn.commit()
+            applied.append(version)
+            logging.info(f"Applied migration {version}: {description}")
+        cursor.close()
+    finally:
+        release_connection(conn)
+    return applied
+
+def check() -> List[Tuple[str, str, Tuple[str, ...]]]:
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        missing = missing_indexes(existing_indexes(cursor, MYSQL_CONFIG["database"]))
+        cursor.close()
+        return missing
+    finally:
+        release_connection(conn)
+
+def _month_start(value: date, offset: int) -> date:
+    month = value.month - 1 + offset
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+def partition_ddl(first_month: date, months: int) -> str:
+    """ALTER TABLE statement partitioning usage_details by call month"""
+    partitions = []
+    for i in range(months):
+        start = _month_start(first_month, i)
+        end = _month_start(first_month, i + 1)
+        partitions.append(f"PARTITION p{start:%Y%m} VALUES LESS THAN ('{end:%Y-%m-%d}')")
+    partitions.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+    return (
+        "ALTER TABLE usage_details PARTITION BY RANGE COLUMNS(date) (\n    "
+        + ",\n    ".join(partitions) + "\n)"
+    )
+
+def partition_usage_details(first_month: date, months: int):
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(partition_ddl(first_month, months))
+        cursor.close()
+    finally:
+        release_connection(conn)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Schema migrations for the invoices database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="apply pending migrations")
+    commands.add_parser("status", help="list applied and pending migrations")
+    commands.add_parser("check", help="report indexes missing from an existing database")
+    commands.add_parser("dedupe", help="delete all but the newest invoice per account and bill period")
+    partition = commands.add_parser("partition", help="partition usage_details by month")
+    partition.add_argument("--from", dest="first_month", required=True,
+                           help="first month to get its own partition (YYYY-MM)")
+    partition.add_argument("--months", type=int, default=24,
+                           help="number of monthly partitions before the catch-all (default: 24)")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args(argv)
+
+    if args.command == "migrate":
+        applied = migrate()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+    elif args.command == "status":
+        conn = get_mysql_connection()
+        try:
+            done = set(applied_versions(conn.cursor()))
+        finally:
+            release_connection(conn)
+        for version, description, _ in MIGRATIONS:
+            print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {description}")
+    elif args.command == "check":
+        missing = check()
+        for table, name, columns in missing:
+            print(f"Missing index on {table} ({', '.join(columns)}) - expected {name}")
+        if missing:
+            return 1
+        print("All expected indexes are present")
+    elif args.command == "dedupe":
+        removed = dedupe_invoices()
+        print(f"Removed {len(removed)} superseded invoices rows" if removed else "No duplicate invoices")
+    elif args.command == "partition":
+        year, month = (int(part) for part in args.first_month.split("-"))
+        partition_usage_details(date(year, month, 1), args.months)
+        print(f"usage_details partitioned into {args.months} monthly partitions from {args.first_month}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+# extraction_cache.py
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+def sha256_file(path: str) -> str:
+    """SHA-256 of a file on disk, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_stream_with_hash(stream, dest_path: str) -> str:
+    """Copy an upload stream to dest_path, hashing the bytes on the way through"""
+    digest = hashlib.sha256()
+    with open(dest_path, 'wb') as out:
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+class ExtractionCache:
+    """
+    Content-addressed store of extract_invoice_data results, one JSON file per
+    SHA-256 of the PDF bytes. Entries are touched on every hit and the least
+    recently used ones are deleted once the directory exceeds max_bytes.
+    put() keeps a running total of the directory size (counted once, then
+    adjusted per write) and only walks the directory when it crosses
+    max_bytes. Writes by other processes sharing the directory are picked up
+    at that walk.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}.json")
+
+    def get(self, content_hash: str) -> Optional[Dict]:
+        """Return the cached entry ({'processed': bool, 'data': ...}) or None"""
+        path = self._path(content_hash)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.error(f"Extraction cache read failed for {content_hash}: {str(e)}")
+            return None
+
+    def put(self, content_hash: str, extracted_data: Dict, processed: bool = False):
+        entry = {
+            "content_hash": content_hash,
+            "stored_at": datetime.utcnow(),
+            "processed": processed,
+            "data": extracted_data
+        }
+        path = self._path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            old_size = os.stat(path).st_size
+        except FileNotFoundError:
+            old_size = 0
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, default=_json_default)
+            os.replace(tmp_path, path)
+            new_size = os.stat(path).st_size
+        except (OSError, TypeError) as e:
+            logging.error(f"Extraction cache write failed for {content_hash}: {str(e)}")
+            return
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()[1]
+            else:
+                self._total_bytes += new_size - old_size
+            over_limit = self._total_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def mark_processed(self, content_hash: str):
+        entry = self.get(content_hash)
+        if entry is not None and not entry.get("processed"):
+            self.put(content_hash, entry["data"], processed=True)
+
+    def _scan(self):
+        """(mtime, size, path) of every entry, and their total size"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        return entries, total
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries, total = self._scan()
+            if total > self.max_bytes:
+                for _, size, path in sorted(entries):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            self._total_bytes = total
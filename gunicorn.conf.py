@@ -0,0 +1,37 @@
+# gunicorn.conf.py
+"""
+Gunicorn settings, picked up automatically by `gunicorn app:app`.
+
+The app is imported once in the master (preload_app) together with the PDF
+backend, and workers are forked from it, so booting or recycling a worker
+costs a fork rather than re-importing Flask, the database drivers and the PDF
+library. Pages of those modules stay shared copy-on-write between workers.
+Per-process state (DB pools, the outbox relay, job queue threads) is created
+after the fork.
+"""
+import os
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+# Recycle workers now and then; with preload this is cheap
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+if preload_app:
+    # Read by app.py at import: leave background threads to post_fork
+    os.environ["APP_PRELOAD"] = "true"
+
+def on_starting(server):
+    if preload_app:
+        # Imported lazily by the app; load them here so every worker shares them
+        import mysql.connector.pooling  # noqa: F401
+        import pymongo  # noqa: F401
+        import pdf_backends
+        try:
+            pdf_backends.warm()
+        except Exception as e:
+            server.log.warning(f"PDF backend not preloaded: {str(e)}")
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import start_background_services
+        start_background_services()
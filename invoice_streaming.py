@@ -0,0 +1,362 @@
+# invoice_streaming.py
+"""
+Streaming pipeline for very large itemised invoices.
+
+Call records flow page by page from the PDF backend through the scanner and
+classifier into chunked writes, so memory stays bounded by one page of text
+plus one chunk of records however long the invoice is:
+
+- MySQL: usage_details rows are spooled to a temporary file while the PDF is
+  parsed. Only then is the transaction opened and the invoices row written,
+  followed by the spooled rows in multi-row INSERTs of STREAM_CHUNK_SIZE.
+- MongoDB: records are written as bucket documents of STREAM_CHUNK_SIZE
+  records to the etisalat_invoice_usage collection, and the main
+  etisalat_invoices document keeps only the summaries, record counts and the
+  bucket run id, well clear of the 16MB document limit. With the outbox the
+  main document goes through mongo_outbox like any other invoice.
+"""
+import os
+import time
+import uuid
+import pickle
+import logging
+import tempfile
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import metrics
+from pdf_backends import get_backend
+from page_parallel import document_pages
+import usage_rollups
+from etisalat_invoice import (
+    INVOICE_WRITE_MODE, REQUIRED_FIELDS, USAGE_SECTION_START, USAGE_SECTION_END,
+    CoreFieldScanner, classify_call, scan_usage_rows_until,
+    get_mysql_connection, release_connection, get_mongodb_client,
+    write_invoice_row, remove_mongo_invoice, usage_row, _insert_usage_rows,
+    TransientStoreError, is_transient_error,
+)
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "5000"))
+# PDFs at least this large (bytes) take the streaming path automatically (0 disables)
+STREAMING_MIN_BYTES = int(os.getenv("STREAMING_MIN_BYTES", "0"))
+MONGO_USAGE_COLLECTION = "etisalat_invoice_usage"
+
+CATEGORIES = ("Calls to Mobile", "Calls to Special Number", "Calls To Telephone")
+
+class _StreamAborted(Exception):
+    """Raised internally to roll back after a logged failure"""
+
+def should_stream(pdf_path) -> bool:
+    """pdf_path may also be an in-memory buffer (io.BytesIO)"""
+    if STREAMING_MIN_BYTES <= 0:
+        return False
+    if hasattr(pdf_path, "getbuffer"):
+        return pdf_path.getbuffer().nbytes >= STREAMING_MIN_BYTES
+    return os.path.getsize(pdf_path) >= STREAMING_MIN_BYTES
+
+def iter_page_texts(pages) -> Iterator[str]:
+    """Text of each non-empty page, extracted once; pages are closed as we go"""
+    for page in pages:
+        with metrics.timed("text_extraction"):
+            text = page.extract_text()
+        page.close()
+        if text:
+            yield text
+
+class InvoiceStream:
+    """
+    Incremental view of one invoice's text. read_header() consumes pages until
+    the core fields are known; records() then yields (category, record) for
+    every call record in the usage section, buffering nothing beyond the
+    current page and the tail of a row wrapped across the page break, and
+    collecting the summary rows as it goes.
+    """
+
+    def __init__(self, page_texts: Iterable[str]):
+        self._pages = iter(page_texts)
+        self._buffered = []
+        self.fields = {}
+        self.summaries = {category: None for category in CATEGORIES}
+        self.record_counts = {category: 0 for category in CATEGORIES}
+        self.section_found = False
+        self.section_closed = False
+        self.pages_read = 0
+
+    def _next_page(self) -> Optional[str]:
+        page = next(self._pages, None)
+        if page is not None:
+            self.pages_read += 1
+        return page
+
+    def read_header(self) -> Dict:
+        """
+        Read pages until the required fields have been found (or pages run
+        out), and current_charges too unless the usage section has started
+        """
+        scanner = CoreFieldScanner()
+        usage_started = False
+        while True:
+            page = self._next_page()
+            if page is None:
+                break
+            self._buffered.append(page)
+            with metrics.timed("field_regexes"):
+                scanner.feed(page)
+            self.fields = scanner.result()
+            usage_started = usage_started or USAGE_SECTION_START in page
+            if scanner.complete and (self.fields["current_charges"] is not None or usage_started):
+                break
+        return self.fields
+
+    def _section_chunks(self) -> Iterator[str]:
+        """Usage section text, one page at a time, cut at the start and end markers"""
+        pages = iter(self._buffered)
+        self._buffered = []
+        while True:
+            page = next(pages, None)
+            if page is None:
+                page = self._next_page()
+            if page is None:
+                break
+
+            if not self.section_found:
+                start = page.find(USAGE_SECTION_START)
+                if start == -1:
+                    continue
+                self.section_found = True
+                page = page[start:]
+                end = page.find(USAGE_SECTION_END, len(USAGE_SECTION_START))
+            else:
+                end = page.find(USAGE_SECTION_END)
+
+            if end != -1:
+                self.section_closed = True
+                yield page[:end]
+                return
+            yield page
+
+    def records(self) -> Iterator[Tuple[str, Dict]]:
+        # Text after the last complete row of a page may be the start of a row
+        # wrapped onto the next page(s), so it is scanned again with them
+        carry = ""
+        for chunk in self._section_chunks():
+            text = carry + "\n" + chunk if carry else chunk
+            with metrics.timed("table_parsing"):
+                summaries, records, consumed = scan_usage_rows_until(text)
+            carry = text[consumed:]
+            for category, total_duration, total_amount in summaries:
+                if category in self.summaries:
+                    self.summaries[category] = {
+                        "total_duration": total_duration,
+                        "total_amount": float(total_amount)
+                    }
+            for date, call_time, to_number, duration, amount in records:
+                amount_float = float(amount)
+                category = classify_call(to_number, amount_float)
+                self.record_counts[category] += 1
+                yield category, {
+                    "date": date,
+                    "time": call_time,
+                    "to_number": to_number,
+                    "duration": duration,
+                    "amount": amount_float
+                }
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _stored_invoice(fields: Dict) -> Optional[int]:
+    """id of the invoices row for this account and period, read without locking it"""
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, pdf_name FROM invoices WHERE account_number = %s AND bill_period = %s "
+            "ORDER BY id DESC LIMIT 1",
+            (fields['account_number'], fields['bill_period'])
+        )
+        rows = cursor.fetchall()
+        return rows[0][0] if rows else None
+    finally:
+        release_connection(conn)
+
+def _spooled_chunks(spool) -> Iterator[list]:
+    spool.seek(0)
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
+
+def process_invoice_streaming(pdf_path: str, start_time: float = None,
+                              pdf_name: str = None, chunk_size: int = None,
+                              raise_transient: bool = False, backend: str = None,
+                              outbox: bool = None) -> bool:
+    """
+    Streaming counterpart of process_single_invoice. Returns True only if the
+    MySQL transaction commits and every MongoDB write succeeds.
+
+    The PDF is parsed, its usage buckets written and its usage_details rows
+    spooled to a temporary file before the transaction opens, so the
+    invoices row lock is only held while the spooled rows are inserted.
+    With the outbox (MONGO_OUTBOX=true) the main document is committed to
+    mongo_outbox with them and replicated in the background.
+    """
+    from pymongo import ReplaceOne
+    from pymongo.write_concern import WriteConcern
+    from mongo_outbox import OUTBOX_ENABLED, enqueue_document, ensure_outbox_table, start_relay
+    if outbox is None:
+        outbox = OUTBOX_ENABLED
+    pdf_name = pdf_name or os.path.basename(pdf_path)
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    run_id = uuid.uuid4().hex
+    mysql_conn = None
+    buckets = None
+
+    try:
+        with metrics.timed("pdf_open"):
+            pdf = get_backend(backend).open(pdf_path)
+        with tempfile.TemporaryFile() as spool:
+            with pdf:
+                stream = InvoiceStream(iter_page_texts(document_pages(pdf, pdf_path, backend)))
+                fields = stream.read_header()
+                if not all(fields.get(name) is not None for name in REQUIRED_FIELDS):
+                    logging.error(f"Data extraction failed for {pdf_name}: missing header fields")
+                    return False
+                if INVOICE_WRITE_MODE == "skip":
+                    invoice_id = _stored_invoice(fields)
+                    if invoice_id is not None:
+                        logging.info(f"Already stored, skipping {pdf_name} (MySQL ID: {invoice_id})")
+                        return True
+
+                db = get_mongodb_client()["invoices_db"].with_options(
+                    write_concern=WriteConcern(w=1, j=True))
+                buckets = db[MONGO_USAGE_COLLECTION]
+
+                parsed_dates = {}
+                bucket_count = 0
+                rollups = usage_rollups.RollupAccumulator() if usage_rollups.ROLLUPS_ENABLED else None
+                for chunk in _chunks(stream.records(), chunk_size):
+                    if rollups is not None:
+                        for category, record in chunk:
+                            rollups.add(category, record)
+                    # invoice_id is filled in once the invoices row is written
+                    pickle.dump([usage_row(None, category, record, parsed_dates) for category, record in chunk],
+                                spool, pickle.HIGHEST_PROTOCOL)
+                    with metrics.timed("mongodb_upsert"):
+                        buckets.bulk_write([ReplaceOne(
+                            {"_id": f"{pdf_name}:{run_id}:{bucket_count}"},
+                            {
+                                "invoice": pdf_name,
+                                "run_id": run_id,
+                                "bucket": bucket_count,
+                                "records": [dict(record, category=category) for category, record in chunk]
+                            },
+                            upsert=True
+                        )])
+                    bucket_count += 1
+
+            if not stream.section_closed:
+                logging.error(f"Data extraction failed for {pdf_name}: usage section not found")
+                raise _StreamAborted()
+
+            processing_time = time.time() - start_time if start_time else None
+            document = {
+                "_id": pdf_name,
+                "metadata": {
+                    "pdf_name": pdf_name,
+                    "processing_date": datetime.utcnow(),
+                    "pages_read": stream.pages_read
+                },
+                "invoice_data": fields,
+                "usage_data": {
+                    category: {
+                        "summary": stream.summaries[category],
+                        "record_count": stream.record_counts[category]
+                    }
+                    for category in CATEGORIES
+                },
+                "usage_storage": {
+                    "collection": MONGO_USAGE_COLLECTION,
+                    "run_id": run_id,
+                    "buckets": bucket_count
+                }
+            }
+            if outbox:
+                # Before the transaction: CREATE TABLE would commit it
+                ensure_outbox_table()
+
+            mysql_conn = get_mysql_connection()
+            mysql_conn.start_transaction()
+            cursor = mysql_conn.cursor()
+            with metrics.timed("mysql_insert"):
+                invoice_id, previous, action = write_invoice_row(cursor, fields, pdf_name, processing_time)
+                if action == "skipped":
+                    # Stored by another upload since the check above
+                    _abort(mysql_conn, buckets, pdf_name, run_id)
+                    logging.info(f"Already stored, skipping {pdf_name} (MySQL ID: {invoice_id})")
+                    return True
+                for rows in _spooled_chunks(spool):
+                    _insert_usage_rows(cursor, [(invoice_id,) + row[1:] for row in rows], chunk_size)
+        if rollups is not None:
+            with metrics.timed("rollups"):
+                usage_rollups.write_rollups(cursor, invoice_id, fields['account_number'], rollups)
+
+        # A re-upload under a new name replaces the document stored under the old one
+        stale_name = previous if previous and previous != pdf_name else None
+        if outbox:
+            # The relay drops buckets of earlier runs once this document is written
+            with metrics.timed("outbox_insert"):
+                enqueue_document(cursor, document, replaces=stale_name)
+            mysql_conn.commit()
+            start_relay()
+            logging.info(
+                f"Successfully streamed {pdf_name} (MySQL ID: {invoice_id}, "
+                f"{sum(stream.record_counts.values())} calls, {bucket_count} buckets, queued for MongoDB)"
+            )
+            return True
+
+        with metrics.timed("mongodb_upsert"):
+            result = db["etisalat_invoices"].update_one({"_id": pdf_name}, {"$set": document}, upsert=True)
+        if not result.acknowledged:
+            logging.error(f"MongoDB write unacknowledged for {pdf_name}")
+            raise _StreamAborted()
+
+        mysql_conn.commit()
+        # Buckets from earlier runs of the same invoice are now unreferenced
+        buckets.delete_many({"invoice": pdf_name, "run_id": {"$ne": run_id}})
+        if stale_name:
+            remove_mongo_invoice(get_mongodb_client(), stale_name)
+        logging.info(
+            f"Successfully streamed {pdf_name} "
+            f"(MySQL ID: {invoice_id}, {sum(stream.record_counts.values())} calls, {bucket_count} buckets)"
+        )
+        return True
+
+    except _StreamAborted:
+        _abort(mysql_conn, buckets, pdf_name, run_id)
+        return False
+    except Exception as e:
+        _abort(mysql_conn, buckets, pdf_name, run_id)
+        logging.error(f"Critical error streaming {pdf_name}: {str(e)}", exc_info=True)
+        if raise_transient and is_transient_error(e):
+            raise TransientStoreError(str(e)) from e
+        return False
+    finally:
+        release_connection(mysql_conn)
+
+def _abort(mysql_conn, buckets, pdf_name: str, run_id: str):
+    if mysql_conn and mysql_conn.is_connected():
+        mysql_conn.rollback()
+    if buckets is not None:
+        try:
+            buckets.delete_many({"invoice": pdf_name, "run_id": run_id})
+        except Exception as e:
+            logging.error(f"Could not remove partial usage buckets for {pdf_name}: {str(e)}")
@@ -0,0 +1,100 @@
+# invoice_verification.py
+"""
+Batched checks that processed invoices reached MySQL and MongoDB.
+
+Each store is asked once per batch of filenames (pdf_name IN (...) and a single
+find on _id $in) instead of once per file, so verifying a batch costs two
+round trips however many invoices it holds.
+"""
+import time
+import logging
+from typing import Dict, Iterable, List
+
+from etisalat_invoice import get_mysql_connection, release_connection, get_mongodb_client
+
+# Upper bound on filenames per IN (...) / $in query
+VERIFY_QUERY_CHUNK = 500
+
+def _chunks(names: List[str], size: int):
+    for start in range(0, len(names), size):
+        yield names[start:start + size]
+
+def verify_mysql_entries(filenames: Iterable[str], strict: bool = False) -> Dict[str, bool]:
+    """
+    pdf_name -> whether an invoices row exists. With strict=True the invoice
+    must also have at least one usage_details row.
+    """
+    names = list(dict.fromkeys(filenames))
+    found = set()
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        for chunk in _chunks(names, VERIFY_QUERY_CHUNK):
+            placeholders = ", ".join(["%s"] * len(chunk))
+            if strict:
+                query = (
+                    f"SELECT DISTINCT i.pdf_name FROM invoices i "
+                    f"WHERE i.pdf_name IN ({placeholders}) "
+                    f"AND EXISTS (SELECT 1 FROM usage_details u WHERE u.invoice_id = i.id)"
+                )
+            else:
+                query = f"SELECT DISTINCT pdf_name FROM invoices WHERE pdf_name IN ({placeholders})"
+            cursor.execute(query, chunk)
+            found.update(row[0] for row in cursor.fetchall())
+        cursor.close()
+    finally:
+        release_connection(conn)
+    return {name: name in found for name in names}
+
+def verify_mongodb_entries(filenames: Iterable[str]) -> Dict[str, bool]:
+    """pdf_name -> whether the etisalat_invoices document exists"""
+    names = list(dict.fromkeys(filenames))
+    collection = get_mongodb_client()["invoices_db"]["etisalat_invoices"]
+    found = set()
+    for chunk in _chunks(names, VERIFY_QUERY_CHUNK):
+        found.update(doc["_id"] for doc in collection.find({"_id": {"$in": chunk}}, {"_id": 1}))
+    return {name: name in found for name in names}
+
+def verify_invoices(filenames: Iterable[str], strict: bool = False,
+                    check_mongodb: bool = True) -> Dict[str, Dict]:
+    """
+    Per-file results: {"mysql": bool, "mongodb": bool, "verified": bool}.
+    A store that cannot be reached counts as not verified for every file.
+    """
+    names = list(dict.fromkeys(filenames))
+    if not names:
+        return {}
+
+    try:
+        mysql = verify_mysql_entries(names, strict=strict)
+    except Exception as e:
+        logging.error(f"MySQL verification error: {str(e)} | Files: {len(names)}")
+        mysql = dict.fromkeys(names, False)
+
+    if check_mongodb:
+        try:
+            mongodb = verify_mongodb_entries(names)
+        except Exception as e:
+            logging.error(f"MongoDB verification error: {str(e)} | Files: {len(names)}")
+            mongodb = dict.fromkeys(names, False)
+    else:
+        mongodb = dict.fromkeys(names, True)
+
+    return {
+        name: {"mysql": mysql[name], "mongodb": mongodb[name], "verified": mysql[name] and mongodb[name]}
+        for name in names
+    }
+
+def verify_with_retry(filenames: Iterable[str], attempts: int = 3, delay: float = 0.5,
+                      strict: bool = False, check_mongodb: bool = True) -> Dict[str, Dict]:
+    """verify_invoices, re-checking only the files not yet verified between attempts"""
+    results = {}
+    pending = list(dict.fromkeys(filenames))
+    for attempt in range(attempts):
+        if not pending:
+            break
+        if attempt:
+            time.sleep(delay)
+        results.update(verify_invoices(pending, strict=strict, check_mongodb=check_mongodb))
+        pending = [name for name in pending if not results[name]["verified"]]
+    return results
@@ -0,0 +1,311 @@
+# invoice_watcher.py
+"""
+Watch-folder ingestion daemon.
+
+    python invoice_watcher.py [folder] [--workers 4] [--settle 2]
+
+Watches the upload folder (inotify on Linux, directory polling elsewhere),
+waits until a new PDF has stopped changing for WATCH_SETTLE_SECONDS so files
+still being written by SFTP are left alone, then processes it in a bounded
+process pool. Stored invoices are moved to the processed folder; failures are
+recorded in the same manifest as process_invoices batch runs, retried with
+backoff and eventually dead-lettered.
+
+If a worker process dies, the pool is recreated and the files it was running
+are queued again without counting a failure. Each of them is then retried on
+its own, so a file that kills a worker a second time is the one recorded as
+failed.
+"""
+import os
+import time
+import signal
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Set
+
+from batch_manifest import BatchManifest, DONE, FAILED, DEAD_LETTER
+from process_invoices import (
+    process_one_invoice, checkpoint_result, MANIFEST_NAME, DEAD_LETTER_DIR,
+    DEFAULT_RETRIES, DEFAULT_MAX_FAILURES,
+)
+from pdf_backends import BACKENDS, PDF_BACKEND
+
+UPLOAD_FOLDER = 'invoices'
+PROCESSED_FOLDER = 'processed_invoices'
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", str(os.cpu_count() or 1)))
+# A file counts as complete once its size and mtime are unchanged this long
+WATCH_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", "2"))
+WATCH_POLL_SECONDS = float(os.getenv("WATCH_POLL_SECONDS", "1"))
+# Full rescan interval when inotify is in use, to catch anything it missed
+WATCH_RESCAN_SECONDS = float(os.getenv("WATCH_RESCAN_SECONDS", "60"))
+WATCH_RETRY_SECONDS = float(os.getenv("WATCH_RETRY_SECONDS", "30"))
+WATCH_USE_INOTIFY = os.getenv("WATCH_USE_INOTIFY", "true").lower() == "true"
+
+class _Inotify:
+    """Minimal inotify reader (Linux) reporting names written or moved into a folder"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, folder: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+
+    def read(self, timeout: float) -> Set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset + self._EVENT.size <= len(data):
+            _, _, _, length = self._EVENT.unpack_from(data, offset)
+            offset += self._EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+def _open_inotify(folder: str) -> Optional[_Inotify]:
+    if not WATCH_USE_INOTIFY or not hasattr(select, "select"):
+        return None
+    try:
+        return _Inotify(folder)
+    except (OSError, AttributeError) as e:
+        logging.warning(f"inotify unavailable, polling {folder} instead: {str(e)}")
+        return None
+
+class FolderWatcher:
+    def __init__(self, folder: str = UPLOAD_FOLDER, processed_folder: str = PROCESSED_FOLDER,
+                 workers: int = WATCH_WORKERS, settle_seconds: float = WATCH_SETTLE_SECONDS,
+                 poll_seconds: float = WATCH_POLL_SECONDS, streaming: bool = None,
+                 retries: int = DEFAULT_RETRIES, max_failures: int = DEFAULT_MAX_FAILURES,
+                 use_inotify: bool = True, backend: str = None):
+        self.folder = folder
+        self.processed_folder = processed_folder
+        self.dead_letter_dir = os.path.join(folder, DEAD_LETTER_DIR)
+        self.workers = max(workers, 1)
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.streaming = streaming
+        self.retries = retries
+        self.max_failures = max_failures
+        self.backend = backend
+        self.manifest = BatchManifest(os.path.join(folder, MANIFEST_NAME))
+        self.inotify = _open_inotify(folder) if use_inotify else None
+        self.stop_event = threading.Event()
+        # name -> (size, mtime, time the signature was first seen)
+        self._seen: Dict[str, tuple] = {}
+        # name -> (size, mtime, not before) for files that failed and were left in place
+        self._backoff: Dict[str, tuple] = {}
+        self._in_flight: Dict[str, tuple] = {}
+        # Files that were running when a worker process died, to be retried alone
+        self._crashed: Set[str] = set()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._candidates: Set[str] = set()
+        self._last_rescan = 0.0
+
+    def _scan(self):
+        with os.scandir(self.folder) as entries:
+            self._candidates.update(
+                entry.name for entry in entries
+                if entry.is_file() and entry.name.lower().endswith(".pdf")
+            )
+        self._last_rescan = time.time()
+
+    def _wait_for_changes(self):
+        """Collect candidate names from inotify, or rescan the folder when polling"""
+        timeout = min(self.poll_seconds, self.settle_seconds or self.poll_seconds)
+        if self.inotify is None:
+            self.stop_event.wait(timeout)
+            self._scan()
+            return
+        names = self.inotify.read(timeout)
+        self._candidates.update(name for name in names if name.lower().endswith(".pdf"))
+        if time.time() - self._last_rescan >= WATCH_RESCAN_SECONDS:
+            self._scan()
+
+    def ready_files(self, now: float = None) -> list:
+        """Candidates whose size and mtime have been stable for settle_seconds"""
+        now = now or time.time()
+        ready = []
+        for name in sorted(self._candidates):
+            if name in self._in_flight:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                self._candidates.discard(name)
+                self._seen.pop(name, None)
+                continue
+
+            signature = (stat.st_size, stat.st_mtime)
+            backoff = self._backoff.get(name)
+            if backoff and backoff[:2] == signature and now < backoff[2]:
+                continue
+
+            seen = self._seen.get(name)
+            if seen is None or seen[:2] != signature:
+                self._seen[name] = signature + (now,)
+                if self.settle_seconds > 0:
+                    continue
+                seen = self._seen[name]
+            if stat.st_size > 0 and now - seen[2] >= self.settle_seconds:
+                ready.append(name)
+        return ready
+
+    def _new_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def _submit(self, name: str):
+        path = os.path.join(self.folder, name)
+        content_hash = self.manifest.content_hash(name, path)
+        self._candidates.discard(name)
+        self._seen.pop(name, None)
+        if self.manifest.is_done(name, content_hash):
+            # Same bytes already stored: finish the move a previous run did not get to
+            checkpoint_result(self.manifest, self.folder, self.dead_letter_dir, name, content_hash,
+                              True, None, None, 0, self.max_failures, processed_dir=self.processed_folder)
+            return
+        try:
+            future = self._pool.submit(process_one_invoice, path, self.streaming, self.retries, self.backend)
+        except BrokenProcessPool:
+            # A worker died since the last submit; its files are requeued by _collect
+            logging.warning("Worker process died; restarting the process pool")
+            self._new_pool()
+            future = self._pool.submit(process_one_invoice, path, self.streaming, self.retries, self.backend)
+        self._in_flight[name] = (future, content_hash, time.time())
+
+    def _collect(self):
+        for name, (future, content_hash, started) in list(self._in_flight.items()):
+            if not future.done():
+                continue
+            del self._in_flight[name]
+            try:
+                success, reason, kind, attempts = future.result()
+            except BrokenProcessPool:
+                if name not in self._crashed:
+                    # Maybe another file killed the worker: retry this one alone
+                    self._crashed.add(name)
+                    self._candidates.add(name)
+                    logging.warning(f"Worker process died while {name} was in progress; requeued")
+                    continue
+                success, reason, kind, attempts = False, "worker process died while processing this file", "worker", 1
+            except Exception as e:
+                success, reason, kind, attempts = False, f"worker error: {str(e)}", "write", 1
+            self._crashed.discard(name)
+
+            try:
+                status = checkpoint_result(
+                    self.manifest, self.folder, self.dead_letter_dir, name, content_hash,
+                    success, reason, kind, attempts, self.max_failures, processed_dir=self.processed_folder
+                )
+            except OSError as e:
+                logging.error(f"Could not move {name} after processing: {str(e)}")
+                continue
+
+            elapsed = time.time() - started
+            if status != FAILED:
+                self._backoff.pop(name, None)
+            if status == DONE:
+                logging.info(f"Ingested {name} in {elapsed:.2f}s")
+            elif status == DEAD_LETTER:
+                logging.error(f"Dead-lettered {name}: {reason}")
+            else:
+                failures = self.manifest.failures(name, content_hash)
+                delay = min(WATCH_RETRY_SECONDS * 2 ** (failures - 1), 3600)
+                try:
+                    stat = os.stat(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    continue
+                self._backoff[name] = (stat.st_size, stat.st_mtime, time.time() + delay)
+                self._candidates.add(name)
+                logging.warning(f"Failed {name} ({reason}); retrying in {delay:.0f}s")
+
+    def run(self):
+        """Ingest until stop() is called or SIGTERM/SIGINT arrives"""
+        logging.info(
+            f"Watching {os.path.abspath(self.folder)} "
+            f"({'inotify' if self.inotify else 'polling'}, {self.workers} workers)"
+        )
+        self._scan()
+        self._new_pool()
+        try:
+            while not self.stop_event.is_set():
+                self._collect()
+                # Bounded: never more files in flight than workers
+                for name in self.ready_files():
+                    if len(self._in_flight) >= self.workers or self._crashed & self._in_flight.keys():
+                        break
+                    if name in self._crashed and self._in_flight:
+                        continue
+                    self._submit(name)
+                self._wait_for_changes()
+
+            logging.info(f"Stopping; waiting for {len(self._in_flight)} invoices in progress")
+            while self._in_flight:
+                time.sleep(0.1)
+                self._collect()
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        if self.inotify is not None:
+            self.inotify.close()
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Continuously ingest PDFs dropped into a folder")
+    parser.add_argument("folder", nargs="?", default=UPLOAD_FOLDER,
+                        help=f"folder to watch (default: {UPLOAD_FOLDER})")
+    parser.add_argument("--processed-folder", default=PROCESSED_FOLDER,
+                        help=f"where stored invoices are moved (default: {PROCESSED_FOLDER})")
+    parser.add_argument("--workers", type=int, default=WATCH_WORKERS,
+                        help="invoices processed concurrently (default: CPU count)")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE_SECONDS,
+                        help="seconds a file must stop changing before it is processed")
+    parser.add_argument("--poll", type=float, default=WATCH_POLL_SECONDS,
+                        help="polling interval when inotify is unavailable")
+    parser.add_argument("--no-inotify", dest="inotify", action="store_false",
+                        help="always poll the folder")
+    parser.add_argument("--streaming", action="store_true", default=None,
+                        help="stream every invoice (default: only PDFs over STREAMING_MIN_BYTES)")
+    parser.add_argument("--pdf-backend", choices=sorted(BACKENDS), default=PDF_BACKEND,
+                        help=f"PDF text extraction backend (default: {PDF_BACKEND})")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    args = parse_args()
+    os.makedirs(args.folder, exist_ok=True)
+    watcher = FolderWatcher(args.folder, args.processed_folder, workers=args.workers,
+                            settle_seconds=args.settle, poll_seconds=args.poll,
+                            streaming=args.streaming, use_inotify=args.inotify,
+                            backend=args.pdf_backend)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    watcher.run()
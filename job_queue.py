@@ -0,0 +1,272 @@
+# job_queue.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    owner_pid INTEGER,
+    owner_token TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _boot_id() -> str:
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def _start_time(pid: int) -> str:
+    """Start time of pid in clock ticks since boot ('' where /proc is unavailable)"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return ""
+    # Field 22; the command name before it is in parentheses and may contain spaces
+    return stat[stat.rindex(")") + 2:].split()[19]
+
+def process_token(pid: int = None) -> str:
+    """boot id:pid:start time, unique to one process even after its pid is reused"""
+    pid = pid or os.getpid()
+    return f"{_boot_id()}:{pid}:{_start_time(pid)}"
+
+def _owner_alive(token: str) -> bool:
+    boot_id, pid, start_time = token.rsplit(":", 2)
+    if boot_id != _boot_id():
+        return False
+    if start_time:
+        return _start_time(int(pid)) == start_time
+    return _pid_alive(int(pid))
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a bounded worker pool.
+
+    Jobs are rows in a local SQLite file, so queued work survives a worker
+    restart: on start, jobs left 'running' by a process that no longer exists
+    are put back in the queue, or failed once they have been claimed
+    max_attempts times. Claims record a process token (boot id, pid and
+    process start time) rather than a bare pid, so a reused pid does not
+    keep an orphan alive. The handler receives the job payload dict and
+    returns a result dict; a truthy result['success'] marks the job done,
+    anything else (or an exception) marks it failed.
+
+    mode='thread' runs the handler on the worker threads. mode='process' has
+    each worker thread hand the handler to a process pool, which requires the
+    handler to be a picklable module-level function.
+    """
+
+    def __init__(self, db_path: str, handler: Callable[[Dict], Dict],
+                 workers: int = 2, mode: str = "thread", poll_interval: float = 1.0,
+                 max_attempts: int = 3):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown job worker mode: {mode}")
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._executor = None
+        self._started_pid = None
+        self._owner_token = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner_token" not in columns:
+                # Queue files created before owner tokens
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner_token TEXT")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def start(self):
+        """Start the worker pool in this process (idempotent, fork-aware)"""
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+            self._owner_token = process_token()
+            self._stopping = False
+            self._threads = []
+            self._requeue_orphans()
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._started_pid = None
+
+    def enqueue(self, payload: Dict) -> str:
+        job_id = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(payload), time.time())
+            )
+        self.start()
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        started_at, finished_at = row["started_at"], row["finished_at"]
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "created_at": row["created_at"],
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "queued_seconds": round((started_at or now) - row["created_at"], 3),
+            "run_seconds": round((finished_at or now) - started_at, 3) if started_at else None,
+        }
+
+    def counts(self) -> Dict[str, int]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def _requeue_orphans(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, owner_pid, owner_token, attempts FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            for row in rows:
+                if row["owner_token"]:
+                    alive = _owner_alive(row["owner_token"])
+                else:
+                    alive = row["owner_pid"] is not None and _pid_alive(row["owner_pid"])
+                if alive:
+                    continue
+                if row["attempts"] >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                        "WHERE id = ? AND status = 'running'",
+                        (f"Abandoned by its worker after {row['attempts']} attempts", time.time(), row["id"])
+                    )
+                    logging.error(f"Failed job {row['id']}: abandoned by its worker after {row['attempts']} attempts")
+                    continue
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner_pid = NULL, owner_token = NULL "
+                    "WHERE id = ? AND status = 'running'",
+                    (row["id"],)
+                )
+                logging.warning(f"Requeued job {row['id']} abandoned by pid {row['owner_pid']}")
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', owner_pid = ?, owner_token = ?, started_at = ?, "
+                    "finished_at = NULL, attempts = attempts + 1 WHERE id = ?",
+                    (os.getpid(), self._owner_token, time.time(), row["id"])
+                )
+            conn.execute("COMMIT")
+            return row
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, job_id: str, status: str, result: Dict = None, error: str = None):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def _worker_loop(self):
+        while not self._stopping:
+            try:
+                row = self._claim_next()
+            except sqlite3.Error as e:
+                logging.error(f"Job queue claim failed: {str(e)}")
+                row = None
+
+            if row is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            payload = json.loads(row["payload"])
+            try:
+                if self._executor is not None:
+                    result = self._executor.submit(self.handler, payload).result()
+                else:
+                    result = self.handler(payload)
+                status = "done" if result and result.get("success") else "failed"
+                self._finish(row["id"], status, result=result)
+            except Exception as e:
+                logging.error(f"Job {row['id']} crashed: {str(e)}", exc_info=True)
+                self._finish(row["id"], "failed", error=str(e))
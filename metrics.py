@@ -0,0 +1,163 @@
+# metrics.py
+import os
+import time
+import cProfile
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List
+
+from structured_logging import log_context
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGES = (
+    "pdf_open",
+    "text_extraction",
+    "field_regexes",
+    "table_parsing",
+    "mysql_insert",
+    "mongodb_upsert",
+    "outbox_insert",
+    "rollups",
+    "verification",
+    "invoice_total",
+)
+
+# cProfile dumps for invoices slower than this many seconds (0 disables)
+PROFILE_SLOW_SECONDS = float(os.getenv("PROFILE_SLOW_SECONDS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+class StageHistograms:
+    """Thread-safe duration histograms, one per pipeline stage"""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _new_stage(self) -> Dict:
+        return {"buckets": [0] * (len(self.buckets) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            data = self._stages.get(stage)
+            if data is None:
+                data = self._stages[stage] = self._new_stage()
+            data["buckets"][bisect_left(self.buckets, seconds)] += 1
+            data["count"] += 1
+            data["sum"] += seconds
+            data["max"] = max(data["max"], seconds)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                stage: {"buckets": list(d["buckets"]), "count": d["count"], "sum": d["sum"], "max": d["max"]}
+                for stage, d in self._stages.items()
+            }
+
+    def merge(self, snapshot: Dict):
+        """Add observations recorded elsewhere (e.g. in a pool process)"""
+        with self._lock:
+            for stage, other in snapshot.items():
+                data = self._stages.get(stage)
+                if data is None:
+                    data = self._stages[stage] = self._new_stage()
+                data["buckets"] = [a + b for a, b in zip(data["buckets"], other["buckets"])]
+                data["count"] += other["count"]
+                data["sum"] += other["sum"]
+                data["max"] = max(data["max"], other["max"])
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+stage_histograms = StageHistograms()
+
+def observe(stage: str, seconds: float):
+    stage_histograms.observe(stage, seconds)
+
+@contextmanager
+def timed(stage: str):
+    """
+    Record the duration of the enclosed block under the given stage. Records
+    logged in the block, or for an exception raised out of it, carry the stage.
+    """
+    start = time.perf_counter()
+    try:
+        with log_context(stage=stage):
+            yield
+    except Exception as e:
+        if not hasattr(e, "log_stage"):
+            e.log_stage = stage
+        raise
+    finally:
+        stage_histograms.observe(stage, time.perf_counter() - start)
+
+@contextmanager
+def profile_if_slow(label: str, threshold: float = None):
+    """
+    Profile the enclosed block with cProfile and write the stats to
+    PROFILE_DIR when it takes longer than threshold seconds.
+    """
+    threshold = PROFILE_SLOW_SECONDS if threshold is None else threshold
+    if threshold <= 0:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        if elapsed > threshold:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            safe_label = "".join(c if c.isalnum() or c in "._-" else "_" for c in label)
+            path = os.path.join(PROFILE_DIR, f"{safe_label}_{int(time.time() * 1000)}.prof")
+            try:
+                profiler.dump_stats(path)
+                logging.warning(f"Slow invoice {label} took {elapsed:.2f}s, profile written to {path}")
+            except OSError as e:
+                logging.error(f"Could not write profile for {label}: {str(e)}")
+
+def _format_le(bound: float) -> str:
+    return repr(float(bound))
+
+def render_prometheus(extra_lines: List[str] = None) -> str:
+    """Prometheus text exposition of the stage histograms"""
+    name = "invoice_stage_duration_seconds"
+    lines = [
+        f"# HELP {name} Time spent in each invoice processing stage.",
+        f"# TYPE {name} histogram",
+    ]
+    buckets = stage_histograms.buckets
+    for stage, data in sorted(stage_histograms.snapshot().items()):
+        cumulative = 0
+        for bound, count in zip(buckets, data["buckets"]):
+            cumulative += count
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{_format_le(bound)}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {data["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {data["sum"]}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {data["count"]}')
+    if extra_lines:
+        lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+def format_summary() -> str:
+    """Human readable per-stage table for the end of a batch run"""
+    snapshot = stage_histograms.snapshot()
+    if not snapshot:
+        return "No stage timings recorded"
+
+    order = [s for s in STAGES if s in snapshot] + sorted(s for s in snapshot if s not in STAGES)
+    lines = [f"{'Stage':<18}{'Count':>8}{'Total s':>11}{'Avg s':>9}{'Max s':>9}"]
+    for stage in order:
+        data = snapshot[stage]
+        avg = data["sum"] / data["count"] if data["count"] else 0.0
+        lines.append(f"{stage:<18}{data['count']:>8}{data['sum']:>11.2f}{avg:>9.3f}{data['max']:>9.3f}")
+    return "\n".join(lines)
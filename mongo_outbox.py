@@ -0,0 +1,420 @@
+# mongo_outbox.py
+"""
+Transactional outbox that takes MongoDB off the invoice write path.
+
+With MONGO_OUTBOX=true, store_invoice commits the MySQL rows together with a
+mongo_outbox row holding the finished MongoDB document. A background relay
+then drains pending rows to MongoDB in ordered bulk_write upserts, retrying
+with exponential backoff, and stamps them replicated. MongoDB ends up with
+the same documents as before, just eventually rather than synchronously.
+
+Every worker process runs a relay, but a MySQL named lock lets only one of
+them replicate at a time, so rows reach MongoDB in id order and an older
+document for a file can never overwrite a newer one. A row that keeps
+failing on its own (e.g. a document over MongoDB's 16MB limit) is parked
+after OUTBOX_MAX_ATTEMPTS tries instead of holding up the rows behind it.
+Parked rows are listed and given a fresh set of attempts from the command line:
+
+    python mongo_outbox.py parked
+    python mongo_outbox.py requeue [--pdf-name NAME]
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+from etisalat_invoice import get_mysql_connection, release_connection, get_mongodb_client
+from invoice_streaming import MONGO_USAGE_COLLECTION
+
+OUTBOX_ENABLED = os.getenv("MONGO_OUTBOX", "false").lower() == "true"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "60"))
+# Rows failing this many times are parked: left unreplicated and skipped
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+RELAY_LOCK_NAME = "mongo_outbox_relay"
+# Replicated rows are deleted after this many hours
+OUTBOX_RETENTION_HOURS = int(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+
+OUTBOX_DDL = """
+    CREATE TABLE IF NOT EXISTS mongo_outbox (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        pdf_name VARCHAR(255) NOT NULL,
+        payload LONGTEXT NOT NULL,
+        created_at DATETIME(6) NOT NULL,
+        replicated_at DATETIME(6) NULL,
+        attempts INT NOT NULL DEFAULT 0,
+        last_error TEXT NULL,
+        KEY idx_outbox_pending (replicated_at, id)
+    )
+    """
+
+_table_ready = False
+
+def ensure_outbox_table():
+    """Create the outbox table if needed; checked once per process"""
+    global _table_ready
+    if _table_ready:
+        return
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(OUTBOX_DDL)
+        conn.commit()
+        cursor.close()
+    finally:
+        release_connection(conn)
+    _table_ready = True
+
+def enqueue_document(cursor, document: Dict, replaces: str = None):
+    """
+    Add a MongoDB document to the outbox inside the caller's transaction.
+    replaces names a document (and its usage buckets) to delete once it is written.
+    Call ensure_outbox_table() before opening that transaction: DDL would
+    commit it implicitly.
+    """
+    from bson import json_util
+    cursor.execute(
+        "INSERT INTO mongo_outbox (pdf_name, payload, created_at) VALUES (%s, %s, NOW(6))",
+        (document["_id"], json_util.dumps({"document": document, "replaces": replaces}))
+    )
+
+def _write_entries(db, entries: list):
+    """Apply outbox entries to MongoDB in order"""
+    from pymongo import DeleteOne, UpdateOne
+    operations = []
+    replaced = []
+    # Latest streaming run per invoice in this batch
+    streamed = {}
+    for entry in entries:
+        document = entry["document"]
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": document}, upsert=True))
+        if entry.get("replaces"):
+            operations.append(DeleteOne({"_id": entry["replaces"]}))
+            replaced.append(entry["replaces"])
+        if "usage_storage" in document:
+            streamed[document["_id"]] = document["usage_storage"]["run_id"]
+    result = db["etisalat_invoices"].bulk_write(operations, ordered=True)
+    if not result.acknowledged:
+        raise RuntimeError("MongoDB bulk write unacknowledged")
+    if replaced:
+        db[MONGO_USAGE_COLLECTION].delete_many({"invoice": {"$in": replaced}})
+    # Buckets of earlier streaming runs are unreferenced once the new document is written
+    for pdf_name, run_id in streamed.items():
+        db[MONGO_USAGE_COLLECTION].delete_many({"invoice": pdf_name, "run_id": {"$ne": run_id}})
+
+def relay_batch(batch_size: int = None) -> Optional[int]:
+    """
+    Replicate up to batch_size pending outbox rows to MongoDB, oldest first.
+    Returns the number of rows replicated, or None if another relay holds
+    the relay lock. Raises if no row of the batch could be written.
+    """
+    from bson import json_util
+    from pymongo.errors import ConnectionFailure
+    from pymongo.write_concern import WriteConcern
+    batch_size = batch_size or OUTBOX_BATCH_SIZE
+    conn = get_mysql_connection()
+    locked = False
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (RELAY_LOCK_NAME,))
+        locked = cursor.fetchone()[0] == 1
+        if not locked:
+            return None
+
+        cursor.execute(
+            "SELECT id, pdf_name, payload FROM mongo_outbox "
+            "WHERE replicated_at IS NULL AND attempts < %s ORDER BY id LIMIT %s",
+            (OUTBOX_MAX_ATTEMPTS, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        db = get_mongodb_client()["invoices_db"].with_options(write_concern=WriteConcern(w=1, j=True))
+        entries = [json_util.loads(payload) for _, _, payload in rows]
+        try:
+            _write_entries(db, entries)
+            replicated = [row[0] for row in rows]
+        except ConnectionFailure:
+            # MongoDB is unreachable: nothing is wrong with the rows themselves
+            raise
+        except Exception as e:
+            # Find the failing rows one at a time. Later rows for a file whose
+            # write failed wait, so they cannot be overtaken by the retry.
+            logging.warning(f"Outbox batch failed, replicating row by row: {str(e)}")
+            replicated = []
+            blocked = set()
+            last_error = e
+            for (row_id, pdf_name, _), entry in zip(rows, entries):
+                if pdf_name in blocked:
+                    continue
+                try:
+                    _write_entries(db, [entry])
+                    replicated.append(row_id)
+                except ConnectionFailure:
+                    raise
+                except Exception as row_error:
+                    blocked.add(pdf_name)
+                    last_error = row_error
+                    _record_failure(conn, row_id, pdf_name, str(row_error))
+            if not replicated:
+                raise last_error
+
+        placeholders = ", ".join(["%s"] * len(replicated))
+        cursor.execute(
+            f"UPDATE mongo_outbox SET replicated_at = NOW(6), attempts = attempts + 1, last_error = NULL "
+            f"WHERE id IN ({placeholders})",
+            replicated
+        )
+        conn.commit()
+        return len(replicated)
+
+    finally:
+        if locked and conn.is_connected():
+            try:
+                conn.cursor().execute("SELECT RELEASE_LOCK(%s)", (RELAY_LOCK_NAME,))
+            except Exception as e:
+                logging.error(f"Could not release the outbox relay lock: {str(e)}")
+        release_connection(conn)
+
+def _record_failure(conn, row_id: int, pdf_name: str, error: str):
+    """Count a failed attempt; a row reaching OUTBOX_MAX_ATTEMPTS is parked"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE mongo_outbox SET attempts = attempts + 1, last_error = %s WHERE id = %s",
+            (error[:1000], row_id)
+        )
+        conn.commit()
+        cursor.execute("SELECT attempts FROM mongo_outbox WHERE id = %s", (row_id,))
+        row = cursor.fetchone()
+        if row and row[0] >= OUTBOX_MAX_ATTEMPTS:
+            logging.error(f"Outbox row {row_id} for {pdf_name} parked after {row[0]} attempts: {error}")
+    except Exception as e:
+        logging.error(f"Could not record outbox failure: {str(e)}")
+
+def parked_rows(limit: int = 100) -> List[Dict]:
+    """Rows left unreplicated after OUTBOX_MAX_ATTEMPTS failures, oldest first"""
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id, pdf_name, attempts, last_error FROM mongo_outbox "
+            "WHERE replicated_at IS NULL AND attempts >= %s ORDER BY id LIMIT %s",
+            (OUTBOX_MAX_ATTEMPTS, limit)
+        )
+        return [
+            {"id": row_id, "pdf_name": pdf_name, "attempts": attempts, "last_error": last_error}
+            for row_id, pdf_name, attempts, last_error in cursor.fetchall()
+        ]
+    finally:
+        release_connection(conn)
+
+def requeue_parked(pdf_name: str = None) -> int:
+    """
+    Reset the attempts of parked rows (all of them, or one file's) so the
+    relay retries them. A parked row with a newer row for the same file is
+    retired instead: replaying it would overwrite the newer document.
+    Returns the number of rows requeued.
+    """
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        query = "SELECT id, pdf_name FROM mongo_outbox WHERE replicated_at IS NULL AND attempts >= %s"
+        params = [OUTBOX_MAX_ATTEMPTS]
+        if pdf_name:
+            query += " AND pdf_name = %s"
+            params.append(pdf_name)
+        cursor.execute(query, params)
+        parked = cursor.fetchall()
+        if not parked:
+            return 0
+
+        names = sorted({name for _, name in parked})
+        placeholders = ", ".join(["%s"] * len(names))
+        cursor.execute(
+            f"SELECT pdf_name, MAX(id) FROM mongo_outbox WHERE pdf_name IN ({placeholders}) GROUP BY pdf_name",
+            names
+        )
+        newest = dict(cursor.fetchall())
+        requeued = [row_id for row_id, name in parked if row_id == newest[name]]
+        superseded = [row_id for row_id, name in parked if row_id != newest[name]]
+        if requeued:
+            placeholders = ", ".join(["%s"] * len(requeued))
+            cursor.execute(f"UPDATE mongo_outbox SET attempts = 0 WHERE id IN ({placeholders})", requeued)
+        if superseded:
+            # Stamped so purge_replicated removes them; last_error is kept
+            placeholders = ", ".join(["%s"] * len(superseded))
+            cursor.execute(f"UPDATE mongo_outbox SET replicated_at = NOW(6) WHERE id IN ({placeholders})",
+                           superseded)
+        conn.commit()
+        logging.info(f"Requeued {len(requeued)} parked outbox rows, retired {len(superseded)} superseded")
+    finally:
+        release_connection(conn)
+    if requeued and _relay is not None:
+        _relay.notify()
+    return len(requeued)
+
+def purge_replicated(limit: int = 1000) -> int:
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM mongo_outbox WHERE replicated_at < NOW(6) - INTERVAL %s HOUR LIMIT %s",
+            (OUTBOX_RETENTION_HOURS, limit)
+        )
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        release_connection(conn)
+
+def replication_status() -> Dict:
+    """Pending rows and replication lag (age of the oldest unreplicated row)"""
+    conn = get_mysql_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*), TIMESTAMPDIFF(MICROSECOND, MIN(created_at), NOW(6)), MAX(attempts) "
+            "FROM mongo_outbox WHERE replicated_at IS NULL AND attempts < %s",
+            (OUTBOX_MAX_ATTEMPTS,)
+        )
+        pending, lag_us, max_attempts = cursor.fetchone()
+        cursor.execute(
+            "SELECT COUNT(*) FROM mongo_outbox WHERE replicated_at IS NULL AND attempts >= %s",
+            (OUTBOX_MAX_ATTEMPTS,)
+        )
+        parked = cursor.fetchone()[0]
+        return {
+            "pending": pending,
+            "parked": parked,
+            "lag_seconds": (lag_us or 0) / 1_000_000,
+            "max_attempts": max_attempts or 0,
+        }
+    finally:
+        release_connection(conn)
+
+class OutboxRelay:
+    """Background thread draining the outbox, with exponential backoff on failure"""
+
+    def __init__(self, batch_size: int = None, poll_seconds: float = None):
+        self.batch_size = batch_size or OUTBOX_BATCH_SIZE
+        self.poll_seconds = poll_seconds or OUTBOX_POLL_SECONDS
+        self.replicated = 0
+        self.failures = 0
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="mongo-outbox-relay", daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self, timeout: float = None):
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def drain(self, timeout: float = 300) -> bool:
+        """Replicate until the outbox is empty; returns False if it could not"""
+        deadline = time.time() + timeout
+        backoff = self.poll_seconds
+        while time.time() < deadline:
+            try:
+                count = relay_batch(self.batch_size)
+                if count == 0:
+                    return True
+                if count is None:
+                    # Another process is relaying; wait for it
+                    time.sleep(self.poll_seconds)
+                backoff = self.poll_seconds
+            except Exception as e:
+                logging.error(f"Outbox drain failed, retrying in {backoff:.1f}s: {str(e)}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF_SECONDS)
+        return False
+
+    def _run(self):
+        backoff = self.poll_seconds
+        last_purge = 0.0
+        while not self._stopping:
+            try:
+                count = relay_batch(self.batch_size)
+                backoff = self.poll_seconds
+                if count:
+                    self.replicated += count
+                    continue
+                if time.time() - last_purge > 3600:
+                    purge_replicated()
+                    last_purge = time.time()
+                wait = self.poll_seconds
+            except Exception as e:
+                self.failures += 1
+                logging.error(f"Outbox relay failed, retrying in {backoff:.1f}s: {str(e)}")
+                wait = backoff
+                backoff = min(backoff * 2, OUTBOX_MAX_BACKOFF_SECONDS)
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+_relay = None
+_relay_lock = threading.Lock()
+
+def _reset_relay_after_fork():
+    global _relay, _relay_lock
+    _relay = None
+    _relay_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_relay_after_fork)
+
+def start_relay() -> OutboxRelay:
+    """Start (once per process) and wake the background relay"""
+    global _relay
+    if _relay is None:
+        with _relay_lock:
+            if _relay is None:
+                ensure_outbox_table()
+                _relay = OutboxRelay()
+                _relay.start()
+    _relay.notify()
+    return _relay
+
+def get_relay():
+    return _relay
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and retry the MongoDB outbox")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="pending and parked rows, and the replication lag")
+    parked = commands.add_parser("parked", help="list rows parked after OUTBOX_MAX_ATTEMPTS failures")
+    parked.add_argument("--limit", type=int, default=100)
+    requeue = commands.add_parser("requeue", help="give parked rows a fresh set of attempts")
+    requeue.add_argument("--pdf-name", help="only this file's rows")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = parse_args(argv)
+
+    if args.command == "status":
+        status = replication_status()
+        print(f"{status['pending']} pending, {status['parked']} parked, "
+              f"lag {status['lag_seconds']:.1f}s")
+    elif args.command == "parked":
+        for row in parked_rows(args.limit):
+            print(f"{row['id']:>10}  {row['pdf_name']}  attempts={row['attempts']}  {row['last_error']}")
+    elif args.command == "requeue":
+        count = requeue_parked(args.pdf_name)
+        print(f"Requeued {count} parked rows; the relay retries them on its next pass")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
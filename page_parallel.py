@@ -0,0 +1,155 @@
+# page_parallel.py
+"""
+Page-level parallel text extraction for single oversized PDFs.
+
+Batch runs already spread files across cores, but one invoice with hundreds
+of pages of itemised calls is extracted on one core. For PDFs of at least
+PARALLEL_PAGE_THRESHOLD pages, parallel_pages() splits the page range into
+chunks, extracts them in a shared process pool and yields the pages back in
+order. It is a drop-in replacement for pdf.pages in read_invoice_pages and the
+streaming reader, so early termination still applies: chunks not yet started
+when the reader stops are cancelled.
+
+Processes that are themselves pool workers (batch runs, the watcher, process
+mode jobs) always extract sequentially, so pools are never nested.
+"""
+import io
+import os
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional
+
+from pdf_backends import get_backend
+
+# Page count from which a single PDF is extracted in parallel (0 disables)
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("PARALLEL_PAGE_THRESHOLD", "150"))
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.getenv("PAGES_PER_TASK", "16"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _reset_pool_after_fork():
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: the caller is usually a threaded web worker, where fork is unsafe
+                _pool = ProcessPoolExecutor(max_workers=PAGE_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    """Drop a broken pool so the next document starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+def should_parallelize(total_pages: int) -> bool:
+    return (
+        PARALLEL_PAGE_THRESHOLD > 0
+        and total_pages >= PARALLEL_PAGE_THRESHOLD
+        and PAGE_WORKERS > 1
+        and multiprocessing.parent_process() is None
+    )
+
+def pool_source(source):
+    """What a pool process can reopen: the path, or the bytes of an in-memory PDF"""
+    if isinstance(source, (str, bytes)):
+        return source
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return None
+
+def _extract_page_range(source, backend: str, start: int, stop: int) -> List[str]:
+    """Runs in a pool process: text of pages [start, stop)"""
+    texts = []
+    with get_backend(backend).open(io.BytesIO(source) if isinstance(source, bytes) else source) as pdf:
+        for index in range(start, stop):
+            page = pdf.pages[index]
+            texts.append(page.extract_text() or "")
+            if hasattr(page, "close"):
+                page.close()
+    return texts
+
+class _PooledPage:
+    """One page of a chunk extracted in the pool; extract_text waits for the chunk"""
+    __slots__ = ("_pool", "_future", "_offset")
+
+    def __init__(self, pool: ProcessPoolExecutor, future, offset: int):
+        self._pool = pool
+        self._future = future
+        self._offset = offset
+
+    def extract_text(self) -> str:
+        try:
+            return self._future.result()[self._offset]
+        except BrokenProcessPool:
+            _discard_pool(self._pool)
+            raise
+
+    def close(self):
+        pass
+
+def parallel_pages(source, total_pages: int, backend: str = None,
+                   pages_per_task: int = None, workers: int = None) -> Iterator[_PooledPage]:
+    """
+    Pages of the PDF in order, extracted in the page pool. At most two chunks
+    per worker are in flight, so memory stays bounded; close the generator to
+    cancel the chunks not yet started.
+    """
+    payload = pool_source(source)
+    if payload is None:
+        raise ValueError("Parallel extraction needs a path or an in-memory PDF")
+    backend = get_backend(backend).name
+    pages_per_task = max(pages_per_task or PAGES_PER_TASK, 1)
+    window = 2 * max(workers or PAGE_WORKERS, 1)
+    pool = _get_pool()
+    ranges = deque((start, min(start + pages_per_task, total_pages))
+                   for start in range(0, total_pages, pages_per_task))
+    in_flight = deque()
+    logging.info(f"Extracting {total_pages} pages in {len(ranges)} chunks across the page pool")
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < window:
+                start, stop = ranges.popleft()
+                in_flight.append((pool.submit(_extract_page_range, payload, backend, start, stop), stop - start))
+            future, count = in_flight.popleft()
+            for offset in range(count):
+                yield _PooledPage(pool, future, offset)
+    finally:
+        for future, _ in in_flight:
+            future.cancel()
+
+def document_pages(pdf, source, backend: str = None, parallel: Optional[bool] = None):
+    """
+    pdf.pages, or the same pages extracted in the pool when parallel is True
+    (or None and the document reaches PARALLEL_PAGE_THRESHOLD). Close the
+    result if it has a close() once done reading.
+    """
+    total_pages = len(pdf.pages)
+    if parallel is None:
+        parallel = should_parallelize(total_pages)
+    if parallel and pool_source(source) is not None:
+        return parallel_pages(source, total_pages, backend)
+    return pdf.pages
@@ -0,0 +1,116 @@
+# pdf_backends.py
+"""
+Text extraction backends for invoice PDFs.
+
+A backend's open(source) returns a context manager with a `pages` sequence;
+each page has extract_text() and close(), which is the subset of pdfplumber
+the pipeline uses. Choose one per run with PDF_BACKEND or --pdf-backend.
+
+Backends import their PDF library on first use, so processes that never
+open a PDF do not pay for it; warm() loads one up front.
+
+- pdfplumber: character-level layout analysis (the reference output)
+- pypdfium2: PDFium's text layer, one to two orders of magnitude faster.
+  Check it against pdfplumber on your own invoices with
+  benchmarks/compare_backends.py before switching.
+"""
+import os
+import threading
+from typing import Dict
+
+PDF_BACKEND = os.getenv("PDF_BACKEND", "pdfplumber")
+
+class PdfplumberBackend:
+    name = "pdfplumber"
+
+    def open(self, source):
+        import pdfplumber
+        return pdfplumber.open(source)
+
+    def warm(self):
+        import pdfplumber  # noqa: F401
+
+# PDFium is not thread-safe, so every call into it goes through this lock
+_pdfium_lock = threading.Lock()
+
+class _PdfiumPage:
+    def __init__(self, document, index: int):
+        self._document = document
+        self._index = index
+
+    def extract_text(self) -> str:
+        with _pdfium_lock:
+            page = self._document[self._index]
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+        return text.replace("\r\n", "\n")
+
+    def close(self):
+        pass
+
+class _PdfiumPages:
+    def __init__(self, document):
+        self._document = document
+
+    def __len__(self):
+        return len(self._document)
+
+    def __getitem__(self, index: int) -> _PdfiumPage:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return _PdfiumPage(self._document, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield _PdfiumPage(self._document, index)
+
+class _PdfiumDocument:
+    def __init__(self, source):
+        import pypdfium2
+        with _pdfium_lock:
+            self._document = pypdfium2.PdfDocument(source)
+        self.pages = _PdfiumPages(self._document)
+
+    def close(self):
+        with _pdfium_lock:
+            self._document.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class Pypdfium2Backend:
+    name = "pypdfium2"
+
+    def open(self, source):
+        try:
+            return _PdfiumDocument(source)
+        except ImportError:
+            raise RuntimeError("The pypdfium2 backend needs the pypdfium2 package (pip install pypdfium2)")
+
+    def warm(self):
+        import pypdfium2  # noqa: F401
+
+BACKENDS = {backend.name: backend for backend in (PdfplumberBackend, Pypdfium2Backend)}
+_instances: Dict[str, object] = {}
+
+def get_backend(name: str = None):
+    """Backend instance by name; defaults to PDF_BACKEND"""
+    name = (name or PDF_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{name}' (choose from {', '.join(sorted(BACKENDS))})")
+    if name not in _instances:
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+def warm(name: str = None):
+    """Import a backend's PDF library now, e.g. in a preloading server master"""
+    get_backend(name).warm()
@@ -1,40 +1,390 @@
 # process_invoices.py
 import os
 import time
+import queue
+import random
+import shutil
+import logging
+import argparse
 from datetime import datetime
-from etisalat_invoice import process_single_invoice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from etisalat_invoice import extract_invoice_data, store_invoice, TransientStoreError
+from invoice_streaming import process_invoice_streaming, should_stream
+from mongo_outbox import OUTBOX_ENABLED, get_relay
+from batch_manifest import BatchManifest, DONE, FAILED, DEAD_LETTER
+from pdf_backends import BACKENDS, PDF_BACKEND
+import metrics
+
+DEFAULT_DB_WRITERS = 2
+MANIFEST_NAME = ".batch_manifest.jsonl"
+DEAD_LETTER_DIR = "dead_letter"
+# Transient DB errors are retried this many times per run, backing off exponentially
+DEFAULT_RETRIES = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+# Files failing this many runs in a row (or failing extraction once) are dead-lettered
+DEFAULT_MAX_FAILURES = 3
+
+def _with_retries(func, retries: int):
+    """
+    Call func, retrying TransientStoreError with exponential backoff and jitter.
+    Returns (result, attempts); re-raises once the retries are used up.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func(), attempt
+        except TransientStoreError as e:
+            if attempt > retries:
+                raise
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+            delay *= random.uniform(0.5, 1.0)
+            logging.warning(f"Transient DB error (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+            time.sleep(delay)
+
+def _extract_in_worker(pdf_path: str, backend: str = None):
+    """
+    Runs in a pool process: parse one PDF and report how long it took,
+    along with the stage timings recorded while doing it.
+    """
+    metrics.stage_histograms.reset()
+    start_time = time.time()
+    with metrics.profile_if_slow(os.path.basename(pdf_path)):
+        extracted_data = extract_invoice_data(pdf_path, backend)
+    return extracted_data, time.time() - start_time, metrics.stage_histograms.snapshot()
+
+def _stream_with_retries(pdf_path: str, retries: int, backend: str = None):
+    """Returns (success, attempts, transient error or None)"""
+    start_time = time.time()
+    try:
+        success, attempts = _with_retries(
+            lambda: process_invoice_streaming(pdf_path, start_time, raise_transient=True, backend=backend), retries)
+        return success, attempts, None
+    except TransientStoreError as e:
+        return False, retries + 1, str(e)
+
+def _stream_in_worker(pdf_path: str, retries: int = DEFAULT_RETRIES, backend: str = None):
+    """
+    Runs in a pool process: stream one large PDF straight into both databases.
+    Returns (success, elapsed, stage timings, attempts, transient error or None).
+    """
+    metrics.stage_histograms.reset()
+    start_time = time.time()
+    with metrics.profile_if_slow(os.path.basename(pdf_path)):
+        success, attempts, error = _stream_with_retries(pdf_path, retries, backend)
+    return success, time.time() - start_time, metrics.stage_histograms.snapshot(), attempts, error
+
+def process_one_invoice(pdf_path: str, streaming: bool, retries: int, backend: str = None):
+    """One invoice in this process; returns (success, reason, failure kind, attempts)"""
+    start_time = time.time()
+    if streaming or (streaming is None and should_stream(pdf_path)):
+        success, attempts, error = _stream_with_retries(pdf_path, retries, backend)
+        if error:
+            return False, f"DB error after {attempts} attempts: {error}", "transient", attempts
+        return success, None if success else "streaming failed", None if success else "write", attempts
+
+    extracted_data = extract_invoice_data(pdf_path, backend)
+    if not extracted_data:
+        return False, "extraction failed", "extraction", 1
+    try:
+        success, attempts = _with_retries(
+            lambda: store_invoice(extracted_data, time.time() - start_time, raise_transient=True), retries)
+    except TransientStoreError as e:
+        return False, f"DB error after {retries + 1} attempts: {str(e)}", "transient", retries + 1
+    return success, None if success else "DB write failed", None if success else "write", attempts
+
+def _drain_outbox():
+    """Wait for the MongoDB outbox to catch up before reporting the batch"""
+    relay = get_relay()
+    if OUTBOX_ENABLED and relay is not None:
+        print("Waiting for queued MongoDB writes...")
+        if not relay.drain():
+            print("MongoDB outbox not fully replicated; the relay will retry on the next run")
+
+def checkpoint_result(manifest: BatchManifest, folder_path: str, dead_letter_dir: str, pdf_name: str,
+                      content_hash: str, success: bool, reason: str, kind: str, attempts: int,
+                      max_failures: int, processed_dir: str = None) -> str:
+    """
+    Record a file's outcome, moving it to the dead-letter folder if it keeps
+    failing. With processed_dir, stored files are moved there.
+    """
+    pdf_path = os.path.join(folder_path, pdf_name)
+    if success:
+        status = manifest.record(pdf_name, pdf_path, content_hash, DONE, attempts=attempts)["status"]
+        if processed_dir:
+            os.makedirs(processed_dir, exist_ok=True)
+            shutil.move(pdf_path, os.path.join(processed_dir, pdf_name))
+        return status
+
+    # Extraction failures (the parser found no invoice) are deterministic, so
+    # retrying them on a later run cannot help; worker and DB errors can clear
+    failures = manifest.failures(pdf_name, content_hash) + 1
+    if kind == "extraction" or failures >= max_failures:
+        os.makedirs(dead_letter_dir, exist_ok=True)
+        shutil.move(pdf_path, os.path.join(dead_letter_dir, pdf_name))
+        return manifest.record(pdf_name, None, content_hash, DEAD_LETTER, reason, attempts)["status"]
+    return manifest.record(pdf_name, pdf_path, content_hash, FAILED, reason, attempts)["status"]
+
+def _status_label(status: str) -> str:
+    return {DONE: "SUCCESS", FAILED: "FAILED", DEAD_LETTER: "FAILED, dead-lettered"}[status]
+
+def process_invoice_batch(folder_path: str = "invoices", workers: int = None,
+                          db_writers: int = DEFAULT_DB_WRITERS, streaming: bool = None,
+                          resume: bool = True, manifest_path: str = None, dead_letter_dir: str = None,
+                          retries: int = DEFAULT_RETRIES, max_failures: int = DEFAULT_MAX_FAILURES,
+                          backend: str = None):
+    pdf_files = sorted(f for f in os.listdir(folder_path) if f.lower().endswith('.pdf'))
 
-def process_invoice_batch(folder_path: str = "invoices"):
-    pdf_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.pdf')]
-    total_files = len(pdf_files)
-    processed_count = 0
-    
     if not pdf_files:
         print("No PDF files found in the invoices folder")
         return
-    
+
+    manifest = BatchManifest(manifest_path or os.path.join(folder_path, MANIFEST_NAME), resume=resume)
+    dead_letter_dir = dead_letter_dir or os.path.join(folder_path, DEAD_LETTER_DIR)
+    hashes = {name: manifest.content_hash(name, os.path.join(folder_path, name)) for name in pdf_files}
+    pending = [name for name in pdf_files if not manifest.is_done(name, hashes[name])]
+    if len(pending) < len(pdf_files):
+        print(f"Resuming: skipping {len(pdf_files) - len(pending)} invoices already processed")
+    if not pending:
+        print("Nothing left to process")
+        return
+
+    def checkpoint(pdf_name, success, reason, kind, attempts):
+        return checkpoint_result(manifest, folder_path, dead_letter_dir, pdf_name, hashes[pdf_name],
+                           success, reason, kind, attempts, max_failures)
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(pending) > 1:
+        processed_count = process_invoice_batch_parallel(
+            folder_path, pending, workers, db_writers, streaming, checkpoint, retries, backend)
+    else:
+        processed_count = _process_batch_sequential(folder_path, pending, streaming, checkpoint, retries,
+                                                    backend)
+
+    _drain_outbox()
+    counts = manifest.counts()
+    print(f"\nBatch complete. Successfully processed {processed_count}/{len(pending)} invoices")
+    print(f"Manifest: {counts[DONE]} done, {counts[FAILED]} to retry, "
+          f"{counts[DEAD_LETTER]} dead-lettered ({dead_letter_dir})")
+    print(metrics.format_summary())
+
+def _process_batch_sequential(folder_path: str, pdf_files: list, streaming: bool,
+                              checkpoint, retries: int, backend: str = None) -> int:
+    total_files = len(pdf_files)
+    processed_count = 0
     print(f"Starting batch processing of {total_files} invoices at {datetime.now()}")
-    
+
     for idx, pdf_name in enumerate(pdf_files, 1):
         start_time = time.time()
         pdf_path = os.path.join(folder_path, pdf_name)
-        
+
         print(f"\nProcessing {pdf_name} ({idx}/{total_files})")
         print(f"Remaining: {total_files - idx} invoices")
-        
+
         # Process the invoice and measure time
-        success = process_single_invoice(pdf_path, start_time)
+        with metrics.profile_if_slow(pdf_name), metrics.timed("invoice_total"):
+            success, reason, kind, attempts = process_one_invoice(pdf_path, streaming, retries, backend)
         proc_time = time.time() - start_time
-        
-        status = "SUCCESS" if success else "FAILED"
+        status = checkpoint(pdf_name, success, reason, kind, attempts)
+
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        print(f"[{timestamp}] Processed {pdf_name} in {proc_time:.2f}s - {status}")
-        
+        detail = f" ({reason})" if reason else ""
+        print(f"[{timestamp}] Processed {pdf_name} in {proc_time:.2f}s - {_status_label(status)}{detail}")
+
         if success:
             processed_count += 1
-    
-    print(f"\nBatch complete. Successfully processed {processed_count}/{total_files} invoices")
+    return processed_count
+
+def process_invoice_batch_parallel(folder_path: str, pdf_files: list, workers: int,
+                                   db_writers: int = DEFAULT_DB_WRITERS, streaming: bool = None,
+                                   checkpoint=None, retries: int = DEFAULT_RETRIES, backend: str = None) -> int:
+    """
+    Extracts invoices in a process pool and hands the results to a small
+    thread pool of DB writers. Large invoices (or all of them with
+    streaming=True) are streamed to the databases inside the pool process
+    instead. Progress is printed in folder order. Returns the number stored.
+
+    If a worker process dies, every file still queued in that pool fails with
+    it. Those files are retried: the ones that were running (the culprit is
+    among them) each in a process of their own, the rest in a new pool. Only
+    a file that kills its own process is reported as failed.
+    """
+    total_files = len(pdf_files)
+    processed_count = 0
+    results = queue.Queue()
+    pools = []            # every pool created, by generation
+    submitted = {}        # generation -> [(idx, future)] in submission order
+    recovered = set()     # generations whose breakage has been handled
+    isolated = set()      # generations running a single suspect file
+
+    print(f"Starting batch processing of {total_files} invoices at {datetime.now()} "
+          f"({workers} extraction workers, {db_writers} DB writers)")
+
+    def new_pool(size: int) -> int:
+        pools.append(ProcessPoolExecutor(max_workers=size))
+        submitted[len(pools) - 1] = []
+        return len(pools) - 1
+
+    with ThreadPoolExecutor(max_workers=db_writers) as writer_pool:
+
+        def timed_store(extracted_data, extract_time):
+            start_time = time.time()
+            success, attempts = _with_retries(
+                lambda: store_invoice(extracted_data, extract_time, raise_transient=True), retries)
+            return success, extract_time + (time.time() - start_time), attempts
+
+        def on_extracted(idx, generation, future):
+            try:
+                extracted_data, extract_time, stage_timings = future.result()
+                metrics.stage_histograms.merge(stage_timings)
+            except BrokenProcessPool:
+                results.put((idx, False, "worker process died", 0.0, "pool", 1, generation))
+                return
+            except Exception as e:
+                results.put((idx, False, f"extraction error: {str(e)}", 0.0, "worker", 1, generation))
+                return
+            if not extracted_data:
+                results.put((idx, False, "extraction failed", extract_time, "extraction", 1, generation))
+                return
+            write_future = writer_pool.submit(timed_store, extracted_data, extract_time)
+            write_future.add_done_callback(lambda f: on_stored(idx, generation, extract_time, f))
+
+        def on_stored(idx, generation, extract_time, future):
+            error = future.exception()
+            if isinstance(error, TransientStoreError):
+                results.put((idx, False, f"DB error after {retries + 1} attempts: {error}",
+                             extract_time, "transient", retries + 1, generation))
+                return
+            if error is not None:
+                results.put((idx, False, f"DB write error: {error}", extract_time, "write", 1, generation))
+                return
+            success, proc_time, attempts = future.result()
+            results.put((idx, success, None if success else "DB write failed", proc_time,
+                         None if success else "write", attempts, generation))
+
+        def on_streamed(idx, generation, future):
+            try:
+                success, proc_time, stage_timings, attempts, error = future.result()
+            except BrokenProcessPool:
+                results.put((idx, False, "worker process died", 0.0, "pool", 1, generation))
+                return
+            except Exception as e:
+                results.put((idx, False, f"streaming error: {str(e)}", 0.0, "worker", 1, generation))
+                return
+            metrics.stage_histograms.merge(stage_timings)
+            if error:
+                results.put((idx, False, f"DB error after {attempts} attempts: {error}",
+                             proc_time, "transient", attempts, generation))
+                return
+            results.put((idx, success, None if success else "streaming failed", proc_time,
+                         None if success else "write", attempts, generation))
+
+        def submit(generation, idx):
+            pdf_path = os.path.join(folder_path, pdf_files[idx])
+            if streaming or (streaming is None and should_stream(pdf_path)):
+                future = pools[generation].submit(_stream_in_worker, pdf_path, retries, backend)
+                callback = on_streamed
+            else:
+                future = pools[generation].submit(_extract_in_worker, pdf_path, backend)
+                callback = on_extracted
+            submitted[generation].append((idx, future))
+            future.add_done_callback(lambda f: callback(idx, generation, f))
+
+        def recover(generation):
+            # A dead worker fails every unfinished future of the pool at once
+            futures = submitted[generation]
+            wait([future for _, future in futures])
+            pools[generation].shutdown(wait=False)
+            crashed = [idx for idx, future in futures if isinstance(future.exception(), BrokenProcessPool)]
+            # The pool runs work in submission order, so whatever was running
+            # is at the front: at most one task per worker plus one queued
+            suspects, rest = crashed[:workers + 1], crashed[workers + 1:]
+            print(f"Worker process died; retrying {len(crashed)} unfinished invoices "
+                  f"({len(suspects)} of them in separate processes)")
+            for idx in suspects:
+                suspect_pool = new_pool(1)
+                isolated.add(suspect_pool)
+                submit(suspect_pool, idx)
+                pools[suspect_pool].shutdown(wait=False)
+            if rest:
+                retry_pool = new_pool(workers)
+                for idx in rest:
+                    submit(retry_pool, idx)
+
+        try:
+            first_pool = new_pool(workers)
+            for idx in range(total_files):
+                submit(first_pool, idx)
+
+            # Release results in folder order even though they complete out of order
+            finished = {}
+            next_idx = 0
+            while next_idx < total_files:
+                idx, success, reason, proc_time, kind, attempts, generation = results.get()
+                if kind == "pool":
+                    if generation not in isolated:
+                        if generation not in recovered:
+                            recovered.add(generation)
+                            recover(generation)
+                        continue
+                    # Died with nothing else in the pool: this file kills its worker
+                    reason, kind = "worker process died while processing this file", "worker"
+                finished[idx] = (success, reason, proc_time, kind, attempts)
+                while next_idx in finished:
+                    success, reason, proc_time, kind, attempts = finished.pop(next_idx)
+                    pdf_name = pdf_files[next_idx]
+                    next_idx += 1
+                    if checkpoint is not None:
+                        status = checkpoint(pdf_name, success, reason, kind, attempts)
+                    else:
+                        status = DONE if success else FAILED
+
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    detail = f" ({reason})" if reason else ""
+                    print(f"[{timestamp}] Processed {pdf_name} ({next_idx}/{total_files}) "
+                          f"in {proc_time:.2f}s - {_status_label(status)}{detail}")
+                    print(f"Remaining: {total_files - next_idx} invoices")
+
+                    metrics.observe("invoice_total", proc_time)
+                    if success:
+                        processed_count += 1
+        finally:
+            for pool in pools:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    return processed_count
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Process every PDF invoice in a folder")
+    parser.add_argument("folder", nargs="?", default="invoices",
+                        help="folder containing the PDF invoices (default: invoices)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="extraction processes to run in parallel (default: CPU count)")
+    parser.add_argument("--db-writers", type=int, default=DEFAULT_DB_WRITERS,
+                        help="threads writing extracted invoices to MySQL/MongoDB")
+    parser.add_argument("--streaming", action="store_true", default=None,
+                        help="stream every invoice page by page into chunked DB writes "
+                             "(default: only PDFs over STREAMING_MIN_BYTES)")
+    parser.add_argument("--manifest", default=None,
+                        help=f"checkpoint manifest (default: FOLDER/{MANIFEST_NAME})")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="ignore the existing manifest and process every file again")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES,
+                        help=f"retries for transient DB errors per file (default: {DEFAULT_RETRIES})")
+    parser.add_argument("--max-failures", type=int, default=DEFAULT_MAX_FAILURES,
+                        help="failed runs before a file is moved to the dead-letter folder "
+                             f"(default: {DEFAULT_MAX_FAILURES})")
+    parser.add_argument("--dead-letter", default=None,
+                        help=f"folder for files that keep failing (default: FOLDER/{DEAD_LETTER_DIR})")
+    parser.add_argument("--pdf-backend", choices=sorted(BACKENDS), default=PDF_BACKEND,
+                        help=f"PDF text extraction backend (default: {PDF_BACKEND})")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    process_invoice_batch()
\ No newline at end of file
+    args = parse_args()
+    process_invoice_batch(args.folder, workers=args.workers, db_writers=args.db_writers,
+                          streaming=args.streaming, resume=args.resume, manifest_path=args.manifest,
+                          dead_letter_dir=args.dead_letter, retries=args.retries,
+                          max_failures=args.max_failures, backend=args.pdf_backend)
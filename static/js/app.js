@@ -102,6 +102,152 @@ document.addEventListener('DOMContentLoaded', function () {
         cancelBtn.innerHTML = '<i class="fas fa-times"></i> Cancel';
     }
 
+    // Files are sent to /process_batch in chunks bounded by count and size
+    const BATCH_CHUNK_FILES = 20;
+    const BATCH_CHUNK_BYTES = 100 * 1024 * 1024;
+
+    function chunkBatch(files) {
+        const chunks = [];
+        let chunk = [];
+        let chunkBytes = 0;
+        files.forEach((file, index) => {
+            if (chunk.length && (chunk.length >= BATCH_CHUNK_FILES || chunkBytes + file.size > BATCH_CHUNK_BYTES)) {
+                chunks.push(chunk);
+                chunk = [];
+                chunkBytes = 0;
+            }
+            chunk.push({ file, index });
+            chunkBytes += file.size;
+        });
+        if (chunk.length) chunks.push(chunk);
+        return chunks;
+    }
+
+    // Files the server could not yet confirm; checked together via /verify_batch
+    async function verifyPending(filenames) {
+        const verified = new Set();
+        let pending = filenames.slice();
+        for (let attempt = 1; attempt <= 3 && pending.length; attempt++) {
+            try {
+                const verifyResponse = await fetch('/verify_batch', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ filenames: pending, strict_check: true }),
+                    signal: abortController.signal
+                });
+                const verifyResult = await verifyResponse.json();
+                if (verifyResult.success) {
+                    pending.forEach(name => {
+                        const fileResult = verifyResult.results[name];
+                        if (fileResult && fileResult.verified) verified.add(name);
+                    });
+                    pending = pending.filter(name => !verified.has(name));
+                }
+            } catch (error) {
+                if (error.name === 'AbortError') throw error;
+                if (attempt === 3) logErrorToServer(pending.join(', '), error.message, 'verification');
+            }
+            if (attempt < 3 && pending.length) await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+        }
+        return verified;
+    }
+
+    function fileName(result, chunk) {
+        const entry = chunk.find(item => item.index === result.index);
+        return entry ? entry.file.name : result.filename;
+    }
+
+    function handleFileResult(result, chunk, unverified) {
+        if (result.success) {
+            processedCount++;
+        } else if (result.http_status === 202) {
+            // Written but not yet visible when the server checked
+            unverified.push(result);
+            return;
+        } else {
+            failedCount++;
+            logErrorToServer(fileName(result, chunk), result.error || 'Processing failed', result.stage || 'processing');
+        }
+
+        failedFilesElement.textContent = failedCount;
+        updateProgress(processedCount);
+    }
+
+    async function processChunk(chunk) {
+        const formData = new FormData();
+        chunk.forEach(item => formData.append('files', item.file));
+        const seen = new Set();
+        const unverified = [];
+        let streamError = null;
+
+        try {
+            const response = await fetch('/process_batch', {
+                method: 'POST',
+                body: formData,
+                signal: abortController.signal
+            });
+            if (!response.ok || !response.body) {
+                const errorText = await response.text();
+                throw new Error(errorText || 'upload failed');
+            }
+
+            // One JSON object per line; the last line is the batch summary
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = '';
+
+            while (true) {
+                const { value, done } = await reader.read();
+                buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+                let newline;
+                while ((newline = buffered.indexOf('\n')) >= 0) {
+                    const line = buffered.slice(0, newline).trim();
+                    buffered = buffered.slice(newline + 1);
+                    if (!line) continue;
+
+                    const result = JSON.parse(line);
+                    if (result.done) continue;
+
+                    // Indexes from the server are positions within this chunk
+                    result.index = chunk[result.index] ? chunk[result.index].index : result.index;
+                    seen.add(result.index);
+                    handleFileResult(result, chunk, unverified);
+                }
+                if (done) break;
+            }
+        } catch (error) {
+            if (error.name === 'AbortError') throw error;
+            streamError = error;
+        }
+
+        if (unverified.length) {
+            const verified = await verifyPending(unverified.map(result => result.filename));
+            for (const result of unverified) {
+                if (verified.has(result.filename)) {
+                    processedCount++;
+                } else {
+                    failedCount++;
+                    logErrorToServer(fileName(result, chunk), 'Verification failed', 'verification');
+                }
+            }
+        }
+
+        // Anything the stream never reported on counts as failed
+        for (const item of chunk) {
+            if (!seen.has(item.index)) {
+                failedCount++;
+                logErrorToServer(
+                    item.file.name,
+                    streamError ? streamError.message : 'No result returned',
+                    seen.size === 0 ? 'upload' : 'processing'
+                );
+            }
+        }
+        failedFilesElement.textContent = failedCount;
+        updateProgress(processedCount);
+    }
+
     async function processBatch() {
         if (isProcessing) return;
     
@@ -118,97 +264,16 @@ document.addEventListener('DOMContentLoaded', function () {
         cancelBtn.disabled = false;
     
         try {
-            for (let i = 0; i < currentBatch.length; i++) {
+            for (const chunk of chunkBatch(currentBatch)) {
                 if (abortController.signal.aborted) break;
-
-                currentProcessingIndex = i;
-                const file = currentBatch[i];
+                currentProcessingIndex = chunk[0].index;
 
                 try {
-                    const uploadResponse = await Promise.race([
-                        fetch('/upload', {
-                            method: 'POST',
-                            body: (() => {
-                                const formData = new FormData();
-                                formData.append('file', file);
-                                return formData;
-                            })(),
-                            signal: abortController.signal
-                        }),
-                        new Promise((_, reject) =>
-                            setTimeout(() => reject(new Error('upload timeout')), 30000)
-                        ) 
-                    ]);
-
-                    if (!uploadResponse.ok) {
-                        const errorText = await uploadResponse.text();
-                        throw new Error(errorText || 'Upload failed');
-                    }
-
-                    const uploadResult = await uploadResponse.json();
-                    if (!uploadResult.success) throw new Error(uploadResult.message || 'Invalid file');
-
-                    const processResponse = await Promise.race([
-                        fetch('/process_single', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify({
-                                filename: uploadResult.filename,
-                                filepath: uploadResult.filepath,
-                                attempt: currentProcessingIndex + 1
-                            }),
-                            signal: abortController.signal
-                        }),
-                        new Promise((_, reject) =>
-                            setTimeout(() => reject(new Error('processing timeout')), 45000)
-                        )
-                    ]);
-
-                    const processResult = await processResponse.json();
-
-                    if (processResult.success) {
-                        processedCount++;
-                    } else {
-                        let verified = false;
-                        for (let attempt = 1; attempt <= 3; attempt++) {
-                            try {
-                                const verifyResponse = await fetch('/verify_processing', {
-                                    method: 'POST',
-                                    headers: { 'Content-Type': 'application/json' },
-                                    body: JSON.stringify({
-                                        filename: uploadResult.filename,
-                                        strict_check: true,
-                                        attempt: attempt
-                                    }),
-                                    signal: abortController.signal
-                                });
-                                const verifyResult = await verifyResponse.json();
-                                if (verifyResult.exists_in_db) {
-                                    processedCount++;
-                                    verified = true;
-                                    break;
-                                }
-                            } catch (error) {
-                                if (attempt === 3) logErrorToServer(file.name, error.message, 'verification');
-                                if (attempt < 3) await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
-                            }
-                        }
-
-                        if (!verified) {
-                            failedCount++;
-                            logErrorToServer(file.name, processResult.message || 'Processing failed', 'processing');
-                        }
-                    }
-
+                    await processChunk(chunk);
                 } catch (error) {
                     if (error.name === 'AbortError') break;
-
-                    failedCount++;
-                    logErrorToServer(file.name, error.message, error.message.includes('upload') ? 'upload' : 'processing');
+                    throw error;
                 }
-
-                failedFilesElement.textContent = failedCount;
-                updateProgress(processedCount);
             }
 
         } finally {
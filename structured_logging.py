@@ -0,0 +1,173 @@
+# structured_logging.py
+"""
+Non-blocking, structured logging.
+
+setup_logging() puts a QueueHandler on the root logger; a QueueListener
+thread does the file I/O, so request threads only format a record and
+enqueue it. Each line of the log file is a JSON object with the time, level,
+message and source, plus these fields when known:
+
+- file, hash: the invoice being handled (see log_context)
+- stage: the metrics stage the record was logged in, or that raised the
+  logged exception (see metrics.timed)
+- duration: seconds, where the caller passes extra={"duration": ...}
+- traceback: for records logged with exc_info
+- suppressed: similar records dropped by rate limiting since the last one
+
+Warnings and errors are rate limited per call site: the first LOG_BURST
+records in each LOG_WINDOW_SECONDS are written, then one in every
+LOG_SAMPLE_EVERY, so a failure repeated for every file of a batch cannot
+flood the log.
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Tuple
+
+LOG_FILE = os.getenv("LOG_FILE", "processing_errors.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "ERROR").upper()
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_MB", "20")) * 1024 * 1024
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_BURST = int(os.getenv("LOG_BURST", "20"))
+LOG_WINDOW_SECONDS = float(os.getenv("LOG_WINDOW_SECONDS", "60"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
+CONTEXT_FIELDS = ("file", "hash", "stage", "duration")
+
+_context: contextvars.ContextVar = contextvars.ContextVar("log_context", default={})
+
+@contextmanager
+def log_context(**fields):
+    """Attach fields (file, hash, stage) to every record logged in the block"""
+    token = _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+class ContextFilter(logging.Filter):
+    """Copies the log_context fields onto the record, unless passed in extra"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # An exception raised out of a metrics.timed block names the stage that failed
+        failed_stage = getattr(record.exc_info[1], "log_stage", None) if record.exc_info else None
+        if failed_stage and not hasattr(record, "stage"):
+            record.stage = failed_stage
+        for key, value in _context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """
+    Per call site, lets the first `burst` records of each window through and
+    then one in `sample_every`. The next record written carries the number
+    dropped before it as `suppressed`.
+    """
+
+    def __init__(self, burst: int = None, window: float = None, sample_every: int = None,
+                 level: int = logging.WARNING):
+        super().__init__()
+        self.burst = LOG_BURST if burst is None else burst
+        self.window = LOG_WINDOW_SECONDS if window is None else window
+        self.sample_every = max(LOG_SAMPLE_EVERY if sample_every is None else sample_every, 1)
+        self.level = level
+        # (pathname, lineno) -> [window start, records this window, suppressed]
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get((record.pathname, record.lineno))
+            if site is None:
+                site = self._sites[(record.pathname, record.lineno)] = [now, 0, 0]
+            elif now - site[0] >= self.window:
+                site[0] = now
+                site[1] = 0
+            site[1] += 1
+            over = site[1] - self.burst
+            if over > 0 and over % self.sample_every:
+                site[2] += 1
+                return False
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "source": f"{record.filename}:{record.lineno}",
+        }
+        for field in CONTEXT_FIELDS + ("suppressed",):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def start_queue_logging(logger: logging.Logger, *handlers: logging.Handler) -> Tuple[QueueHandler, QueueListener]:
+    """
+    Route logger through a queue to handlers, which run on a listener thread.
+    Records are filtered and formatted as JSON in the calling thread; the
+    handlers only write the preformatted line.
+    """
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RateLimitFilter())
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.setFormatter(JsonFormatter())
+    for handler in handlers:
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(queue_handler)
+    listener = QueueListener(queue_handler.queue, *handlers)
+    listener.start()
+    return queue_handler, listener
+
+_queue_handler = None
+_listener = None
+
+def setup_logging(log_file: str = None, level: str = None) -> QueueHandler:
+    """Queue-backed JSON logging to a rotating file for the root logger; idempotent"""
+    global _queue_handler, _listener
+    if _queue_handler is None:
+        file_handler = RotatingFileHandler(log_file or LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                           backupCount=LOG_BACKUPS, delay=True)
+        root = logging.getLogger()
+        root.setLevel(level or LOG_LEVEL)
+        _queue_handler, _listener = start_queue_logging(root, file_handler)
+        atexit.register(stop_logging)
+    return _queue_handler
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def _restart_listener_after_fork():
+    # The listener thread does not survive a fork (gunicorn preload, process pools)
+    global _listener
+    if _listener is not None:
+        handlers = _listener.handlers
+        _queue_handler.queue = queue.SimpleQueue()
+        _listener = QueueListener(_queue_handler.queue, *handlers)
+        _listener.start()
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
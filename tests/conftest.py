@@ -0,0 +1,46 @@
+# conftest.py
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Tests share the synthetic invoices and database stand-ins with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+@pytest.fixture(scope="session")
+def _app(tmp_path_factory):
+    # Imported once per run. APP_PRELOAD keeps the import from starting the
+    # job queue and outbox relay; app opens its log file in the working directory
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp("app"))
+        patch.setenv("APP_PRELOAD", "true")
+        import app
+    return app
+
+@pytest.fixture
+def app_module(_app, tmp_path, monkeypatch):
+    """
+    The shared app module working in tmp_path, with its own job queue,
+    persist executor and extraction cache, all stopped after the test.
+    Change app.config with monkeypatch.setitem.
+    """
+    from job_queue import JobQueue
+    from extraction_cache import ExtractionCache
+
+    monkeypatch.chdir(tmp_path)
+    for folder in (_app.UPLOAD_FOLDER, _app.PROCESSED_FOLDER):
+        os.makedirs(folder)
+    config = _app.app.config
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite3"), _app.run_invoice_job,
+                         workers=config['JOB_WORKERS'], mode=config['JOB_WORKER_MODE'],
+                         max_attempts=config['JOB_MAX_ATTEMPTS'])
+    persist_executor = ThreadPoolExecutor(max_workers=config['PERSIST_WORKERS'],
+                                          thread_name_prefix='persist')
+    monkeypatch.setattr(_app, "job_queue", job_queue)
+    monkeypatch.setattr(_app, "persist_executor", persist_executor)
+    monkeypatch.setattr(_app, "extraction_cache",
+                        ExtractionCache(config['EXTRACTION_CACHE_DIR'], config['EXTRACTION_CACHE_MAX_BYTES']))
+    yield _app
+    job_queue.stop(timeout=5)
+    persist_executor.shutdown(wait=True)
@@ -0,0 +1,76 @@
+# test_batch_manifest.py
+import os
+
+import process_invoices
+from batch_manifest import BatchManifest, DONE, FAILED, DEAD_LETTER
+
+def _write(folder, name, content):
+    with open(os.path.join(folder, name), "wb") as f:
+        f.write(content)
+
+def test_manifest_survives_partial_line(tmp_path):
+    path = str(tmp_path / "manifest.jsonl")
+    _write(tmp_path, "a.pdf", b"a")
+    manifest = BatchManifest(path)
+    content_hash = manifest.content_hash("a.pdf", str(tmp_path / "a.pdf"))
+    manifest.record("a.pdf", str(tmp_path / "a.pdf"), content_hash, DONE)
+    with open(path, "a") as f:
+        f.write('{"name": "b.pdf", "sta')
+
+    resumed = BatchManifest(path)
+    assert resumed.is_done("a.pdf", content_hash)
+    assert "b.pdf" not in resumed.files
+    assert not BatchManifest(path, resume=False).files
+
+def test_resume_skips_done_and_dead_letters_repeat_failures(tmp_path, monkeypatch):
+    for name in ("good.pdf", "broken.pdf", "flaky.pdf"):
+        _write(tmp_path, name, name.encode())
+    calls = []
+
+    def fake_process(pdf_path, streaming, retries, backend=None):
+        name = os.path.basename(pdf_path)
+        calls.append(name)
+        if name == "good.pdf":
+            return True, None, None, 1
+        if name == "broken.pdf":
+            return False, "extraction failed", "extraction", 1
+        return False, "DB error after 3 attempts", "transient", 3
+
+    monkeypatch.setattr(process_invoices, "process_one_invoice", fake_process)
+    run = lambda: process_invoices.process_invoice_batch(str(tmp_path), workers=1, max_failures=2)
+
+    run()
+    assert sorted(calls) == ["broken.pdf", "flaky.pdf", "good.pdf"]
+    assert sorted(os.listdir(tmp_path / "dead_letter")) == ["broken.pdf"]
+
+    calls.clear()
+    run()
+    # good.pdf is done, broken.pdf is gone; flaky.pdf fails a second run and is dead-lettered
+    assert calls == ["flaky.pdf"]
+    assert sorted(os.listdir(tmp_path / "dead_letter")) == ["broken.pdf", "flaky.pdf"]
+
+    manifest = BatchManifest(str(tmp_path / process_invoices.MANIFEST_NAME))
+    assert manifest.counts() == {DONE: 1, FAILED: 0, DEAD_LETTER: 2}
+
+def test_compaction_waits_for_and_keeps_other_writers(tmp_path):
+    import fcntl
+    import threading
+
+    path = str(tmp_path / "manifest.jsonl")
+    BatchManifest(path).record("a.pdf", None, "hash-a", DONE)
+    opened = []
+
+    with open(f"{path}.lock", "a") as lock_file:
+        # Another process (e.g. the watcher) is appending
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        loader = threading.Thread(target=lambda: opened.append(BatchManifest(path)))
+        loader.start()
+        loader.join(0.2)
+        assert loader.is_alive()
+        with open(path, "a") as manifest:
+            manifest.write('{"name": "b.pdf", "status": "done", "content_hash": "hash-b"}\n')
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    loader.join(5)
+
+    assert sorted(opened[0].files) == ["a.pdf", "b.pdf"]
+    assert sorted(BatchManifest(path).files) == ["a.pdf", "b.pdf"]
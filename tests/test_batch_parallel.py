@@ -0,0 +1,60 @@
+# test_batch_parallel.py
+import os
+import re
+import time
+
+import process_invoices
+from batch_manifest import BatchManifest, DONE, FAILED
+
+def _fake_extract(pdf_path, backend=None):
+    """Stands in for _extract_in_worker in the pool processes (inherited by fork)"""
+    name = os.path.basename(pdf_path)
+    if "poison" in name:
+        os._exit(1)
+    if name.startswith("unreadable"):
+        return None, 0.01, {}
+    # Slow enough that the rest of the batch is still queued when the pool breaks
+    time.sleep(0.4 if "slow" in name else 0.05)
+    return {"metadata": {"pdf_name": name}}, 0.05, {}
+
+def _run_folder(tmp_path, monkeypatch, names, workers=2):
+    for name in names:
+        (tmp_path / name).write_bytes(name.encode())
+    stored = []
+    monkeypatch.setattr(process_invoices, "_extract_in_worker", _fake_extract)
+    monkeypatch.setattr(process_invoices, "should_stream", lambda path: False)
+    monkeypatch.setattr(process_invoices, "store_invoice",
+                        lambda data, proc_time=None, raise_transient=False: stored.append(data) or True)
+    process_invoices.process_invoice_batch(str(tmp_path), workers=workers, max_failures=3)
+    manifest = BatchManifest(str(tmp_path / process_invoices.MANIFEST_NAME))
+    return stored, manifest
+
+def test_dead_worker_only_fails_its_own_file(tmp_path, monkeypatch):
+    names = ["a.pdf", "b_poison.pdf"] + [f"c{i}.pdf" for i in range(8)]
+    stored, manifest = _run_folder(tmp_path, monkeypatch, names)
+
+    healthy = [n for n in names if "poison" not in n]
+    assert sorted(d["metadata"]["pdf_name"] for d in stored) == sorted(healthy)
+    assert manifest.files["b_poison.pdf"]["status"] == FAILED
+    assert all(manifest.files[n]["status"] == DONE for n in healthy)
+    # Retryable on the next run: nothing is dead-lettered on a worker crash
+    assert not os.path.exists(tmp_path / "dead_letter")
+    assert os.path.exists(tmp_path / "b_poison.pdf")
+
+def test_parse_failure_is_dead_lettered_in_parallel(tmp_path, monkeypatch):
+    stored, manifest = _run_folder(tmp_path, monkeypatch, ["a.pdf", "unreadable.pdf", "b.pdf"])
+
+    assert len(stored) == 2
+    assert os.listdir(tmp_path / "dead_letter") == ["unreadable.pdf"]
+
+def test_progress_is_printed_in_folder_order(tmp_path, monkeypatch, capsys):
+    # The first file finishes last, so results arrive out of order
+    names = ["a_slow.pdf"] + [f"b{i}.pdf" for i in range(5)]
+    stored, manifest = _run_folder(tmp_path, monkeypatch, names)
+
+    assert len(stored) == len(names)
+    # Stores happen as extractions finish, the first file last
+    assert stored[-1]["metadata"]["pdf_name"] == "a_slow.pdf"
+    progress = re.findall(r"Processed (\S+) \((\d+)/(\d+)\)", capsys.readouterr().out)
+    assert progress == [(name, str(i), str(len(names))) for i, name in enumerate(names, 1)]
+    assert all(manifest.files[name]["status"] == DONE for name in names)
@@ -0,0 +1,96 @@
+# test_connection_pools.py
+import queue
+import threading
+
+import pytest
+from mysql.connector.errors import PoolError
+
+import etisalat_invoice
+
+class _FakeConnection:
+    """Like PooledMySQLConnection: close() returns it to the pool, even when reset fails"""
+
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = name
+        self.connected = True
+        self.reset_error = None
+
+    def is_connected(self):
+        return self.connected
+
+    def close(self):
+        try:
+            if self.reset_error:
+                raise self.reset_error
+        finally:
+            self.pool.idle.put(self)
+
+class _FakePool:
+    """Hands out connections like MySQLConnectionPool: PoolError when none are idle"""
+
+    def __init__(self, size):
+        self.idle = queue.Queue()
+        for index in range(size):
+            self.idle.put(_FakeConnection(self, f"connection-{index}"))
+
+    def get_connection(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            raise PoolError("Failed getting connection; pool exhausted")
+
+@pytest.fixture
+def pool(monkeypatch):
+    fake = _FakePool(2)
+    monkeypatch.setattr(etisalat_invoice, "_mysql_pool", fake)
+    monkeypatch.setattr(etisalat_invoice, "MYSQL_POOL_SIZE", 2)
+    for key, value in etisalat_invoice._pool_stats.items():
+        monkeypatch.setitem(etisalat_invoice._pool_stats, key, type(value)())
+    return fake
+
+def test_checkout_waits_for_a_returned_connection(pool, monkeypatch):
+    monkeypatch.setattr(etisalat_invoice, "MYSQL_POOL_TIMEOUT", 5)
+    first = etisalat_invoice.get_mysql_connection()
+    etisalat_invoice.get_mysql_connection()
+    assert etisalat_invoice.get_pool_stats()["mysql"]["in_use"] == 2
+
+    threading.Timer(0.2, etisalat_invoice.release_connection, (first,)).start()
+    assert etisalat_invoice.get_mysql_connection() is first
+
+    stats = etisalat_invoice.get_pool_stats()["mysql"]
+    assert stats["checkouts"] == 3 and stats["waits"] == 1
+    assert stats["wait_seconds"] >= 0.1
+    assert stats["idle"] == 0 and stats["in_use"] == 2
+
+def test_dropped_connections_still_go_back_to_the_pool(pool):
+    dropped = etisalat_invoice.get_mysql_connection()
+    failing = etisalat_invoice.get_mysql_connection()
+    dropped.connected = False
+    failing.reset_error = RuntimeError("reset failed")
+
+    etisalat_invoice.release_connection(dropped)
+    etisalat_invoice.release_connection(failing)
+
+    assert pool.idle.qsize() == 2
+    stats = etisalat_invoice.get_pool_stats()["mysql"]
+    assert stats["idle"] == 2 and stats["in_use"] == 0
+
+def test_checkout_gives_up_after_the_timeout(pool, monkeypatch):
+    monkeypatch.setattr(etisalat_invoice, "MYSQL_POOL_TIMEOUT", 0.2)
+    etisalat_invoice.get_mysql_connection()
+    etisalat_invoice.get_mysql_connection()
+    with pytest.raises(PoolError):
+        etisalat_invoice.get_mysql_connection()
+    assert etisalat_invoice.get_pool_stats()["mysql"]["waits"] == 1
+
+def test_mongo_listener_counts_checkouts(pool):
+    listener = etisalat_invoice._mongo_pool_listener()
+    listener.connection_created(None)
+    listener.connection_checked_out(None)
+    listener.connection_checked_out(None)
+    listener.connection_checked_in(None)
+
+    stats = etisalat_invoice.get_pool_stats()["mongodb"]
+    assert stats["checkouts"] == 2 and stats["in_use"] == 1
+    assert stats["connections_created"] == 1
@@ -0,0 +1,128 @@
+# test_db_migrations.py
+from datetime import date
+
+import db_migrations
+from db_migrations import EXPECTED_INDEXES, MIGRATIONS, RETIRED_INDEXES, missing_indexes, partition_ddl
+
+def test_missing_indexes_accepts_wider_index():
+    existing = {
+        "invoices": [(("id",), True), (("pdf_name", "processed_at", "account_number", "total_due"), False)],
+        "usage_details": [(("id", "date"), True)],
+    }
+    assert missing_indexes(existing) == [
+        ("invoices", "uq_invoices_account_period", ("account_number", "bill_period")),
+        ("usage_details", "idx_usage_invoice", ("invoice_id",)),
+    ]
+
+def test_natural_key_needs_unique_index():
+    plain = {"invoices": [(("account_number", "bill_period"), False)]}
+    unique = {"invoices": [(("account_number", "bill_period"), True)]}
+    assert ("invoices", "uq_invoices_account_period", ("account_number", "bill_period")) in missing_indexes(plain)
+    assert [name for _, name, _ in missing_indexes(unique)] == ["idx_invoices_pdf_name"]
+
+def test_index_migrations_reference_expected_indexes():
+    versions = [version for version, _, _ in MIGRATIONS]
+    assert versions == sorted(set(versions))
+    for _, _, statements in MIGRATIONS:
+        for statement in statements:
+            if isinstance(statement, tuple):
+                kind, table, name = statement
+                if (table, name) in RETIRED_INDEXES:
+                    continue
+                assert kind == "index" and name in dict(EXPECTED_INDEXES[table])
+
+def test_partition_ddl_spans_year_boundary():
+    ddl = partition_ddl(date(2024, 11, 1), 3)
+    assert "PARTITION p202411 VALUES LESS THAN ('2024-12-01')" in ddl
+    assert "PARTITION p202412 VALUES LESS THAN ('2025-01-01')" in ddl
+    assert "PARTITION p202501 VALUES LESS THAN ('2025-02-01')" in ddl
+    assert ddl.rstrip().endswith("PARTITION pmax VALUES LESS THAN (MAXVALUE)\n)")
+
+def test_dedupe_keeps_newest_invoice_per_period(monkeypatch):
+    executed = []
+
+    class Cursor:
+        def execute(self, query, params=None):
+            executed.append((" ".join(query.split()[:3]), params))
+
+        def fetchall(self):
+            # (id, pdf_name, newest pdf_name): two re-uploads of march, one under the same name
+            return [
+                (1, "march.pdf", "march_v3.pdf"),
+                (2, "march_v3.pdf", "march_v3.pdf"),
+                (5, "april.pdf", "april_fix.pdf"),
+            ]
+
+        def close(self):
+            pass
+
+    class Connection:
+        def cursor(self):
+            return Cursor()
+
+        def commit(self):
+            executed.append(("COMMIT", None))
+
+        def is_connected(self):
+            return True
+
+        def close(self):
+            pass
+
+    removed_documents = []
+    monkeypatch.setattr(db_migrations, "get_mysql_connection", Connection)
+    monkeypatch.setattr(db_migrations, "get_mongodb_client", lambda: None)
+    monkeypatch.setattr(db_migrations, "remove_mongo_invoice", lambda client, name: removed_documents.append(name))
+
+    assert db_migrations.dedupe_invoices(batch_size=2) == ["march.pdf", "march_v3.pdf", "april.pdf"]
+    deletes = [(statement, params) for statement, params in executed if statement.startswith("DELETE")]
+    assert deletes == [
+        ("DELETE FROM usage_details", [1, 2]), ("DELETE FROM invoices", [1, 2]),
+        ("DELETE FROM usage_details", [5]), ("DELETE FROM invoices", [5]),
+    ]
+    assert executed[-1] == ("COMMIT", None)
+    # The document of the newest upload under the reused name is kept
+    assert removed_documents == ["april.pdf", "march.pdf"]
+
+def test_unique_key_migration_replaces_plain_index(monkeypatch):
+    executed = []
+
+    class Cursor:
+        def execute(self, query, params=None):
+            executed.append(" ".join(query.split()))
+
+        def fetchone(self):
+            return (0,)  # no duplicate groups
+
+        def fetchall(self):
+            last = executed[-1]
+            if last.startswith("SELECT version"):
+                return [(1,), (2,), (3,), (5,)]
+            if last.startswith("SELECT TABLE_NAME, INDEX_NAME"):
+                return [("invoices", "idx_invoices_account_period", 1, "account_number"),
+                        ("invoices", "idx_invoices_account_period", 1, "bill_period")]
+            if last.startswith("SELECT 1 FROM information_schema"):
+                return [(1,)]
+            return []
+
+        def close(self):
+            pass
+
+    class Connection:
+        def cursor(self):
+            return Cursor()
+
+        def commit(self):
+            pass
+
+        def is_connected(self):
+            return True
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(db_migrations, "get_mysql_connection", Connection)
+    assert db_migrations.migrate() == [4, 6]
+    assert "CREATE UNIQUE INDEX uq_invoices_account_period ON invoices (account_number, bill_period)" in executed
+    assert executed.index("DROP INDEX idx_invoices_account_period ON invoices") > \
+        executed.index("CREATE UNIQUE INDEX uq_invoices_account_period ON invoices (account_number, bill_period)")
@@ -0,0 +1,55 @@
+# test_early_termination.py
+import etisalat_invoice
+from etisalat_invoice import CoreFieldScanner, extract_core_fields, read_invoice_pages
+
+HEADER = "Account Number: 123-4567890\nBill period: 01 Jan 2025 - 31 Jan 2025\n"
+USAGE = (
+    "National Calls And Usages\n01 Jan 2025 10:00:00 0501234567 00:01:00 0.00\n"
+    "C O N V E N I E N T W A Y S T O P A Y\n"
+)
+
+class _Page:
+    def __init__(self, text, reads):
+        self.text = text
+        self.reads = reads
+
+    def extract_text(self):
+        self.reads.append(self.text)
+        return self.text
+
+def _pages(texts):
+    reads = []
+    return [_Page(text, reads) for text in texts], reads
+
+def test_stops_after_usage_section_without_current_charges():
+    pages, reads = _pages([HEADER + "Total Amount Due AED 1,234.50\n", USAGE, "Terms and conditions\n" * 50])
+
+    text, fields, pages_read = read_invoice_pages(pages)
+
+    assert pages_read == 2 and len(reads) == 2
+    assert fields == {"account_number": "1234567890", "bill_period": "01 Jan 2025 - 31 Jan 2025",
+                      "current_charges": None, "total_due": 1234.5}
+    assert fields == extract_core_fields(text)
+
+def test_fields_split_over_a_page_break():
+    texts = [
+        "Account Number -\n123 - 4567890\nBill period:\n01 Jan 2025\nto",
+        "31 Jan 2025\nCurrent month charges (including VAT)\nAED",
+        "12.50\nTotal Amount Due\nAED 1,234.",
+        " 56\n" + USAGE,
+    ]
+    pages, _ = _pages(texts)
+    _, fields, pages_read = read_invoice_pages(pages)
+    assert pages_read == 4
+    assert fields == extract_core_fields("\n".join(texts))
+
+def test_scanner_stops_searching_once_fields_are_known(monkeypatch):
+    searched = []
+    monkeypatch.setattr(etisalat_invoice, "extract_core_fields",
+                        lambda text: searched.append(text) or extract_core_fields(text))
+    scanner = CoreFieldScanner()
+    scanner.feed(HEADER + "Current month charges (including VAT) 10.00\nTotal Amount Due 10.00\n")
+    for _ in range(20):
+        scanner.feed(USAGE)
+
+    assert scanner.complete and len(searched) == 1
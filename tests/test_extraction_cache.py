@@ -0,0 +1,70 @@
+# test_extraction_cache.py
+import io
+import os
+import time
+import hashlib
+from datetime import datetime
+from extraction_cache import ExtractionCache, save_stream_with_hash, sha256_file
+
+SAMPLE = {
+    "metadata": {"pdf_name": "bill.pdf", "processing_date": datetime(2025, 4, 10, 9, 30)},
+    "invoice_data": {"account_number": "1234567890", "total_due": 120.5},
+    "usage_data": {}
+}
+
+def test_stream_hash_matches_file_hash(tmp_path):
+    payload = b"%PDF-1.4 fake" * 10000
+    dest = tmp_path / "bill.pdf"
+    content_hash = save_stream_with_hash(io.BytesIO(payload), str(dest))
+    assert content_hash == hashlib.sha256(payload).hexdigest()
+    assert sha256_file(str(dest)) == content_hash
+    assert dest.read_bytes() == payload
+
+def test_round_trip_and_processed_flag(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=1024 * 1024)
+    assert cache.get("ab" * 32) is None
+
+    cache.put("ab" * 32, SAMPLE)
+    entry = cache.get("ab" * 32)
+    assert entry["processed"] is False
+    assert entry["data"]["invoice_data"] == SAMPLE["invoice_data"]
+    assert entry["data"]["metadata"]["processing_date"] == "2025-04-10T09:30:00"
+
+    cache.mark_processed("ab" * 32)
+    assert cache.get("ab" * 32)["processed"] is True
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ExtractionCache(str(tmp_path), max_bytes=10 ** 9)
+    hashes = [f"{i:02d}" * 32 for i in range(3)]
+    for i, content_hash in enumerate(hashes):
+        cache.put(content_hash, SAMPLE)
+        path = cache._path(content_hash)
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    # Touch the oldest entry so the middle one becomes least recently used
+    cache.get(hashes[0])
+    entry_size = os.path.getsize(cache._path(hashes[0]))
+    cache.max_bytes = entry_size * 2
+    cache.evict()
+
+    assert cache.get(hashes[1]) is None
+    assert cache.get(hashes[0]) is not None
+    assert cache.get(hashes[2]) is not None
+
+def test_put_walks_the_directory_only_when_over_the_limit(tmp_path, monkeypatch):
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, "walk", lambda top: walks.append(top) or walk(top))
+    cache = ExtractionCache(str(tmp_path), max_bytes=10 ** 9)
+    for i in range(5):
+        cache.put(f"{i:02d}" * 32, SAMPLE)
+    cache.put("00" * 32, SAMPLE)
+    # Counted once on the first put, then kept up to date
+    assert len(walks) == 1
+    entry_size = os.path.getsize(cache._path("00" * 32))
+    assert cache._total_bytes == 5 * entry_size
+
+    cache.max_bytes = entry_size * 3
+    cache.put("05" * 32, SAMPLE)
+    assert len(walks) == 2
+    assert cache._total_bytes == 3 * entry_size
@@ -0,0 +1,67 @@
+# test_idempotent_writes.py
+from datetime import datetime
+
+import pytest
+
+import etisalat_invoice
+import mongo_outbox
+from standins import FakeMySQLConnection, FakeMongoClient
+from synthetic_invoice import invoice_text
+
+TEXT = invoice_text(60, seed=11)
+
+def _extracted(pdf_name):
+    return {
+        "metadata": {"pdf_name": pdf_name, "processing_date": datetime(2025, 2, 1, 12, 30)},
+        "invoice_data": etisalat_invoice.extract_core_fields(TEXT),
+        "usage_data": etisalat_invoice.extract_call_tables(TEXT),
+    }
+
+@pytest.fixture
+def stores(monkeypatch):
+    mysql = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    for module in (etisalat_invoice, mongo_outbox):
+        monkeypatch.setattr(module, "get_mysql_connection", lambda: mysql)
+        monkeypatch.setattr(module, "get_mongodb_client", lambda: mongo)
+    monkeypatch.setattr(mongo_outbox, "start_relay", lambda: None)
+    return mysql, mongo["invoices_db"]["etisalat_invoices"]
+
+def test_reupload_replaces_rows_and_document(stores):
+    mysql, documents = stores
+    assert etisalat_invoice.store_invoice(_extracted("first.pdf"), outbox=False, mode="replace")
+    usage_count = len(mysql.usage_rows)
+
+    assert etisalat_invoice.store_invoice(_extracted("second.pdf"), outbox=False, mode="replace")
+
+    assert len(mysql.invoices) == 1
+    assert [row[4] for row in mysql.invoices.values()] == ["second.pdf"]
+    assert len(mysql.usage_rows) == usage_count
+    assert list(documents.documents) == ["second.pdf"]
+
+def test_skip_mode_leaves_stored_invoice(stores):
+    mysql, documents = stores
+    assert etisalat_invoice.store_invoice(_extracted("first.pdf"), outbox=False, mode="skip")
+    statements = mysql.statements
+
+    assert etisalat_invoice.store_invoice(_extracted("again.pdf"), outbox=False, mode="skip")
+
+    # Only the natural-key lookup ran
+    assert mysql.statements == statements + 1
+    assert [row[4] for row in mysql.invoices.values()] == ["first.pdf"]
+    assert list(documents.documents) == ["first.pdf"]
+
+def test_outbox_replay_removes_old_document(stores):
+    mysql, documents = stores
+    assert etisalat_invoice.store_invoice(_extracted("first.pdf"), outbox=True, mode="replace")
+    assert etisalat_invoice.store_invoice(_extracted("second.pdf"), outbox=True, mode="replace")
+
+    assert mongo_outbox.relay_batch() == 2
+    assert list(documents.documents) == ["second.pdf"]
+    assert len(mysql.invoices) == 1
+
+def test_duplicate_inserts_are_not_a_write_mode(stores):
+    mysql, _ = stores
+    fields = etisalat_invoice.extract_core_fields(TEXT)
+    with pytest.raises(ValueError, match="expected one of replace, skip"):
+        etisalat_invoice.write_invoice_row(mysql.cursor(), fields, "again.pdf", mode="insert")
@@ -0,0 +1,43 @@
+# test_in_memory_uploads.py
+import io
+import os
+
+import pytest
+
+from synthetic_invoice import write_invoice_pdf
+
+@pytest.fixture
+def stored(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "IN_MEMORY_UPLOADS", True)
+    stored = []
+    monkeypatch.setattr(app_module, "store_invoice",
+                        lambda data, proc_time=None: stored.append(data) or True)
+    return stored
+
+def test_process_upload_parses_from_memory_and_writes_once(app_module, stored, tmp_path):
+    pdf_path = tmp_path / "source.pdf"
+    write_invoice_pdf(str(pdf_path), call_count=40)
+
+    client = app_module.app.test_client()
+    response = client.post("/process_upload", data={
+        "file": (io.BytesIO(pdf_path.read_bytes()), "march.pdf"),
+    }, content_type="multipart/form-data")
+    app_module.persist_executor.shutdown(wait=True)
+
+    assert response.status_code == 200 and response.get_json()["success"]
+    assert stored[0]["metadata"]["pdf_name"] == "march.pdf"
+    assert len(stored[0]["metadata"]["content_hash"]) == 64
+
+    processed = os.listdir(tmp_path / "processed_invoices")
+    assert len(processed) == 1 and processed[0].startswith("march.pdf_")
+    assert (tmp_path / "processed_invoices" / processed[0]).read_bytes() == pdf_path.read_bytes()
+    assert not os.path.exists(tmp_path / "invoices" / "temp")
+
+def test_failed_upload_is_kept_in_temp(app_module, stored, tmp_path):
+
+    body, status = app_module.handle_invoice_in_memory("broken.pdf", b"%PDF-1.4 not really")
+    app_module.persist_executor.shutdown(wait=True)
+
+    assert status == 500 and not stored
+    assert os.listdir(tmp_path / "invoices" / "temp")[0].startswith("broken.pdf_")
+    assert not os.listdir(tmp_path / "processed_invoices")
@@ -0,0 +1,100 @@
+# test_invoice_streaming.py
+import pytest
+
+import etisalat_invoice
+import invoice_streaming
+import mongo_outbox
+import usage_rollups
+from etisalat_invoice import extract_core_fields, extract_call_tables
+from invoice_streaming import InvoiceStream, MONGO_USAGE_COLLECTION
+from standins import FakeMySQLConnection, FakeMongoClient
+from synthetic_invoice import invoice_pages, write_invoice_pdf
+
+def _stream_tables(page_texts):
+    stream = InvoiceStream(page_texts)
+    fields = stream.read_header()
+    tables = {category: {"summary": None, "records": []} for category in stream.summaries}
+    for category, record in stream.records():
+        tables[category]["records"].append(record)
+    for category, summary in stream.summaries.items():
+        tables[category]["summary"] = summary
+    return fields, tables, stream
+
+def test_stream_matches_in_memory_parse():
+    pages = ["\n".join(lines) for lines in invoice_pages(call_count=700, trailing_pages=3, seed=5)]
+    text = "\n".join(pages)
+
+    fields, tables, stream = _stream_tables(pages)
+
+    assert fields == extract_core_fields(text)
+    assert tables == extract_call_tables(text)
+    assert stream.section_closed
+    # Trailing pages after the end marker are never read
+    assert stream.pages_read == len(pages) - 3
+
+def test_record_split_across_pages():
+    pages = [
+        "Account Number: 123-4567890\nBill period 01 Jan 2025 - 31 Jan 2025\n"
+        "Current month charges (including VAT) 10.00\nTotal Amount Due 10.00\n"
+        "National Calls And Usages\n01 Jan 2025 10:00:00 0501234567",
+        "00:01:00 0.00\nC O N V E N I E N T W A Y S T O P A Y",
+    ]
+    _, tables, _ = _stream_tables(pages)
+    assert tables == extract_call_tables("\n".join(pages))
+    assert len(tables["Calls to Mobile"]["records"]) == 1
+
+def test_record_wrapped_over_several_lines_across_pages():
+    header = (
+        "Account Number: 123-4567890\nBill period 01 Jan 2025 - 31 Jan 2025\n"
+        "Current month charges (including VAT) 10.00\nTotal Amount Due 10.00\n"
+        "National Calls And Usages\n01 Jan 2025 09:00:00 0501111111 00:02:00 0.00\n"
+    )
+    pages = [
+        header + "01 Jan 2025\n10:00:00\n0501234567",
+        "00:01:00\n0.00\nC O N V E N I E N T W A Y S T O P A Y",
+    ]
+    _, tables, _ = _stream_tables(pages)
+    assert tables == extract_call_tables("\n".join(pages))
+    assert len(tables["Calls to Mobile"]["records"]) == 2
+
+@pytest.fixture
+def stores(monkeypatch):
+    mysql = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    for module in (etisalat_invoice, invoice_streaming, mongo_outbox):
+        monkeypatch.setattr(module, "get_mysql_connection", lambda: mysql)
+        monkeypatch.setattr(module, "get_mongodb_client", lambda: mongo)
+    monkeypatch.setattr(mongo_outbox, "start_relay", lambda: None)
+    monkeypatch.setattr(usage_rollups, "ROLLUPS_ENABLED", False)
+    return mysql, mongo
+
+def test_invoice_row_is_locked_only_after_parsing(stores, tmp_path, monkeypatch):
+    mysql, mongo = stores
+    events = []
+    buckets = mongo["invoices_db"][MONGO_USAGE_COLLECTION]
+    bulk_write = buckets.bulk_write
+    monkeypatch.setattr(buckets, "bulk_write", lambda requests: events.append("bucket") or bulk_write(requests))
+    monkeypatch.setattr(mysql, "start_transaction", lambda: events.append("transaction"))
+    pdf_path = str(tmp_path / "big.pdf")
+    write_invoice_pdf(pdf_path, call_count=150, seed=3)
+
+    assert invoice_streaming.process_invoice_streaming(pdf_path, chunk_size=40, outbox=False)
+
+    assert events == ["bucket"] * 4 + ["transaction"]
+    assert len(mysql.usage_rows) == 150 and {row[0] for row in mysql.usage_rows} == set(mysql.invoices)
+
+def test_streamed_document_goes_through_the_outbox(stores, tmp_path):
+    mysql, mongo = stores
+    pdf_path = str(tmp_path / "big.pdf")
+    write_invoice_pdf(pdf_path, call_count=150, seed=3)
+    db = mongo["invoices_db"]
+
+    assert invoice_streaming.process_invoice_streaming(pdf_path, chunk_size=40, outbox=True)
+    first_run = {bucket["run_id"] for bucket in db[MONGO_USAGE_COLLECTION].documents.values()}
+    assert invoice_streaming.process_invoice_streaming(pdf_path, chunk_size=40, outbox=True)
+
+    assert db["etisalat_invoices"].documents == {} and len(mysql.outbox) == 2
+    assert mongo_outbox.relay_batch() == 2
+    document = db["etisalat_invoices"].documents["big.pdf"]
+    run_ids = {bucket["run_id"] for bucket in db[MONGO_USAGE_COLLECTION].documents.values()}
+    assert run_ids == {document["usage_storage"]["run_id"]} and run_ids != first_run
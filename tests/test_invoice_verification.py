@@ -0,0 +1,45 @@
+# test_invoice_verification.py
+import invoice_verification
+from etisalat_invoice import insert_invoice_row
+from standins import FakeMySQLConnection, FakeMongoClient
+
+FIELDS = {
+    "account_number": "123-4567890",
+    "bill_period": "01 Jan 2025 - 31 Jan 2025",
+    "current_charges": "10.00",
+    "total_due": "10.00",
+}
+
+def test_batched_verification_reports_each_file(monkeypatch):
+    mysql = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    monkeypatch.setattr(invoice_verification, "get_mysql_connection", lambda: mysql)
+    monkeypatch.setattr(invoice_verification, "get_mongodb_client", lambda: mongo)
+    monkeypatch.setattr(invoice_verification, "VERIFY_QUERY_CHUNK", 2)
+
+    cursor = mysql.cursor()
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        insert_invoice_row(cursor, FIELDS, name)
+    collection = mongo["invoices_db"]["etisalat_invoices"]
+    for name in ("a.pdf", "c.pdf", "d.pdf"):
+        collection.update_one({"_id": name}, {"$set": {"_id": name}}, upsert=True)
+
+    statements = mysql.statements
+    results = invoice_verification.verify_invoices(["a.pdf", "b.pdf", "c.pdf", "d.pdf"])
+
+    # Two IN (...) queries for four names with a chunk size of two
+    assert mysql.statements - statements == 2
+    assert {name: r["verified"] for name, r in results.items()} == {
+        "a.pdf": True, "b.pdf": False, "c.pdf": True, "d.pdf": False
+    }
+    assert results["b.pdf"] == {"mysql": True, "mongodb": False, "verified": False}
+    assert results["d.pdf"] == {"mysql": False, "mongodb": True, "verified": False}
+
+def test_unreachable_store_fails_verification(monkeypatch):
+    def unavailable():
+        raise ConnectionError("down")
+    monkeypatch.setattr(invoice_verification, "get_mysql_connection", unavailable)
+    monkeypatch.setattr(invoice_verification, "get_mongodb_client", FakeMongoClient)
+
+    results = invoice_verification.verify_invoices(["a.pdf"], check_mongodb=False)
+    assert results == {"a.pdf": {"mysql": False, "mongodb": True, "verified": False}}
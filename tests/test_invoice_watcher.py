@@ -0,0 +1,68 @@
+# test_invoice_watcher.py
+import os
+import time
+import threading
+
+import invoice_watcher
+from batch_manifest import DONE, FAILED
+from invoice_watcher import FolderWatcher, _open_inotify
+
+def test_files_wait_until_they_stop_changing(tmp_path):
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path / "processed"), settle_seconds=5, use_inotify=False)
+    path = tmp_path / "incoming.pdf"
+    path.write_bytes(b"%PDF-1.4 partial")
+    (tmp_path / "notes.txt").write_text("ignored")
+    watcher._scan()
+
+    now = time.time()
+    assert watcher.ready_files(now) == []
+    assert watcher.ready_files(now + 6) == ["incoming.pdf"]
+
+    # Still being written: the clock restarts
+    with open(path, "ab") as f:
+        f.write(b" more")
+    os.utime(path, (now + 1, now + 1))
+    assert watcher.ready_files(now + 7) == []
+    assert watcher.ready_files(now + 13) == ["incoming.pdf"]
+
+def test_inotify_reports_closed_files(tmp_path):
+    inotify = _open_inotify(str(tmp_path))
+    if inotify is None:
+        return
+    try:
+        (tmp_path / "dropped.pdf").write_bytes(b"%PDF")
+        assert "dropped.pdf" in inotify.read(1.0)
+    finally:
+        inotify.close()
+
+def _fake_process(path, streaming=None, retries=None, backend=None):
+    """Stands in for process_one_invoice in the pool processes (inherited by fork)"""
+    if "poison" in os.path.basename(path):
+        os._exit(1)
+    time.sleep(0.05)
+    return True, None, None, 1
+
+def test_dead_worker_does_not_stop_the_watcher(tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice_watcher, "process_one_invoice", _fake_process)
+    names = ["a.pdf", "b_poison.pdf", "c.pdf", "d.pdf"]
+    for name in names:
+        (tmp_path / name).write_bytes(name.encode())
+    watcher = FolderWatcher(str(tmp_path), str(tmp_path / "processed"), workers=2,
+                            settle_seconds=0, poll_seconds=0.05, use_inotify=False)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        deadline = time.time() + 20
+        while time.time() < deadline:
+            statuses = {name: watcher.manifest.files.get(name, {}).get("status") for name in names}
+            if all(statuses.values()):
+                break
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        thread.join(20)
+
+    assert not thread.is_alive()
+    assert statuses == {"a.pdf": DONE, "b_poison.pdf": FAILED, "c.pdf": DONE, "d.pdf": DONE}
+    assert len(os.listdir(tmp_path / "processed")) == 3
+    assert os.path.exists(tmp_path / "b_poison.pdf")
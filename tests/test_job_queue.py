@@ -0,0 +1,99 @@
+# test_job_queue.py
+import os
+import sys
+import time
+import sqlite3
+import subprocess
+from contextlib import closing
+
+from job_queue import JobQueue, process_token
+
+def _wait_for(queue, job_id, statuses=("done", "failed"), timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+def _handler(payload):
+    if payload.get("crash"):
+        raise RuntimeError("handler crashed")
+    time.sleep(0.05)
+    return {"success": payload["ok"], "filename": payload["filename"]}
+
+def test_jobs_are_claimed_and_finished(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), _handler, workers=2, poll_interval=0.05)
+    try:
+        done = queue.enqueue({"filename": "a.pdf", "ok": True})
+        failed = queue.enqueue({"filename": "b.pdf", "ok": False})
+        crashed = queue.enqueue({"filename": "c.pdf", "crash": True})
+
+        job = _wait_for(queue, done)
+        assert job["status"] == "done" and job["attempts"] == 1
+        assert job["result"] == {"success": True, "filename": "a.pdf"}
+        assert _wait_for(queue, failed)["status"] == "failed"
+        job = _wait_for(queue, crashed)
+        assert job["status"] == "failed" and job["error"] == "handler crashed"
+        assert queue.counts() == {"queued": 0, "running": 0, "done": 1, "failed": 2}
+    finally:
+        queue.stop(timeout=5)
+
+def _insert_running(db_path, job_id, owner_pid, owner_token, attempts=1):
+    with closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, payload, owner_pid, owner_token, attempts, created_at, started_at) "
+            "VALUES (?, 'running', '{\"filename\": \"a.pdf\", \"ok\": true}', ?, ?, ?, ?, ?)",
+            (job_id, owner_pid, owner_token, attempts, time.time() - 5, time.time() - 4)
+        )
+
+def test_orphaned_jobs_are_requeued_on_start(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(db_path, _handler, workers=1, poll_interval=0.05)
+    # A worker that claimed a job and then died
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    _insert_running(db_path, "orphan", dead.pid, process_token(dead.pid))
+    # Claimed by a process whose pid now belongs to another one (this one)
+    boot_id, pid, start_time = process_token().rsplit(":", 2)
+    _insert_running(db_path, "reused", os.getpid(), f"{boot_id}:{pid}:{int(start_time or 0) + 1}")
+    # Claimed by this process before an upgrade added owner tokens
+    _insert_running(db_path, "legacy", dead.pid, None)
+    try:
+        queue.start()
+        for job_id in ("orphan", "reused", "legacy"):
+            job = _wait_for(queue, job_id)
+            assert job["status"] == "done" and job["attempts"] == 2
+    finally:
+        queue.stop(timeout=5)
+
+def test_jobs_abandoned_too_often_are_failed(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    queue = JobQueue(db_path, _handler, workers=1, poll_interval=0.05, max_attempts=3)
+    _insert_running(db_path, "poison", None, "old-boot:1:1", attempts=3)
+    try:
+        queue.start()
+        job = queue.get("poison")
+        assert job["status"] == "failed" and job["attempts"] == 3
+        assert "after 3 attempts" in job["error"]
+    finally:
+        queue.stop(timeout=5)
+
+def test_job_status_reports_timings(app_module):
+    queue = app_module.job_queue
+    # Workers are up before any upload
+    app_module.start_background_services()
+    assert queue._started_pid == os.getpid()
+    queue.handler = _handler
+
+    job_id = queue.enqueue({"filename": "a.pdf", "ok": True})
+    _wait_for(queue, job_id)
+
+    client = app_module.app.test_client()
+    job = client.get(f"/jobs/{job_id}").get_json()["job"]
+    assert job["status"] == "done"
+    assert job["created_at"] <= job["started_at"] <= job["finished_at"]
+    assert job["queued_seconds"] >= 0
+    assert job["run_seconds"] >= 0.05
+    assert client.get("/jobs/unknown").status_code == 404
@@ -0,0 +1,34 @@
+# test_load_test.py
+import pytest
+
+from load_test import make_uploads, percentile, run_level, start_standin_server, wire_standins
+
+@pytest.fixture
+def standin_server(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "IN_MEMORY_UPLOADS", False)
+    mysql, mongo = wire_standins(app_module, patch=monkeypatch.setattr)
+    server, base_url = start_standin_server(app_module)
+    yield base_url, mysql
+    server.shutdown()
+
+@pytest.mark.parametrize("flow", ["single", "batch"])
+def test_flow_under_concurrency(standin_server, flow):
+    base_url, mysql = standin_server
+    uploads = make_uploads(6, {40: 2, 120: 1}, seed=3)
+
+    result = run_level(base_url, uploads, concurrency=3, flow=flow, batch_size=2)
+
+    assert result["verified"] == 6
+    assert len(mysql.invoices) == 6
+    expected = ["/upload", "/process_single", "/verify_processing"] if flow == "single" \
+        else ["/process_batch", "/verify_batch"]
+    assert sorted(result["endpoints"]) == sorted(expected)
+    for stats in result["endpoints"].values():
+        assert stats["errors"] == 0
+        assert 0 < stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([7.0], 95) == 7.0
@@ -0,0 +1,26 @@
+# test_metrics.py
+from metrics import StageHistograms, stage_histograms, render_prometheus, timed
+
+def test_observe_and_merge():
+    local = StageHistograms(buckets=(0.1, 1.0))
+    local.observe("text_extraction", 0.05)
+    local.observe("text_extraction", 0.5)
+
+    other = StageHistograms(buckets=(0.1, 1.0))
+    other.observe("text_extraction", 3.0)
+    local.merge(other.snapshot())
+
+    data = local.snapshot()["text_extraction"]
+    assert data["buckets"] == [1, 1, 1]
+    assert data["count"] == 3
+    assert data["max"] == 3.0
+
+def test_prometheus_buckets_are_cumulative():
+    stage_histograms.reset()
+    with timed("mysql_insert"):
+        pass
+    text = render_prometheus()
+    assert '# TYPE invoice_stage_duration_seconds histogram' in text
+    assert 'invoice_stage_duration_seconds_bucket{stage="mysql_insert",le="+Inf"} 1' in text
+    assert 'invoice_stage_duration_seconds_count{stage="mysql_insert"} 1' in text
+    stage_histograms.reset()
@@ -1,5 +1,5 @@
 # test_mongo.py
-from etisalat_invoice import get_mongodb_client
+from etisalat_invoice import get_mongodb_client, close_mongodb_client
 
 def test_mongo_connection():
     try:
@@ -11,8 +11,7 @@ def test_mongo_connection():
         print("❌ MongoDB connection failed:", str(e))
         return False
     finally:
-        if 'client' in locals():
-            client.close()
+        close_mongodb_client()
 
 if __name__ == "__main__":
     test_mongo_connection()
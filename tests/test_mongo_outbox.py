@@ -0,0 +1,135 @@
+# test_mongo_outbox.py
+from datetime import datetime
+
+import pytest
+
+import etisalat_invoice
+import mongo_outbox
+from standins import FakeMySQLConnection, FakeMongoClient
+from synthetic_invoice import invoice_text
+
+def _extracted(pdf_name="outbox_test.pdf", account_number="123-4567890"):
+    text = invoice_text(40, seed=7, account_number=account_number)
+    return {
+        "metadata": {"pdf_name": pdf_name, "processing_date": datetime(2025, 2, 1, 12, 30)},
+        "invoice_data": etisalat_invoice.extract_core_fields(text),
+        "usage_data": etisalat_invoice.extract_call_tables(text),
+    }
+
+def test_outbox_defers_mongo_write_until_relay(monkeypatch):
+    mysql = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    monkeypatch.setattr(etisalat_invoice, "get_mysql_connection", lambda: mysql)
+    monkeypatch.setattr(etisalat_invoice, "get_mongodb_client", lambda: mongo)
+    monkeypatch.setattr(mongo_outbox, "get_mysql_connection", lambda: mysql)
+    monkeypatch.setattr(mongo_outbox, "get_mongodb_client", lambda: mongo)
+    monkeypatch.setattr(mongo_outbox, "start_relay", lambda: None)
+
+    extracted = _extracted()
+    assert etisalat_invoice.store_invoice(extracted, 1.5, outbox=True)
+
+    collection = mongo["invoices_db"]["etisalat_invoices"]
+    assert collection.documents == {}
+    assert len(mysql.outbox) == 1
+
+    assert mongo_outbox.relay_batch() == 1
+    assert mongo_outbox.relay_batch() == 0
+    assert collection.documents["outbox_test.pdf"] == etisalat_invoice.build_mongo_document(extracted)
+
+def _wire(monkeypatch, mysql, mongo):
+    for module in (etisalat_invoice, mongo_outbox):
+        monkeypatch.setattr(module, "get_mysql_connection", lambda: mysql)
+        monkeypatch.setattr(module, "get_mongodb_client", lambda: mongo)
+    monkeypatch.setattr(mongo_outbox, "start_relay", lambda: None)
+
+def test_outbox_table_is_created_before_the_first_enqueue(monkeypatch):
+    statements = []
+
+    class RecordingConnection(FakeMySQLConnection):
+        def cursor(self, buffered=False, dictionary=False):
+            cursor = super().cursor(buffered, dictionary)
+            execute = cursor.execute
+
+            def recording_execute(query, params=None):
+                statements.append(query.split()[0].upper())
+                return execute(query, params)
+            cursor.execute = recording_execute
+            return cursor
+
+        def start_transaction(self):
+            statements.append("START TRANSACTION")
+
+    _wire(monkeypatch, RecordingConnection(), FakeMongoClient())
+    monkeypatch.setattr(mongo_outbox, "_table_ready", False)
+
+    assert etisalat_invoice.store_invoice(_extracted(), 1.5, outbox=True)
+    assert statements.count("CREATE") == 1
+    assert statements.index("CREATE") < statements.index("START TRANSACTION")
+
+def test_only_one_relay_runs_at_a_time(monkeypatch):
+    mysql = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    _wire(monkeypatch, mysql, mongo)
+    assert etisalat_invoice.store_invoice(_extracted(), 1.5, outbox=True)
+
+    # Another process holds the relay lock
+    mysql.named_locks.add(mongo_outbox.RELAY_LOCK_NAME)
+    assert mongo_outbox.relay_batch() is None
+    assert mongo["invoices_db"]["etisalat_invoices"].documents == {}
+
+    mysql.named_locks.clear()
+    assert mongo_outbox.relay_batch() == 1
+    assert not mysql.named_locks
+
+def test_failing_row_is_parked_without_blocking_others(monkeypatch):
+    from pymongo.errors import DocumentTooLarge
+
+    mysql = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    _wire(monkeypatch, mysql, mongo)
+    monkeypatch.setattr(mongo_outbox, "OUTBOX_MAX_ATTEMPTS", 3)
+    for index, name in enumerate(("first.pdf", "huge.pdf", "last.pdf")):
+        assert etisalat_invoice.store_invoice(_extracted(name, f"123-456789{index}"), 1.5, outbox=True)
+
+    collection = mongo["invoices_db"]["etisalat_invoices"]
+    bulk_write = collection.bulk_write
+
+    def failing_bulk_write(requests, ordered=True):
+        if any(request._filter["_id"] == "huge.pdf" for request in requests):
+            raise DocumentTooLarge("BSON document too large")
+        return bulk_write(requests, ordered)
+    collection.bulk_write = failing_bulk_write
+
+    assert mongo_outbox.relay_batch() == 2
+    assert sorted(collection.documents) == ["first.pdf", "last.pdf"]
+    huge = next(row for row in mysql.outbox.values() if row["pdf_name"] == "huge.pdf")
+    assert huge["attempts"] == 1 and "too large" in huge["last_error"]
+
+    with pytest.raises(DocumentTooLarge):
+        mongo_outbox.relay_batch()
+    with pytest.raises(DocumentTooLarge):
+        mongo_outbox.relay_batch()
+    # Parked after three attempts: the outbox counts as drained
+    assert mongo_outbox.relay_batch() == 0
+    assert not huge["replicated"]
+
+def test_requeue_parked_retries_only_the_newest_row_per_file(monkeypatch):
+    mysql = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    _wire(monkeypatch, mysql, mongo)
+    monkeypatch.setattr(mongo_outbox, "OUTBOX_MAX_ATTEMPTS", 1)
+    for name, account in (("a.pdf", "123-4567890"), ("a.pdf", "123-4567891"), ("b.pdf", "123-4567892")):
+        assert etisalat_invoice.store_invoice(_extracted(name, account), 1.5, outbox=True)
+    older_a, newer_a, b = mysql.outbox.values()
+    for row in (older_a, b):
+        row["attempts"] = 1
+
+    assert mongo_outbox.requeue_parked("b.pdf") == 1
+    assert b["attempts"] == 0 and older_a["attempts"] == 1
+
+    b["attempts"] = 1
+    assert mongo_outbox.requeue_parked() == 1
+    # a.pdf's parked row was superseded by the newer one and is retired, not replayed
+    assert older_a["replicated"] and not newer_a["replicated"]
+    assert b["attempts"] == 0
+    assert mongo_outbox.requeue_parked() == 0
@@ -0,0 +1,48 @@
+# test_page_parallel.py
+import io
+
+import pytest
+
+import page_parallel
+from etisalat_invoice import extract_invoice_data
+from synthetic_invoice import write_invoice_pdf
+
+@pytest.fixture
+def page_pool(monkeypatch):
+    page_parallel.shutdown_pool()
+    monkeypatch.setattr(page_parallel, "PAGE_WORKERS", 2)
+    monkeypatch.setattr(page_parallel, "PAGES_PER_TASK", 2)
+    yield
+    page_parallel.shutdown_pool()
+
+def _without_date(result):
+    result["metadata"].pop("processing_date")
+    return result
+
+def test_parallel_matches_sequential(tmp_path, page_pool):
+    pdf_path = str(tmp_path / "invoice.pdf")
+    write_invoice_pdf(pdf_path, call_count=600, trailing_pages=3, seed=5)
+
+    sequential = _without_date(extract_invoice_data(pdf_path, parallel=False))
+    parallel = _without_date(extract_invoice_data(pdf_path, parallel=True))
+
+    assert parallel == sequential
+    # Early termination still skips the trailing pages
+    assert parallel["metadata"]["pages_skipped"] > 0
+
+def test_parallel_from_memory(tmp_path, page_pool):
+    pdf_path = str(tmp_path / "invoice.pdf")
+    write_invoice_pdf(pdf_path, call_count=200, trailing_pages=1, seed=6)
+    with open(pdf_path, "rb") as f:
+        buffer = io.BytesIO(f.read())
+
+    parallel = _without_date(extract_invoice_data(buffer, parallel=True, pdf_name="invoice.pdf"))
+    assert parallel == _without_date(extract_invoice_data(pdf_path, parallel=False))
+
+def test_threshold(monkeypatch):
+    monkeypatch.setattr(page_parallel, "PAGE_WORKERS", 4)
+    monkeypatch.setattr(page_parallel, "PARALLEL_PAGE_THRESHOLD", 100)
+    assert page_parallel.should_parallelize(100)
+    assert not page_parallel.should_parallelize(99)
+    monkeypatch.setattr(page_parallel, "PARALLEL_PAGE_THRESHOLD", 0)
+    assert not page_parallel.should_parallelize(1000)
@@ -0,0 +1,38 @@
+# test_pdf_backends.py
+import pytest
+
+from pdf_backends import get_backend
+from compare_backends import compare_backends, first_difference
+from synthetic_invoice import write_invoice_pdf
+
+def test_pypdfium2_matches_pdfplumber(tmp_path):
+    pytest.importorskip("pypdfium2")
+    pdf_path = str(tmp_path / "invoice.pdf")
+    write_invoice_pdf(pdf_path, call_count=300, trailing_pages=2, seed=11)
+
+    report = compare_backends([pdf_path], ["pdfplumber", "pypdfium2"])
+
+    assert report["pypdfium2"]["files"] == 1
+    assert report["pypdfium2"]["mismatches"] == []
+    assert report["pypdfium2"]["pages"] == report["pdfplumber"]["pages"]
+
+def test_page_text_uses_unix_newlines(tmp_path):
+    pytest.importorskip("pypdfium2")
+    pdf_path = str(tmp_path / "invoice.pdf")
+    page_count = write_invoice_pdf(pdf_path, call_count=50, trailing_pages=1)
+
+    with get_backend("pypdfium2").open(pdf_path) as pdf:
+        assert len(pdf.pages) == page_count
+        text = pdf.pages[0].extract_text()
+    assert "\r" not in text
+    assert "Account Number" in text
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        get_backend("ghostscript")
+
+def test_first_difference_reports_path():
+    expected = {"usage_data": {"national": {"records": [{"amount": 1.0}, {"amount": 2.0}]}}}
+    actual = {"usage_data": {"national": {"records": [{"amount": 1.0}, {"amount": 2.5}]}}}
+    assert first_difference(expected, actual) == ".usage_data.national.records[1].amount"
+    assert first_difference(expected, expected) is None
@@ -0,0 +1,49 @@
+# test_process_batch.py
+import io
+import json
+
+import pytest
+
+@pytest.fixture(autouse=True)
+def in_memory_uploads(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "IN_MEMORY_UPLOADS", True)
+    monkeypatch.setitem(app_module.app.config, "VERIFY_WRITES", False)
+
+def _post(app_module, files):
+    return app_module.app.test_client().post("/process_batch", data={
+        "files": [(io.BytesIO(data), name) for name, data in files],
+    }, content_type="multipart/form-data")
+
+def test_batch_streams_a_line_per_file_then_a_summary(app_module, monkeypatch):
+    def handle(filename, data, content_hash, verify):
+        if filename.startswith("bad"):
+            return {'success': False, 'error': 'Data extraction failed'}, 422
+        return {'success': True}, 200
+    monkeypatch.setattr(app_module, "handle_invoice_in_memory", handle)
+    monkeypatch.setitem(app_module.app.config, "MAX_FILE_SIZE", 100)
+
+    response = _post(app_module, [
+        ("a.pdf", b"%PDF a"), ("notes.txt", b"text"), ("bad.pdf", b"%PDF b"),
+        ("huge.pdf", b"%PDF " + b"x" * 200), ("c.pdf", b"%PDF c"),
+    ])
+
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    by_index = {line["index"]: line for line in lines[:-1]}
+    assert sorted(by_index) == [0, 1, 2, 3, 4]
+    assert by_index[1]["stage"] == "upload" and by_index[1]["error"] == "Invalid file"
+    assert by_index[3]["stage"] == "upload" and by_index[3]["error"] == "File too large"
+    assert by_index[2]["http_status"] == 422 and not by_index[2]["success"]
+    assert by_index[0]["success"] and by_index[4]["success"]
+    assert lines[-1] == {"done": True, "total": 5, "processed": 2, "failed": 3}
+
+def test_batch_without_files_is_rejected(app_module):
+    response = app_module.app.test_client().post("/process_batch", data={},
+                                                 content_type="multipart/form-data")
+    assert response.status_code == 400
+    assert response.get_json() == {"success": False}
+
+def test_batch_over_the_request_limit_is_rejected(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "BATCH_MAX_CONTENT_LENGTH", 1024)
+    response = _post(app_module, [("a.pdf", b"%PDF " + b"x" * 4096)])
+    assert response.status_code == 413
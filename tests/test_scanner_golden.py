@@ -0,0 +1,62 @@
+# test_scanner_golden.py
+import pytest
+
+from etisalat_invoice import extract_core_fields, extract_call_tables
+from reference_parsers import reference_extract_core_fields, reference_extract_call_tables
+from synthetic_invoice import invoice_text
+
+HEADER = (
+    "Account Number: 123-4567890\n"
+    "Bill period: 01 Jan 2025 - 31 Jan 2025\n"
+    "Current month charges (including VAT) AED 1,234.50\n"
+    "Total Amount Due AED 1,234.50\n"
+)
+
+EDGE_CASES = {
+    "empty": "",
+    "no_usage_section": HEADER,
+    "no_end_marker": HEADER + "National Calls And Usages\n01 Jan 2025 10:00:00 0501234567 00:01:00 0.00\n",
+    "wrapped_fields": (
+        "Account Number -\n123 - 4567890\nBill period:\n01 Jan 2025\nto\n31 Jan 2025\n"
+        "Current month charges (including VAT)\nAED\n12.50\nTotal Amount Due\nAED 1,234.\n 56\n"
+    ),
+    "repeated_keywords": (
+        "Account Number: pending\nAccount Number: 971-1234567\n"
+        "Total Amount Due see overleaf\n" + HEADER
+    ),
+    "mixed_rows": HEADER + (
+        "National Calls And Usages\n"
+        "calls TO mobile 00:01:00 0.00\n"
+        "Calls to Telephone 00:02:00 0.00\n"
+        "Calls To Telephone 00:03:00 0.00\n"
+        "Calls to Special Number 00:04:00 5.25\n"
+        "01 Jan 2025 10:00:00 Ì0501234567Í 00:01:00 0.00\n"
+        "2 Feb 2025 11:00:00 6001234 00:04:00 5.25 03 Feb 2025 12:00:00 042345678 00:02:00 0.00\n"
+        "04 Feb 2025\n13:00:00 0521234567\n00:00:30 0.00\n"
+        "C O N V E N I E N T W A Y S T O P A Y\n"
+        "05 Feb 2025 14:00:00 0551234567 00:01:00 0.00\n"
+    ),
+    "summary_missing_amount": HEADER + (
+        "National Calls And Usages\n"
+        "Calls to Mobile 00:01:00\n"
+        "01 Jan 2025 10:00:00 0501234567 00:01:00 0.00\n"
+        "C O N V E N I E N T W A Y S T O P A Y\n"
+    ),
+    "marker_before_section": (
+        "C O N V E N I E N T W A Y S T O P A Y\n" + HEADER +
+        "National Calls And Usages\n01 Jan 2025 10:00:00 0561234567 00:01:00 0.00\n"
+        "C O N V E N I E N T W A Y S T O P A Y\n"
+    ),
+}
+
+@pytest.mark.parametrize("name", sorted(EDGE_CASES))
+def test_scanner_matches_reference_on_edge_cases(name):
+    text = EDGE_CASES[name]
+    assert extract_core_fields(text) == reference_extract_core_fields(text)
+    assert extract_call_tables(text) == reference_extract_call_tables(text)
+
+@pytest.mark.parametrize("call_count,seed", [(0, 0), (25, 1), (500, 2), (3000, 3)])
+def test_scanner_matches_reference_on_synthetic_invoices(call_count, seed):
+    text = invoice_text(call_count, trailing_pages=1, seed=seed)
+    assert extract_core_fields(text) == reference_extract_core_fields(text)
+    assert extract_call_tables(text) == reference_extract_call_tables(text)
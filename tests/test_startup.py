@@ -0,0 +1,36 @@
+# test_startup.py
+import os
+import sys
+import json
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Cold `import app` must stay under this; raise it deliberately, not casually
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "1.0"))
+# Loaded on first use only (or warmed by gunicorn.conf.py in a preloading master)
+LAZY_MODULES = ("pdfplumber", "pdfminer", "pypdfium2", "pymongo", "bson", "mysql.connector")
+
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+def _cold_import(tmp_path):
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, MONGO_OUTBOX="false")
+    env.pop("APP_PRELOAD", None)
+    # app creates its folders and log file in the working directory
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_app_import_within_budget(tmp_path):
+    # Best of two, so a cold disk cache on the first run does not fail the build
+    seconds = min(_cold_import(tmp_path)["seconds"] for _ in range(2))
+    assert seconds < STARTUP_BUDGET_SECONDS, f"import app took {seconds:.2f}s (budget {STARTUP_BUDGET_SECONDS}s)"
+
+def test_heavy_libraries_load_lazily(tmp_path):
+    assert _cold_import(tmp_path)["loaded"] == []
@@ -0,0 +1,79 @@
+# test_structured_logging.py
+import io
+import json
+import time
+import logging
+import threading
+
+import pytest
+
+import metrics
+from structured_logging import RateLimitFilter, log_context, start_queue_logging
+
+@pytest.fixture
+def queued_logger(request):
+    logger = logging.getLogger(f"test.{request.node.name}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    stream = io.StringIO()
+    queue_handler, listener = start_queue_logging(logger, logging.StreamHandler(stream))
+
+    def lines():
+        listener.stop()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    yield logger, lines
+    logger.removeHandler(queue_handler)
+
+def test_records_are_json_with_context(queued_logger):
+    logger, lines = queued_logger
+    with log_context(file="invoice.pdf", hash="abc123"):
+        logger.info("Successfully processed: invoice.pdf", extra={"duration": 1.25})
+        try:
+            with metrics.timed("mysql_insert"):
+                raise RuntimeError("connection lost")
+        except RuntimeError:
+            logger.error("Processing failed", exc_info=True)
+    logger.warning("Outside any invoice")
+
+    done, failed, other = lines()
+    assert done["file"] == "invoice.pdf" and done["hash"] == "abc123"
+    assert done["duration"] == 1.25 and done["level"] == "INFO"
+    assert failed["stage"] == "mysql_insert"
+    assert "RuntimeError: connection lost" in failed["traceback"]
+    assert "file" not in other and "traceback" not in other
+
+def test_logging_does_not_wait_for_disk():
+    release = threading.Event()
+
+    class SlowHandler(logging.Handler):
+        def emit(self, record):
+            release.wait(5)
+
+    logger = logging.getLogger("test.slow")
+    logger.propagate = False
+    queue_handler, listener = start_queue_logging(logger, SlowHandler())
+    try:
+        started = time.perf_counter()
+        for _ in range(50):
+            logger.error("disk is slow")
+        assert time.perf_counter() - started < 1.0
+    finally:
+        release.set()
+        listener.stop()
+        logger.removeHandler(queue_handler)
+
+def test_repeated_errors_are_sampled():
+    limiter = RateLimitFilter(burst=3, window=60, sample_every=5)
+    passed = []
+    for index in range(20):
+        record = logging.LogRecord("app", logging.ERROR, "app.py", 267, f"Delayed verification for: {index}", None, None)
+        if limiter.filter(record):
+            passed.append(record)
+
+    # 3 in the burst, then every 5th of the remaining 17
+    assert len(passed) == 6
+    assert [getattr(record, "suppressed", 0) for record in passed] == [0, 0, 0, 4, 4, 4]
+
+    info = logging.LogRecord("app", logging.INFO, "app.py", 267, "ok", None, None)
+    assert all(limiter.filter(info) for _ in range(10))
@@ -0,0 +1,57 @@
+# test_usage_inserts.py
+from datetime import date
+
+import etisalat_invoice
+from etisalat_invoice import USAGE_COLUMNS, _insert_usage_rows, _load_usage_rows
+
+ROWS = [
+    (7, "Calls to Mobile", date(2025, 1, day), "10:00:00", f"05012345{day:02d}", "00:01:00", 0.0)
+    for day in range(1, 8)
+]
+
+class _RecordingCursor:
+    def __init__(self):
+        self.statements = []
+        self.loaded = None
+
+    def execute(self, query, params=None):
+        self.statements.append((query, params))
+        if query.startswith("LOAD DATA LOCAL INFILE"):
+            # The file only exists while the statement runs
+            with open(params[0], encoding="utf-8") as tsv:
+                self.loaded = tsv.read()
+
+def test_rows_are_sent_in_multi_row_chunks():
+    cursor = _RecordingCursor()
+    _insert_usage_rows(cursor, ROWS, chunk_size=3)
+
+    assert len(cursor.statements) == 3
+    for (query, params), chunk in zip(cursor.statements, (ROWS[0:3], ROWS[3:6], ROWS[6:])):
+        assert query == (f"INSERT INTO usage_details {USAGE_COLUMNS} VALUES "
+                         + ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(chunk)))
+        assert params == [value for row in chunk for value in row]
+
+def test_load_data_sends_rows_as_tsv():
+    cursor = _RecordingCursor()
+    _load_usage_rows(cursor, ROWS[:2])
+
+    (query, params), = cursor.statements
+    assert query.endswith(USAGE_COLUMNS) and "FIELDS TERMINATED BY '\\t'" in query
+    assert cursor.loaded == (
+        "7\tCalls to Mobile\t2025-01-01\t10:00:00\t0501234501\t00:01:00\t0.0\n"
+        "7\tCalls to Mobile\t2025-01-02\t10:00:00\t0501234502\t00:01:00\t0.0\n"
+    )
+
+def test_large_invoices_switch_to_load_data(monkeypatch):
+    calls = []
+    monkeypatch.setattr(etisalat_invoice, "USAGE_LOAD_DATA_THRESHOLD", 5)
+    monkeypatch.setattr(etisalat_invoice, "write_invoice_row", lambda *args: (7, None, "inserted"))
+    monkeypatch.setattr(etisalat_invoice, "_usage_rows", lambda invoice_id, usage_data: usage_data)
+    monkeypatch.setattr(etisalat_invoice, "_load_usage_rows", lambda cursor, rows: calls.append(("load", len(rows))))
+    monkeypatch.setattr(etisalat_invoice, "_insert_usage_rows", lambda cursor, rows: calls.append(("insert", len(rows))))
+    monkeypatch.setattr(etisalat_invoice.usage_rollups, "ROLLUPS_ENABLED", False)
+
+    for rows in (ROWS[:4], ROWS[:5]):
+        data = {"metadata": {"pdf_name": "a.pdf"}, "invoice_data": {}, "usage_data": rows}
+        assert etisalat_invoice.save_to_mysql(data, cursor=_RecordingCursor()) == 7
+    assert calls == [("insert", 4), ("load", 5)]
@@ -0,0 +1,90 @@
+# test_usage_rollups.py
+from datetime import date, datetime
+
+import pytest
+
+import etisalat_invoice
+import invoice_streaming
+import usage_rollups
+from usage_rollups import RollupAccumulator, TTLCache, duration_seconds
+from standins import FakeMySQLConnection, FakeMongoClient
+from synthetic_invoice import invoice_text, write_invoice_pdf
+
+TEXT = invoice_text(150, seed=3)
+
+def _extracted(pdf_name, text=TEXT):
+    return {
+        "metadata": {"pdf_name": pdf_name, "processing_date": datetime(2025, 2, 1, 12, 30)},
+        "invoice_data": etisalat_invoice.extract_core_fields(text),
+        "usage_data": etisalat_invoice.extract_call_tables(text),
+    }
+
+@pytest.fixture
+def mysql(monkeypatch):
+    conn = FakeMySQLConnection()
+    mongo = FakeMongoClient()
+    monkeypatch.setattr(usage_rollups, "ROLLUPS_ENABLED", True)
+    for module in (etisalat_invoice, invoice_streaming):
+        monkeypatch.setattr(module, "get_mysql_connection", lambda: conn)
+        monkeypatch.setattr(module, "get_mongodb_client", lambda: mongo)
+    return conn
+
+def test_accumulator_totals_match_records():
+    usage_data = _extracted("a.pdf")["usage_data"]
+    rollups = RollupAccumulator().add_usage_data(usage_data)
+
+    for category, details in usage_data.items():
+        rows = {key: totals for key, totals in rollups.categories.items() if key[0] == category}
+        assert sum(count for count, _, _ in rows.values()) == len(details["records"])
+        assert sum(seconds for _, seconds, _ in rows.values()) == sum(
+            duration_seconds(record["duration"]) for record in details["records"])
+    all_records = [r for details in usage_data.values() for r in details["records"]]
+    assert sum(count for count, _, _ in rollups.numbers.values()) == len(all_records)
+    assert all(month.day == 1 for _, month in rollups.categories)
+
+def test_save_to_mysql_replaces_rollups_on_reingest(mysql):
+    assert etisalat_invoice.save_to_mysql(_extracted("first.pdf"), mode="replace")
+    rollups, number_rollups = list(mysql.rollups), list(mysql.number_rollups)
+    assert rollups and number_rollups
+
+    assert etisalat_invoice.save_to_mysql(_extracted("second.pdf"), mode="replace")
+
+    assert sorted(mysql.rollups) == sorted(rollups)
+    assert sorted(mysql.number_rollups) == sorted(number_rollups)
+    calls = sum(row[4] for row in mysql.rollups)
+    assert calls == len(mysql.usage_rows)
+
+def test_streaming_writes_same_rollups(mysql, tmp_path):
+    pdf_path = str(tmp_path / "big.pdf")
+    write_invoice_pdf(pdf_path, call_count=150, seed=3)
+    assert invoice_streaming.process_invoice_streaming(pdf_path, chunk_size=40)
+    streamed = sorted(mysql.rollups), sorted(mysql.number_rollups)
+
+    in_memory = FakeMySQLConnection()
+    etisalat_invoice.save_to_mysql(_extracted("big.pdf"), cursor=in_memory.cursor())
+    assert streamed == (sorted(in_memory.rollups), sorted(in_memory.number_rollups))
+
+def test_ttl_cache_expires_entries():
+    calls = []
+    cache = TTLCache(ttl=60, max_entries=2)
+    assert cache.get_or_compute(("spend",), lambda: calls.append(1) or "rows") == ("rows", False)
+    assert cache.get_or_compute(("spend",), lambda: calls.append(1) or "rows") == ("rows", True)
+    assert len(calls) == 1
+
+    expired = TTLCache(ttl=0)
+    expired.get_or_compute(("spend",), lambda: calls.append(1))
+    expired.get_or_compute(("spend",), lambda: calls.append(1))
+    assert len(calls) == 3
+
+    for key in ("a", "b", "c"):
+        cache.get_or_compute((key,), lambda: key)
+    assert len(cache._entries) == 2
+
+def test_duration_seconds():
+    assert duration_seconds("01:02:03") == 3723
+    assert date(2025, 1, 17).replace(day=1) in {
+        month for _, month in RollupAccumulator().add_usage_data(
+            {"Calls to Mobile": {"records": [
+                {"date": "17 Jan 2025", "duration": "00:00:10", "to_number": "0501234567", "amount": 0.0}
+            ]}}).categories
+    }
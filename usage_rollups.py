@@ -0,0 +1,215 @@
+# usage_rollups.py
+"""
+Pre-aggregated usage totals, maintained at ingest time.
+
+With USAGE_ROLLUPS=true, every invoice write also replaces that invoice's rows in
+
+- usage_rollups: calls, seconds and spend per account, category and call month
+- usage_number_rollups: the same per account, called number and call month
+
+in the same transaction, so dashboards query these small tables instead of
+scanning usage_details. Rows are keyed by invoice, which makes re-ingesting an
+invoice (write mode "replace") a delete-and-insert of its own rows. Apply
+migration 5 (python db_migrations.py migrate) before enabling; it creates the
+tables and backfills them from existing usage_details.
+"""
+import os
+import time
+import threading
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROLLUPS_ENABLED = os.getenv("USAGE_ROLLUPS", "false").lower() == "true"
+ROLLUP_INSERT_CHUNK_SIZE = 1000
+
+ROLLUPS_DDL = """
+    CREATE TABLE IF NOT EXISTS usage_rollups (
+        invoice_id INT NOT NULL,
+        account_number VARCHAR(32) NOT NULL,
+        category VARCHAR(64) NOT NULL,
+        month DATE NOT NULL,
+        call_count INT NOT NULL,
+        total_seconds BIGINT NOT NULL,
+        total_amount DECIMAL(14, 2) NOT NULL,
+        PRIMARY KEY (invoice_id, category, month),
+        KEY idx_rollups_account_month (account_number, month)
+    )
+    """
+
+NUMBER_ROLLUPS_DDL = """
+    CREATE TABLE IF NOT EXISTS usage_number_rollups (
+        invoice_id INT NOT NULL,
+        account_number VARCHAR(32) NOT NULL,
+        to_number VARCHAR(32) NOT NULL,
+        month DATE NOT NULL,
+        call_count INT NOT NULL,
+        total_seconds BIGINT NOT NULL,
+        total_amount DECIMAL(14, 2) NOT NULL,
+        PRIMARY KEY (invoice_id, to_number, month),
+        KEY idx_number_rollups_account_month (account_number, month),
+        KEY idx_number_rollups_month (month)
+    )
+    """
+
+# One-off fill from the raw table for invoices stored before rollups existed
+_MONTH_OF_CALL = "u.date - INTERVAL (DAYOFMONTH(u.date) - 1) DAY"
+BACKFILL_ROLLUPS_SQL = f"""
+    REPLACE INTO usage_rollups
+        (invoice_id, account_number, category, month, call_count, total_seconds, total_amount)
+    SELECT u.invoice_id, i.account_number, u.category, {_MONTH_OF_CALL},
+           COUNT(*), SUM(TIME_TO_SEC(u.duration)), SUM(u.amount)
+    FROM usage_details u JOIN invoices i ON i.id = u.invoice_id
+    GROUP BY u.invoice_id, i.account_number, u.category, {_MONTH_OF_CALL}
+    """
+BACKFILL_NUMBER_ROLLUPS_SQL = f"""
+    REPLACE INTO usage_number_rollups
+        (invoice_id, account_number, to_number, month, call_count, total_seconds, total_amount)
+    SELECT u.invoice_id, i.account_number, u.to_number, {_MONTH_OF_CALL},
+           COUNT(*), SUM(TIME_TO_SEC(u.duration)), SUM(u.amount)
+    FROM usage_details u JOIN invoices i ON i.id = u.invoice_id
+    GROUP BY u.invoice_id, i.account_number, u.to_number, {_MONTH_OF_CALL}
+    """
+
+def duration_seconds(duration: str) -> int:
+    hours, minutes, seconds = duration.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+class RollupAccumulator:
+    """Running totals for one invoice, fed record by record"""
+
+    def __init__(self):
+        # key -> [call_count, total_seconds, total_amount]
+        self.categories: Dict[Tuple[str, date], list] = {}
+        self.numbers: Dict[Tuple[str, date], list] = {}
+        self._months: Dict[str, date] = {}
+
+    def _month(self, call_date: str) -> date:
+        month = self._months.get(call_date)
+        if month is None:
+            month = datetime.strptime(call_date, '%d %b %Y').date().replace(day=1)
+            self._months[call_date] = month
+        return month
+
+    def add(self, category: str, record: Dict):
+        month = self._month(record['date'])
+        seconds = duration_seconds(record['duration'])
+        for totals, key in ((self.categories, (category, month)), (self.numbers, (record['to_number'], month))):
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = [1, seconds, record['amount']]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] += record['amount']
+
+    def add_usage_data(self, usage_data: Dict) -> "RollupAccumulator":
+        for category, details in usage_data.items():
+            for record in details['records']:
+                self.add(category, record)
+        return self
+
+def _insert_rows(cursor, table: str, columns: str, rows: List[tuple]):
+    placeholders = "(%s, %s, %s, %s, %s, %s, %s)"
+    for start in range(0, len(rows), ROLLUP_INSERT_CHUNK_SIZE):
+        chunk = rows[start:start + ROLLUP_INSERT_CHUNK_SIZE]
+        cursor.execute(
+            f"INSERT INTO {table} {columns} VALUES " + ", ".join([placeholders] * len(chunk)),
+            [value for row in chunk for value in row]
+        )
+
+def write_rollups(cursor, invoice_id: int, account_number: str, rollups: RollupAccumulator):
+    """Replace the invoice's rollup rows; runs inside the caller's transaction"""
+    cursor.execute("DELETE FROM usage_rollups WHERE invoice_id = %s", (invoice_id,))
+    cursor.execute("DELETE FROM usage_number_rollups WHERE invoice_id = %s", (invoice_id,))
+    _insert_rows(
+        cursor, "usage_rollups",
+        "(invoice_id, account_number, category, month, call_count, total_seconds, total_amount)",
+        [(invoice_id, account_number, category, month, count, seconds, round(amount, 2))
+         for (category, month), (count, seconds, amount) in rollups.categories.items()]
+    )
+    _insert_rows(
+        cursor, "usage_number_rollups",
+        "(invoice_id, account_number, to_number, month, call_count, total_seconds, total_amount)",
+        [(invoice_id, account_number, to_number, month, count, seconds, round(amount, 2))
+         for (to_number, month), (count, seconds, amount) in rollups.numbers.items()]
+    )
+
+def _filters(account_number: Optional[str], start_month: Optional[date], end_month: Optional[date]):
+    clauses, params = [], []
+    if account_number:
+        clauses.append("account_number = %s")
+        params.append(account_number)
+    if start_month:
+        clauses.append("month >= %s")
+        params.append(start_month)
+    if end_month:
+        clauses.append("month <= %s")
+        params.append(end_month)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def spend_by_category(cursor, account_number: str = None, start_month: date = None,
+                      end_month: date = None) -> List[Dict]:
+    """Calls, seconds and spend per account, month and category"""
+    where, params = _filters(account_number, start_month, end_month)
+    cursor.execute(
+        "SELECT account_number, month, category, SUM(call_count), SUM(total_seconds), SUM(total_amount) "
+        f"FROM usage_rollups{where} GROUP BY account_number, month, category "
+        "ORDER BY account_number, month, category",
+        params
+    )
+    return [
+        {"account_number": account, "month": f"{month:%Y-%m}", "category": category,
+         "call_count": int(count), "total_seconds": int(seconds), "total_amount": float(amount)}
+        for account, month, category, count, seconds, amount in cursor.fetchall()
+    ]
+
+TOP_NUMBER_ORDER = {"calls": "SUM(call_count)", "seconds": "SUM(total_seconds)", "amount": "SUM(total_amount)"}
+
+def top_numbers(cursor, account_number: str = None, start_month: date = None, end_month: date = None,
+                limit: int = 10, order_by: str = "calls") -> List[Dict]:
+    """Most called numbers over the period, by call count, seconds or spend"""
+    if order_by not in TOP_NUMBER_ORDER:
+        raise ValueError(f"order_by must be one of {', '.join(TOP_NUMBER_ORDER)}")
+    where, params = _filters(account_number, start_month, end_month)
+    cursor.execute(
+        "SELECT to_number, SUM(call_count), SUM(total_seconds), SUM(total_amount) "
+        f"FROM usage_number_rollups{where} GROUP BY to_number "
+        f"ORDER BY {TOP_NUMBER_ORDER[order_by]} DESC, to_number LIMIT %s",
+        params + [limit]
+    )
+    return [
+        {"to_number": to_number, "call_count": int(count), "total_seconds": int(seconds),
+         "total_amount": float(amount)}
+        for to_number, count, seconds, amount in cursor.fetchall()
+    ]
+
+class TTLCache:
+    """Small in-process cache of query results that expire after ttl seconds"""
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[tuple, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: tuple, compute: Callable[[], object]) -> Tuple[object, bool]:
+        """Returns (value, served from cache)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return entry[1], True
+        value = compute()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Drop expired entries, then the oldest if still full
+                for stale in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+                    del self._entries[stale]
+                if len(self._entries) >= self.max_entries:
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k][0])]
+            self._entries[key] = (now + self.ttl, value)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()